@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+
+from dispatcher import TokenBucket
+from metrics import log, counter
+
+# Допуск входящих обновлений перед ящиками чатов. Свободный текст уходит в
+# разбор, а там — в GPT; один болтливый чат мог занять и все слоты GPT, и всех
+# воркеров, и кнопки остальных ждали вместе с ним. Теперь:
+#   - кнопки меню, команды и нажатия inline-кнопок пропускаются всегда;
+#   - свободный текст проходит лимит чата и общий лимит бота (token bucket)
+#     и ограниченную очередь разбора (не больше max_pending фраз);
+#   - разбор занимает не больше workers - reserved_workers воркеров пула,
+#     остальные всегда свободны для кнопок и команд;
+#   - не прошедшее лимиты отбрасывается сразу, чат получает «занят, повтори позже».
+
+ADMISSION = counter("jarvis_admission_total", "Входящие обновления по виду и решению", ("kind", "result"))
+ADMISSION_SHED = counter("jarvis_admission_shed_total", "Отброшенные фразы по причине", ("reason",))
+
+PRIORITY = "priority"
+PARSE = "parse"
+
+
+class AdmissionControl:
+    def __init__(self, classify, chat_rate=0.2, chat_burst=5, global_rate=20.0, global_burst=40,
+                 max_pending=64, reserved_workers=2, notice_interval=10.0, max_chats=10000):
+        # classify(update) -> PRIORITY или PARSE; rate — фраз в секунду, 0 — без лимита
+        self.classify = classify
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate else None
+        self.max_pending = max_pending
+        self.reserved_workers = reserved_workers
+        self.notice_interval = notice_interval  # «занят» одному чату — не чаще
+        self.max_chats = max_chats
+        # on_shed(chat_id, reason) — сообщить чату, что фраза не принята
+        self.on_shed = None
+        self._buckets = {}  # chat_id -> TokenBucket
+        self._noticed = {}  # chat_id -> когда последний раз отвечали «занят»
+        self._prune_at = max_chats
+        self._slots = None
+        self.parse_workers = None
+        self.pending = 0    # фраз принято и ещё не разобрано
+        self.admitted = {PRIORITY: 0, PARSE: 0}
+        self.queued = 0     # приняты, но ждали свободного воркера
+        self.shed = {}      # причина -> сколько
+
+    @classmethod
+    def from_env(cls, classify):
+        # ADMISSION=0 — без лимитов, всё идёт в ящики чатов как раньше
+        if os.getenv("ADMISSION", "1") == "0":
+            return None
+        return cls(
+            classify,
+            chat_rate=float(os.getenv("ADMISSION_CHAT_RATE", "0.2")),
+            chat_burst=int(os.getenv("ADMISSION_CHAT_BURST", "5")),
+            global_rate=float(os.getenv("ADMISSION_GLOBAL_RATE", "20")),
+            global_burst=int(os.getenv("ADMISSION_GLOBAL_BURST", "40")),
+            max_pending=int(os.getenv("ADMISSION_MAX_PENDING", "64")),
+            reserved_workers=int(os.getenv("ADMISSION_RESERVED_WORKERS", "2")),
+        )
+
+    def start(self, workers):
+        # вызывает пул: сколько воркеров может занять разбор
+        self.parse_workers = max(1, workers - self.reserved_workers)
+        self._slots = asyncio.Semaphore(self.parse_workers)
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_at:
+                self._prune(now)
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self, now):
+        # забываем чаты, чьи лимиты уже восстановились полностью
+        for chat_id, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[chat_id]
+                self._noticed.pop(chat_id, None)
+        self._prune_at = max(self.max_chats, 2 * len(self._buckets))
+
+    def _reason(self, chat_id, now):
+        # -> почему фразу не принять, или None
+        if self.pending >= self.max_pending:
+            return "pending"
+        bucket = self._chat_bucket(chat_id, now) if self.chat_rate else None
+        if bucket is not None and not bucket.take(now):
+            return "chat_rate"
+        if self.global_bucket is not None and not self.global_bucket.take(now):
+            if bucket is not None:
+                bucket.tokens += 1  # фразу не взяли — токен чата вернём
+            return "global_rate"
+        return None
+
+    def admit(self, update, chat_id):
+        # -> PRIORITY, PARSE или None (отброшено)
+        kind = self.classify(update)
+        if kind != PARSE:
+            self.admitted[PRIORITY] += 1
+            ADMISSION.labels(PRIORITY, "admitted").inc()
+            return PRIORITY
+        now = time.monotonic()
+        reason = self._reason(chat_id, now)
+        if reason is not None:
+            self.shed[reason] = self.shed.get(reason, 0) + 1
+            ADMISSION.labels(PARSE, "shed").inc()
+            ADMISSION_SHED.labels(reason).inc()
+            self._notify(chat_id, reason, now)
+            return None
+        self.admitted[PARSE] += 1
+        ADMISSION.labels(PARSE, "admitted").inc()
+        if self.parse_workers is not None and self.pending >= self.parse_workers:
+            self.queued += 1
+            ADMISSION.labels(PARSE, "queued").inc()
+        self.pending += 1
+        return PARSE
+
+    def _notify(self, chat_id, reason, now):
+        last = self._noticed.get(chat_id)
+        if last is not None and now - last < self.notice_interval:
+            return
+        self._noticed[chat_id] = now
+        log(f"🚦 Фраза из чата {chat_id} не принята: {reason}", event="admission.shed", level="warning",
+            chat_id=chat_id, reason=reason)
+        if self.on_shed is not None:
+            self.on_shed(chat_id, reason)
+
+    async def acquire(self):
+        # воркер для разбора; кнопки и команды его не ждут
+        await self._slots.acquire()
+
+    def release(self):
+        self._slots.release()
+
+    def finish(self):
+        # принятая фраза ушла из очереди разбора: разобрана, не дошла до ящика
+        # (submit отменили) или осталась в ящике остановленного пула
+        self.pending -= 1
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "parse_workers": self.parse_workers,
+            "admitted_priority": self.admitted[PRIORITY],
+            "admitted_parse": self.admitted[PARSE],
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "shed_total": sum(self.shed.values()),
+        }
@@ -0,0 +1,163 @@
+import bisect
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from recurrence import DEFAULT_TZ, zone, local_timestamp
+from task_model import as_task
+
+# Расписание чата в памяти: задачи уже разобраны (task_model.Task, срок — epoch),
+# одноразовые отсортированы по времени срабатывания. /tasks, «сегодня» и
+# «завтра» берут готовый срез вместо перечитывания и разбора всех задач.
+
+
+def occurrence(task, day, task_tz, chat_tz):
+    # время повторяющейся задачи в этот день (в поясе чата) или None
+    if not task.mask & (1 << day.weekday()):
+        return None
+    ts = local_timestamp(task_tz, datetime(day.year, day.month, day.day, task.hour, task.minute))
+    return datetime.fromtimestamp(ts, chat_tz)
+
+
+def page_key(task):
+    # порядок /tasks: одноразовые по (due_at, id), затем повторяющиеся по id
+    return (1, 0.0, task.id) if task.repeating else (0, task.due_at, task.id)
+
+
+class ChatAgenda:
+    __slots__ = ("tz", "once", "dues", "repeating")
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.once = []       # одноразовые, по (due_at, id)
+        self.dues = []       # их due_at — для bisect
+        self.repeating = []  # повторяющиеся, по id
+
+    def add(self, item):
+        if item.repeating:
+            self.repeating.append(item)
+            return
+        i = bisect.bisect_right(self.dues, item.due_at)
+        self.dues.insert(i, item.due_at)
+        self.once.insert(i, item)
+
+    def remove(self, task_id):
+        for items in (self.once, self.repeating):
+            for i, item in enumerate(items):
+                if item.id == task_id:
+                    del items[i]
+                    if items is self.once:
+                        del self.dues[i]
+                    return True
+        return False
+
+
+class AgendaIndex:
+    def __init__(self, store, tz_name=DEFAULT_TZ, max_chats=10000):
+        self.store = store
+        self.tz = zone(tz_name)
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id -> ChatAgenda, в порядке использования
+        self.hits = 0
+        self.loads = 0
+
+    def _chat(self, chat_id):
+        agenda = self._chats.get(chat_id)
+        if agenda is not None:
+            self._chats.move_to_end(chat_id)
+            self.hits += 1
+            return agenda
+        # первый просмотр чата: один раз читаем и разбираем его задачи
+        chat_tz = self.store.chat_timezone(chat_id)
+        agenda = ChatAgenda(zone(chat_tz) if chat_tz else self.tz)
+        for task in self.store.chat_records(chat_id):
+            agenda.add(task)
+        self._chats[chat_id] = agenda
+        self.loads += 1
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return agenda
+
+    def add(self, task):
+        # незагруженный чат не трогаем: задача попадёт в него при первом просмотре
+        task = as_task(task, self.tz)
+        agenda = self._chats.get(task.chat_id)
+        if agenda is not None:
+            agenda.add(task)
+
+    def remove(self, chat_id, task_id):
+        agenda = self._chats.get(chat_id)
+        if agenda is not None:
+            agenda.remove(task_id)
+
+    def drop_chat(self, chat_id):
+        self._chats.pop(chat_id, None)
+
+    def retain(self, keep):
+        # после перебалансировки шардов забываем чаты, которые ушли другому процессу
+        for chat_id in [c for c in self._chats if not keep(c)]:
+            del self._chats[chat_id]
+
+    def tz_for(self, chat_id):
+        return self._chat(chat_id).tz
+
+    def items(self, chat_id):
+        # порядок /tasks и /delete: одноразовые по времени, затем повторяющиеся
+        agenda = self._chat(chat_id)
+        return agenda.once + agenda.repeating
+
+    def repeating(self, chat_id):
+        return list(self._chat(chat_id).repeating)
+
+    def count(self, chat_id):
+        agenda = self._chat(chat_id)
+        return len(agenda.once) + len(agenda.repeating)
+
+    @staticmethod
+    def _index(agenda, key):
+        # сколько задач в порядке items() идут раньше ключа
+        kind, due, task_id = key
+        if kind == 0:
+            i = bisect.bisect_left(agenda.dues, due)
+            while i < len(agenda.once) and agenda.dues[i] == due and agenda.once[i].id < task_id:
+                i += 1
+            return i
+        return len(agenda.once) + sum(1 for task in agenda.repeating if task.id < task_id)
+
+    def page(self, chat_id, after=None, before=None, size=15):
+        # Keyset-страница в порядке items(): задачи строго после ключа after или
+        # строго до before. Ключ — page_key(задачи), а не номер: если между
+        # просмотрами задачи добавили или удалили, страницы не съезжают.
+        # -> (номер первой задачи с нуля, задачи, всего задач)
+        agenda = self._chat(chat_id)
+        total = len(agenda.once) + len(agenda.repeating)
+        if before is not None:
+            end = self._index(agenda, before)
+            start = max(0, end - size)
+        else:
+            # (kind, due, id + 1): первая задача, чей ключ больше after
+            start = 0 if after is None else self._index(agenda, (after[0], after[1], after[2] + 1))
+            end = min(total, start + size)
+        n = len(agenda.once)
+        tasks = agenda.once[start:end] + agenda.repeating[max(0, start - n):max(0, end - n)]
+        return start, tasks, total
+
+    def day(self, chat_id, day):
+        # [(локальное время, задача)] за календарный день, включая повторяющиеся
+        agenda = self._chat(chat_id)
+        start = local_timestamp(agenda.tz, datetime(day.year, day.month, day.day))
+        nxt = day + timedelta(days=1)
+        end = local_timestamp(agenda.tz, datetime(nxt.year, nxt.month, nxt.day))
+        lo = bisect.bisect_left(agenda.dues, start)
+        hi = bisect.bisect_left(agenda.dues, end)
+        result = [(task.local_time(agenda.tz), task) for task in agenda.once[lo:hi]]
+        recurring = []
+        for task in agenda.repeating:
+            when = occurrence(task, day, task.zone(self.tz), agenda.tz)
+            if when is not None:
+                recurring.append((when, task))
+        if recurring:
+            result = sorted(result + recurring, key=lambda x: x[0])
+        return result
+
+    def stats(self):
+        return {"chats": len(self._chats), "hits": self.hits, "loads": self.loads}
@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+
+from llm_client import percentile
+from metrics import log, counter, histogram
+
+# Архив отработавших одноразовых задач. Сработавшая задача раньше оставалась в
+# хранилище навсегда: её перечитывали при каждом просмотре чата и показывали
+# как «⏱ Уже прошло». Через grace секунд после срока задача переезжает в
+# archive.db — только дописываемую таблицу, из которой читает /history.
+#
+# Переносим понемногу: пачка из batch самых старых задач — запись в архив,
+# затем удаление из хранилища, обе в отдельном потоке, между пачками цикл
+# событий свободен. Упали между записью и удалением — при следующем проходе
+# задача запишется ещё раз (INSERT OR IGNORE по id) и удалится.
+
+ARCHIVE_STEP_SECONDS = histogram("jarvis_archive_step_seconds", "Перенос одной пачки задач в архив",
+                                 buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+ARCHIVED = counter("jarvis_archived_tasks_total", "Задачи, перенесённые в архив")
+
+
+class TaskArchive:
+    def __init__(self, path="archive.db", grace=86400, batch=500, interval=600, pause=0.05):
+        self.path = path
+        self.grace = grace        # сколько задача висит в списке после срока
+        self.batch = batch        # задач за один шаг
+        self.interval = interval  # пауза между проходами, когда переносить нечего
+        self.pause = pause        # пауза между пачками одного прохода
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archive (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                due_at REAL NOT NULL,
+                tz TEXT,
+                archived_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_archive_chat ON archive (chat_id, due_at);
+        """)
+        self._runner = None
+        self.archived = 0
+        self.passes = 0
+        self.steps = 0
+        self.step_seconds = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls):
+        # ARCHIVE_PATH= (пусто) — не архивировать, задачи остаются в хранилище
+        path = os.getenv("ARCHIVE_PATH", "archive.db")
+        if not path:
+            return None
+        return cls(
+            path,
+            grace=float(os.getenv("ARCHIVE_GRACE_HOURS", "24")) * 3600,
+            batch=int(os.getenv("ARCHIVE_BATCH", "500")),
+            interval=float(os.getenv("ARCHIVE_INTERVAL", "600")),
+        )
+
+    def append(self, tasks, now):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany(
+                    "INSERT OR IGNORE INTO archive (id, chat_id, text, due_at, tz, archived_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(t.id, t.chat_id, t.text, t.due_at, t.tz, now) for t in tasks]
+                )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def history(self, chat_id, limit=20):
+        # последние отработавшие задачи чата: [(due_at, text)], новые первыми
+        with self._lock:
+            return self._conn.execute(
+                "SELECT due_at, text FROM archive WHERE chat_id = ? ORDER BY due_at DESC, id DESC LIMIT ?",
+                (chat_id, limit)
+            ).fetchall()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def _step(self, store, now):
+        tasks = store.expired_records(now - self.grace, self.batch)
+        if tasks:
+            self.append(tasks, now)
+            store.delete_many([t.id for t in tasks])
+        return tasks
+
+    async def compact(self, store, on_archived=None, now=None):
+        # один проход: пачками, пока есть что переносить; -> сколько перенесли
+        loop = asyncio.get_running_loop()
+        moved = 0
+        while True:
+            started = time.perf_counter()
+            tasks = await loop.run_in_executor(None, self._step, store, time.time() if now is None else now)
+            elapsed = time.perf_counter() - started
+            self.steps += 1
+            self.step_seconds.append(elapsed)
+            ARCHIVE_STEP_SECONDS.observe(elapsed)
+            if tasks:
+                moved += len(tasks)
+                self.archived += len(tasks)
+                ARCHIVED.inc(len(tasks))
+                if on_archived is not None:
+                    on_archived(tasks)
+            if len(tasks) < self.batch:
+                break
+            await asyncio.sleep(self.pause)
+        self.passes += 1
+        return moved
+
+    async def run(self, store, on_archived):
+        while True:
+            try:
+                moved = await self.compact(store, on_archived)
+                if moved:
+                    log(f"🗄 В архив перенесено задач: {moved}", event="archive.compacted", moved=moved)
+            except Exception as e:
+                log(f"❌ Ошибка переноса задач в архив: {e}", event="archive.error", level="error", error=repr(e))
+            await asyncio.sleep(self.interval)
+
+    def start(self, store, on_archived=None):
+        # on_archived(tasks) — задачи ушли из хранилища (убрать из расписаний в памяти)
+        self._runner = asyncio.create_task(self.run(store, on_archived))
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        with self._lock:
+            self._conn.close()
+
+    def stats(self):
+        return {
+            "archived": self.archived,
+            "passes": self.passes,
+            "steps": self.steps,
+            "step_p95": percentile(self.step_seconds, 95),
+        }
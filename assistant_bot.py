@@ -1,218 +1,504 @@
 import os
+import sys
 import json
+import time
+import asyncio
 import logging
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
+
+# первым — metrics: с его импорта идёт отсчёт фаз запуска (/stats, --profile-startup)
+from metrics import log, tracked, instrument_store, counter, gauge, histogram, MetricsServer, PROFILER, STARTUP
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
-import pytz
-import openai
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters, JobQueue, CallbackQueryHandler
+STARTUP.mark("import telegram")
 
 from dotenv import load_dotenv
 
+# openai (llm_client), aiohttp (metrics, webhook) и sharding грузятся при первом использовании
+from task_store import open_store, SqliteTaskStore
+from task_model import Task, as_task
+from llm_client import LLMClient, LLMQueueFull, load_openai
+from local_parser import parse_local
+from parse_cache import ParseCache
+from parse_batcher import ParseBatcher
+from gpt_extract import StructuredParser
+from reminders import ReminderEngine, ReminderWindow
+from dispatcher import OutboundDispatcher
+from outbox import Outbox
+from archive import TaskArchive
+from admission import AdmissionControl, PRIORITY, PARSE
+from webhook import WebhookServer, OrderedApplication, run_webhook
+from agenda import AgendaIndex, page_key
+from recurrence import DEFAULT_TZ, zone, is_valid_zone
+from ingest import ingest, parse_import, IMPORT_MAX_BYTES
+STARTUP.mark("import modules")
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
-
-def load_tasks():
-    try:
-        with open('tasks.json', 'r') as f:
-            return json.load(f)
-    except:
-        return []
+# polling (по умолчанию), webhook (см. WEBHOOK_*) или shard (см. SHARD_*)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# свой Bot API сервер или фейковый для тестов, без /bot на конце
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+# python assistant_bot.py --profile-startup [--json] — время запуска по фазам, без подключения к Telegram
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+STARTUP.mark("env")
+
+# хранилище задач (SQLite по умолчанию, см. TASK_STORE)
+store = instrument_store(open_store())
+STARTUP.mark("store")
+
+# асинхронный клиент к GPT с ограничением параллельности (см. LLM_*)
+llm = LLMClient.from_env()
+
+# ниже этой уверенности локальный разбор отдаёт фразу в GPT
+LOCAL_PARSER_MIN_CONFIDENCE = float(os.getenv("LOCAL_PARSER_MIN_CONFIDENCE", "0.8"))
+
+# кэш ответов GPT (см. PARSE_CACHE_*)
+parse_cache = ParseCache.from_env()
+
+# все напоминания — в одной куче, её разбирает одна asyncio-задача
+reminders = ReminderEngine(DEFAULT_TZ)
+
+# исходящие напоминания идут через очередь с лимитами Telegram (см. SEND_*)
+outbound = OutboundDispatcher.from_env()
+
+# журнал сработавших напоминаний: недоставленное переживает перезапуск,
+# пропущенное за время простоя догоняется (см. OUTBOX_*, REMINDER_CATCHUP_*)
+outbox = Outbox.from_env()
+if outbox:
+    reminders.outbox = outbox
+    outbound.on_delivered = outbox.ack
+
+# отработавшие одноразовые задачи через ARCHIVE_GRACE_HOURS уезжают в архив (/history)
+archive = TaskArchive.from_env()
+
+# при запуске в кучу грузятся только задачи на ближайшие REHYDRATE_HORIZON_HOURS
+# (STARTUP_MODE=eager — загрузить всё сразу, как раньше)
+reminder_window = ReminderWindow(
+    store, reminders,
+    horizon=float(os.getenv("REHYDRATE_HORIZON_HOURS", "24")) * 3600,
+    lazy=os.getenv("STARTUP_MODE", "lazy") != "eager"
+)
+
+# разобранные задачи чатов для /tasks, «сегодня» и «завтра» (см. AGENDA_MAX_CHATS)
+agenda = AgendaIndex(store, DEFAULT_TZ, max_chats=int(os.getenv("AGENDA_MAX_CHATS", "10000")))
+# /tasks показывает список страницами по TASKS_PAGE_SIZE с кнопками ◀️ / ▶️
+TASKS_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "15"))
+# длинный текст в списке обрезаем, чтобы страница влезла в сообщение (4096 символов)
+TASK_TEXT_MAX = max(20, 3600 // TASKS_PAGE_SIZE - 70)
+
+# тексты кнопок меню: они, команды и inline-кнопки идут мимо лимитов на свободный текст
+MENU_BUTTONS = frozenset({
+    "🗓 Мои задачи", "📋 Мои задачи", "📅 Сегодня", "📆 Завтра", "🧹 Очистить все", "🧹 Очистить всё",
+    "🔁 Повторяющиеся", "🗑 Удалить задачу", "❌ Удалить задачу",
+})
+BUSY_TEXT = {
+    "chat_rate": "⏳ Слишком много сообщений подряд. Подожди немного и повтори.",
+    "global_rate": "⏳ Сейчас много запросов, повтори чуть позже. Кнопки меню работают.",
+    "pending": "⏳ Сейчас много запросов, повтори чуть позже. Кнопки меню работают.",
+}
+
+
+def update_kind(update):
+    message = update.message
+    if message is None or message.text is None or message.text.startswith("/") or message.text in MENU_BUTTONS:
+        return PRIORITY
+    return PARSE
+
+
+# лимиты на свободный текст перед ящиками чатов, «занят» — мимо очереди напоминаний (см. ADMISSION_*)
+admission = AdmissionControl.from_env(update_kind)
+if admission:
+    admission.on_shed = lambda chat_id, reason: outbound.notify(chat_id, BUSY_TEXT[reason])
+
+# BOT_MODE=shard: процесс отвечает только за свою часть чатов, обновления
+# ему пересылает роутер (python sharding.py router)
+shard = None
+update_pool = None  # ящики чатов: в polling — свой, в webhook — у сервера
+
+# метрики (см. METRICS_PORT): источники разбора, ответы GPT и размеры очередей
+PARSE_SOURCES = counter("jarvis_parse_total", "Чем разобрана фраза", ("source",))
+GPT_PARSE_SECONDS = histogram("jarvis_gpt_parse_seconds", "Разбор фразы через GPT целиком")
+GPT_PARSE_RESULTS = counter("jarvis_gpt_parse_results_total", "Результаты разбора через GPT", ("result",))
+gauge("jarvis_reminders_pending", "Напоминаний в куче").set_function(lambda: len(reminders))
+gauge("jarvis_send_queue", "Сообщений в очереди отправки").set_function(lambda: outbound.queued())
+gauge("jarvis_outbox_unacked", "Напоминаний из журнала ждут подтверждения доставки").set_function(
+    lambda: outbox.unacked if outbox else 0)
+gauge("jarvis_llm_queue", "Запросов к GPT ждут слота").set_function(lambda: llm.queued)
+gauge("jarvis_llm_in_flight", "Запросов к GPT выполняется").set_function(lambda: llm.in_flight)
+gauge("jarvis_store_tasks", "Задач в хранилище").set_function(lambda: store.count())
+gauge("jarvis_archive_tasks", "Задач в архиве").set_function(lambda: archive.count() if archive else 0)
+gauge("jarvis_agenda_chats", "Расписаний чатов в памяти").set_function(lambda: agenda.stats()["chats"])
+gauge("jarvis_update_pending", "Обновлений в ящиках чатов").set_function(
+    lambda: update_pool.pending() if update_pool else 0)
+gauge("jarvis_update_chats", "Чатов с непустым ящиком").set_function(
+    lambda: update_pool.stats()["chats"] if update_pool else 0)
+gauge("jarvis_admission_pending", "Принятых фраз ждут разбора").set_function(
+    lambda: admission.pending if admission else 0)
+metrics_server = MetricsServer.from_env()
+if BOT_MODE == "shard":
+    if not isinstance(store, SqliteTaskStore):
+        # состав воркеров и отметки доставки живут в общем tasks.db
+        raise ValueError("BOT_MODE=shard работает только с общим SQLite: задайте TASK_STORE=sqlite:<путь>")
+    from sharding import ShardMembership, ReminderClaims, ShardWorker
+    shard_id = os.getenv("SHARD_ID", f"worker-{os.getpid()}")
+    membership = ShardMembership(store.path, ttl=float(os.getenv("SHARD_TTL", "15")))
+    claims = ReminderClaims(store.path, shard_id, ttl=membership.ttl)
+    shard = ShardWorker(
+        shard_id,
+        os.getenv("SHARD_URL") or f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8443')}{os.getenv('WEBHOOK_PATH', '/telegram')}",
+        membership, claims, reminder_window,
+        interval=float(os.getenv("SHARD_INTERVAL", "5"))
+    )
+    if outbox:
+        outbox.claims = claims  # отметки доставки пишет flush журнала вместе с подтверждениями
+    else:
+        reminders.claims = claims
+    reminder_window.owns = shard.owns
+    shard.on_rebalance = lambda: agenda.retain(shard.owns)
+
+def add_task(task):
+    task = store.add(task)
+    agenda.add(task)
+    return task
+
+def remove_task(task):
+    store.delete(task.id)
+    reminders.cancel(task.id)
+    agenda.remove(task.chat_id, task.id)
+
+def forget_archived(tasks):
+    # задачи ушли в архив — убираем их из расписаний чатов в памяти
+    for task in tasks:
+        agenda.remove(task.chat_id, task.id)
+
+def clear_chat_tasks(chat_id):
+    store.delete_chat(chat_id)
+    reminders.cancel_chat(chat_id)
+    agenda.drop_chat(chat_id)
+
+def format_timedelta(delta):
+    days = delta.days
+    seconds = delta.seconds
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+
+    parts = []
+    if days > 0:
+        parts.append(f"{days} дн")
+    if hours > 0:
+        parts.append(f"{hours} ч")
+    if minutes > 0:
+        parts.append(f"{minutes} мин")
+
+    return "через " + " ".join(parts) if parts else "скоро"
+
+# клавиатура одна на все ответы: объекты telegram неизменяемые, собираем один раз
+MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton("🗓 Мои задачи"), KeyboardButton("📅 Сегодня")],
+        [KeyboardButton("📆 Завтра"), KeyboardButton("🧹 Очистить все")],
+        [KeyboardButton("🔁 Повторяющиеся"), KeyboardButton("🗑 Удалить задачу")]
+    ],
+    resize_keyboard=True
+)
 
-def save_tasks(tasks):
-    with open('tasks.json', 'w') as f:
-        json.dump(tasks, f)
 
 def get_main_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton("🗓 Мои задачи"), KeyboardButton("📅 Сегодня")],
-            [KeyboardButton("📆 Завтра"), KeyboardButton("🧹 Очистить все")],
-            [KeyboardButton("🔁 Повторяющиеся"), KeyboardButton("🗑 Удалить задачу")]
-        ],
-        resize_keyboard=True
-    )
+    return MAIN_MENU
 
 
 
 def schedule_task(task, application):
-    tz = pytz.timezone("Europe/Tallinn")
-    run_time = tz.localize(datetime.fromisoformat(task["time"]))
-
-    def make_job(delay_seconds, prefix):
-        if delay_seconds > 0:
-            application.job_queue.run_once(
-                lambda context: context.bot.send_message(
-                    chat_id=task["chat_id"],
-                    text=f"{prefix} {task['text']}"
-                ),
-                when=delay_seconds
-            )
-
-    now = datetime.now(tz)
-    delay_main = (run_time - now).total_seconds()
-    delay_30 = delay_main - 1800  # 30 минут до
-    delay_15 = delay_main - 900   # 15 минут до
-
-    print(f"⏰ Планируем задачу: {task['text']} на {run_time}")
-    make_job(delay_30, "⚠️ Через 30 мин:")
-    make_job(delay_15, "⏱ Почти время:")
-    make_job(delay_main, "🔔 Сейчас:")
+    if shard and not shard.owns(task["chat_id"]):
+        return  # запланирует воркер-владелец чата
+    record = Task.from_dict(task, reminders.tz)
+    if not reminder_window.covers(record):
+        return  # подгрузится фоном, когда попадёт в окно
+    log(f"⏰ Планируем задачу: {task['text']} на {task['time']}", event="task.schedule",
+        chat_id=task["chat_id"], task_id=task["id"], time=task["time"])
+    reminders.schedule_once(record)
 
 
 def schedule_repeating_task(task, application):
-    from datetime import datetime, timedelta, time
-
-    hour, minute = map(int, task["time"].split(":"))
-    message = task["text"]
-    days = task["repeat"]  # ["Monday", "Tuesday", ...]
-
-    day_indexes = {
-        "Monday": 0, "Tuesday": 1, "Wednesday": 2,
-        "Thursday": 3, "Friday": 4, "Saturday": 5, "Sunday": 6
-    }
-
-    target_time = time(hour, minute)
-
-    # Время "за 30 минут"
-    time_30_before = (datetime.combine(datetime.today(), target_time) - timedelta(minutes=30)).time()
-    # Время "за 15 минут"
-    time_15_before = (datetime.combine(datetime.today(), target_time) - timedelta(minutes=15)).time()
-
-    day_list = [day_indexes[d] for d in days]
-
-    # Напоминание за 30 мин
-    application.job_queue.run_daily(
-        lambda context: context.bot.send_message(
-            chat_id=task["chat_id"],
-            text=f"⚠️ Через 30 мин: {message}"
-        ),
-        time=time_30_before,
-        days=day_list
-    )
-
-    # Напоминание за 15 мин
-    application.job_queue.run_daily(
-        lambda context: context.bot.send_message(
-            chat_id=task["chat_id"],
-            text=f"⏱ Почти время: {message}"
-        ),
-        time=time_15_before,
-        days=day_list
-    )
-
-    # Напоминание в точное время
-    application.job_queue.run_daily(
-        lambda context: context.bot.send_message(
-            chat_id=task["chat_id"],
-            text=f"🔔 Сейчас: {message}"
-        ),
-        time=target_time,
-        days=day_list
-    )
-
-async def parse_with_gpt(text):
-    tz = pytz.timezone("Europe/Tallinn")
-    now = datetime.now(tz)
-    today = now.strftime("%Y-%m-%d")
-    current_time = now.strftime("%H:%M")
-
-    prompt = f"""
-Сегодня: {today}
-Текущее время: {current_time}
-
-Ты — помощник, который извлекает задачу и дату из человеческой фразы. Пользователь пишет тебе напоминание, а ты возвращаешь его в формате JSON.
+    task = as_task(task, reminders.tz)
+    if shard and not shard.owns(task.chat_id):
+        return
+    reminders.schedule_repeating(task)
+
+
+def add_tasks_bulk(entries, chat_id, tz, skip_past=False):
+    # проверка, дедупликация, одна транзакция и одно обновление планировщика
+    result = ingest(store, entries, chat_id, tz.zone, skip_past)
+    records = [Task.from_dict(t, reminders.tz) for t in result.added]
+    if len(records) > 50:
+        agenda.drop_chat(chat_id)  # большой импорт: чат перечитается при просмотре
+    else:
+        for task in records:
+            agenda.add(task)
+    if not shard or shard.owns(chat_id):
+        reminders.schedule_many([t for t in records if t.repeating or reminder_window.covers(t)])
+    return result
+
+
+def describe_ingest(result):
+    text = f"✅ Запомнил {len(result.added)} задач(и)"
+    if result.duplicates:
+        text += f", повторов пропущено: {result.duplicates}"
+    if result.past:
+        text += f", уже прошедших: {result.past}"
+    if result.invalid:
+        text += f"\n⚠️ Не разобрал: {result.invalid}\n" + "\n".join(f"— {e}" for e in result.errors)
+    return text
+
+GPT_RULES = """Ты — помощник, который извлекает задачу и дату из человеческой фразы. Пользователь пишет тебе напоминание, а ты возвращаешь его в формате JSON.
 
 Если задача одноразовая — верни:
-{{
+{
   "text": "что сделать",
   "time": "2025-05-15T18:00:00"
-}}
+}
 
 Если задача повторяющаяся — верни:
-{{
+{
   "text": "что делать",
   "time": "08:00",  // только часы и минуты!
   "repeat": ["Monday", "Tuesday", "Wednesday"]
-}}
+}
 
 ❗ ВАЖНО:
 — если пользователь пишет "каждый", "по понедельникам", "по будням", "по выходным", "каждое утро", "ежедневно", "в 8 утра по будням" — это повторяющаяся задача  
 — используй repeat только при регулярных задачах  
 — не пиши пояснений, верни только чистый JSON
+"""
+
+
+def gpt_prompt(text, now):
+    return f"""
+Сегодня: {now.strftime("%Y-%m-%d")}
+Текущее время: {now.strftime("%H:%M")}
 
+{GPT_RULES}
 Фраза: {text}
 Ответ:
 """
 
+
+def gpt_batch_prompt(items):
+    # правила — один раз на всю пачку, у каждой фразы свои «сегодня» и время (пояса чатов разные)
+    phrases = "\n".join(
+        f"{i}. Сегодня: {now.strftime('%Y-%m-%d')}, время: {now.strftime('%H:%M')}. Фраза: {text}"
+        for i, (text, now) in enumerate(items, 1)
+    )
+    return f"""
+{GPT_RULES}
+Ниже {len(items)} фраз от разных пользователей, у каждой свои дата и время. Разбери каждую по правилам выше.
+Верни только JSON-массив из {len(items)} объектов в том же порядке, в каждый добавь поле "id" с номером фразы.
+
+{phrases}
+Ответ:
+"""
+
+
+async def ask_gpt(prompt):
+    # ответ GPT, разобранный как JSON, или None
     try:
-        response = openai.ChatCompletion.create(
+        response = await llm.complete(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
         )
         content = response.choices[0].message["content"].strip()
-        print("📥 GPT вернул:\n", content)
+        log(f"📥 GPT вернул:\n {content}", event="gpt.reply", content=content)
 
         if content.startswith("```"):
             content = content.split("```")[-1].strip()
 
-        return json.loads(content)
+        result = json.loads(content)
+        GPT_PARSE_RESULTS.labels("ok").inc()
+        return result
 
     except json.JSONDecodeError as e:
-        print("❌ Ошибка разбора JSON:", e)
+        GPT_PARSE_RESULTS.labels("bad_json").inc()
+        log(f"❌ Ошибка разбора JSON: {e}", event="gpt.bad_json", level="error", error=str(e))
+        return None
+    except LLMQueueFull as e:
+        GPT_PARSE_RESULTS.labels("queue_full").inc()
+        log(f"🚦 Очередь GPT переполнена: {e}", event="gpt.queue_full", level="warning")
         return None
     except Exception as e:
-        print("❌ GPT ошибка:", e)
+        GPT_PARSE_RESULTS.labels("error").inc()
+        log(f"❌ GPT ошибка: {e}", event="gpt.error", level="error", error=repr(e))
         return None
 
 
-async def show_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("📥 Вызван /tasks")
-    tasks = load_tasks()
-    chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id]
+# разбор через вызов функции с лестницей моделей (см. LLM_MODELS); LLM_STRUCTURED=0 — промпт выше
+structured = StructuredParser.from_env(llm)
 
-    if not user_tasks:
-        await update.message.reply_text("🔕 У тебя нет запланированных задач.")
-        return
 
-    tz = pytz.timezone("Europe/Tallinn")
-    now = datetime.now(tz)
+async def parse_one_with_gpt(text, now):
+    if structured:
+        return await structured.parse_one(text, now)
+    return await ask_gpt(gpt_prompt(text, now))
 
-    def format_timedelta(delta):
-        days = delta.days
-        seconds = delta.seconds
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
 
-        parts = []
-        if days > 0:
-            parts.append(f"{days} дн")
-        if hours > 0:
-            parts.append(f"{hours} ч")
-        if minutes > 0:
-            parts.append(f"{minutes} мин")
+async def parse_many_with_gpt(items):
+    # -> список результатов по порядку фраз; None на месте фразы, которой нет в ответе
+    if structured:
+        return await structured.parse_many(items)
+    data = await ask_gpt(gpt_batch_prompt(items))
+    if data is None:
+        return None  # запрос не удался — по одной не повторяем
+    results = [None] * len(items)
+    if not isinstance(data, list):
+        return results  # ответили не массивом — фразы разберём по одной
+    for position, item in enumerate(data):
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.pop("id", position + 1))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= len(items):
+            results[index - 1] = item
+    return results
 
-        return "через " + " ".join(parts) if parts else "скоро"
 
-    text = "🗓 Твои задачи:\n"
-    for i, task in enumerate(user_tasks):
-        if "repeat" in task:
-            text += f"{i + 1}. 🔁 {task['text']} — в {task['time']} по {', '.join(task['repeat'])}\n"
+# одновременные запросы к GPT собираются в пачки, одинаковые фразы склеиваются (см. LLM_BATCH_*)
+gpt_batcher = ParseBatcher.from_env(parse_one_with_gpt, parse_many_with_gpt, max_in_flight=llm.max_concurrency)
+
+
+async def parse_with_gpt(text, now):
+    started = time.perf_counter()
+    try:
+        return await gpt_batcher.parse(text, now)
+    finally:
+        GPT_PARSE_SECONDS.observe(time.perf_counter() - started)
+
+
+async def parse_task(text, tz):
+    # сначала быстрый локальный разбор, GPT — только если не уверены
+    now = datetime.now(tz)
+    result, confidence = parse_local(text, now)
+    if result is not None and confidence >= LOCAL_PARSER_MIN_CONFIDENCE:
+        PARSE_SOURCES.labels("local").inc()
+        log(f"⚡ Разобрано локально: {result}", event="parse.local", confidence=confidence)
+        return result
+
+    cached = parse_cache.get(text, now)
+    if cached is not None:
+        PARSE_SOURCES.labels("cache").inc()
+        log(f"💾 Ответ из кэша: {cached}", event="parse.cache")
+        return cached
+
+    PARSE_SOURCES.labels("gpt").inc()
+    result = await parse_with_gpt(text, now)
+    parse_cache.put(text, now, result)
+    return result
+
+
+async def save_parse_cache(context: ContextTypes.DEFAULT_TYPE):
+    parse_cache.save()
+
+
+async def on_startup(application):
+    PROFILER.install_signal(asyncio.get_running_loop())  # kill -USR2 <pid> — включить/выключить профайлер
+    outbound.start(lambda chat_id, text: application.bot.send_message(chat_id=chat_id, text=text))
+    if outbox:
+        outbox.start(outbound.submit, drop_after=reminders.catchup_drop)
+    reminders.start(outbound.send)
+    if application.update_pool:
+        application.update_pool.start()
+    if metrics_server:
+        await metrics_server.start()
+    reminder_window.start()
+    if archive:
+        archive.start(store, on_archived=forget_archived)
+    if shard:
+        shard.start()
+
+
+async def on_stop(application):
+    # polling: дорабатываем уже разложенные по чатам обновления, пока бот ещё жив
+    if application.update_pool:
+        await application.update_pool.drain()
+        await application.update_pool.stop()
+
+
+async def on_shutdown(application):
+    if shard:
+        await shard.stop()
+    await reminder_window.stop()
+    await reminders.stop()
+    if outbox:
+        await outbox.flush()
+    await outbound.drain()
+    await outbound.stop()
+    if outbox:
+        await outbox.stop()
+    parse_cache.save()
+    if metrics_server:
+        await metrics_server.stop()
+    if archive:
+        await archive.stop()
+
+
+def encode_page_key(key):
+    # ключ страницы в callback_data (Telegram пропускает до 64 байт)
+    kind, due, task_id = key
+    return f"{kind}:{due!r}:{task_id}"
+
+
+def decode_page_key(value):
+    kind, due, task_id = value.split(":")
+    return int(kind), float(due), int(task_id)
+
+
+def short_text(text):
+    return text if len(text) <= TASK_TEXT_MAX else text[:TASK_TEXT_MAX - 1] + "…"
+
+
+def render_tasks_page(chat_id, after=None, before=None):
+    # одна страница /tasks: текст и кнопки; номера сквозные — те же, что у /delete
+    start, tasks, total = agenda.page(chat_id, after, before, TASKS_PAGE_SIZE)
+    if not tasks and total:
+        start, tasks, total = agenda.page(chat_id, size=TASKS_PAGE_SIZE)  # страницу удалили целиком
+    if not tasks:
+        return "🔕 У тебя нет запланированных задач.", None
+
+    now = datetime.now(agenda.tz_for(chat_id))
+    if total <= len(tasks):
+        lines = ["🗓 Твои задачи:"]
+    else:
+        lines = [f"🗓 Твои задачи ({start + 1}–{start + len(tasks)} из {total}):"]
+    for i, task in enumerate(tasks, start + 1):
+        if task.repeating:
+            lines.append(f"{i}. 🔁 {short_text(task.text)} — в {task.clock} по {', '.join(task.days)}")
         else:
-            t = datetime.fromisoformat(task["time"]).astimezone(tz)
-            delta = t - now
+            when = task.local_time(now.tzinfo)
+            delta = when - now
             left = format_timedelta(delta) if delta.total_seconds() > 0 else "⏱ Уже прошло"
-            t_str = t.strftime('%Y-%m-%d %H:%M')
-            text += f"{i + 1}. ⏰ {task['text']} — {t_str} ({left})\n"
+            lines.append(f"{i}. ⏰ {short_text(task.text)} — {when.strftime('%Y-%m-%d %H:%M')} ({left})")
 
-    await update.message.reply_text(text)
+    buttons = []
+    if start > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data="tasks_prev:" + encode_page_key(page_key(tasks[0]))))
+    if start + len(tasks) < total:
+        buttons.append(InlineKeyboardButton("▶️", callback_data="tasks_next:" + encode_page_key(page_key(tasks[-1]))))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
 
 
+@tracked()
+async def show_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    log("📥 Вызван /tasks", event="command", command="tasks", chat_id=update.effective_chat.id)
+    text, markup = render_tasks_page(update.effective_chat.id)
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+@tracked()
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message is None or update.message.text is None:
         return
@@ -256,7 +542,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await clear_tasks(update, context)
         return
 
-    gpt_result = await parse_with_gpt(user_input)
+    chat_id = update.effective_chat.id
+    tz = agenda.tz_for(chat_id)
+    gpt_result = await parse_task(user_input, tz)
 
     if not gpt_result:
         await update.message.reply_text("🤖 Не смог распознать дату и время. Попробуй иначе.", reply_markup=get_main_menu())
@@ -264,37 +552,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # ✅ Несколько задач в списке
     if isinstance(gpt_result, list):
-        count = 0
-        for entry in gpt_result:
-            if "text" in entry and "time" in entry:
-                task = {
-                    "chat_id": update.effective_chat.id,
-                    "text": entry["text"],
-                    "time": entry["time"]
-                }
-                schedule_task(task, context.application)
-                tasks = load_tasks()
-                tasks.append(task)
-                save_tasks(tasks)
-                count += 1
-
-        await update.message.reply_text(f"✅ Запомнил {count} задач(и)", reply_markup=get_main_menu())
+        result = add_tasks_bulk([e for e in gpt_result if isinstance(e, dict)], chat_id, tz)
+        await update.message.reply_text(describe_ingest(result), reply_markup=get_main_menu())
         return
 
     # 🔁 Повторяющаяся задача
     if "repeat" in gpt_result:
-        task = {
+        task = add_task({
             "chat_id": update.effective_chat.id,
             "text": gpt_result["text"],
             "time": gpt_result["time"],
-            "repeat": gpt_result["repeat"]
-        }
+            "repeat": gpt_result["repeat"],
+            "tz": tz.zone
+        })
         schedule_repeating_task(task, context.application)
 
-        tasks = load_tasks()
-        tasks.append(task)
-        save_tasks(tasks)
-
         await update.message.reply_text(
             f"🔁 Буду напоминать: '{task['text']}' в {task['time']} по {', '.join(task['repeat'])}",
             reply_markup=get_main_menu()
@@ -303,18 +575,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 📅 Несколько дат для одной задачи
     if isinstance(gpt_result.get("time"), list):
-        for t in gpt_result["time"]:
-            task = {
-                "chat_id": update.effective_chat.id,
-                "text": gpt_result["text"],
-                "time": t
-            }
-            schedule_task(task, context.application)
-            tasks = load_tasks()
-            tasks.append(task)
-            save_tasks(tasks)
-
-        await update.message.reply_text(f"✅ Запланировал несколько напоминаний: {len(gpt_result['time'])}", reply_markup=get_main_menu())
+        result = add_tasks_bulk([{"text": gpt_result.get("text"), "time": t} for t in gpt_result["time"]], chat_id, tz)
+        await update.message.reply_text(
+            f"✅ Запланировал несколько напоминаний: {len(result.added)}", reply_markup=get_main_menu()
+        )
         return
 
     # 🕐 Обычная одноразовая задача
@@ -322,22 +586,20 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🤖 Не смог распознать дату и время. Попробуй иначе.", reply_markup=get_main_menu())
         return
 
-    task = {
+    task = add_task({
         "chat_id": update.effective_chat.id,
         "text": gpt_result["text"],
-        "time": gpt_result["time"]
-    }
+        "time": gpt_result["time"],
+        "tz": tz.zone
+    })
     schedule_task(task, context.application)
 
-    tasks = load_tasks()
-    tasks.append(task)
-    save_tasks(tasks)
-
     time_str = datetime.fromisoformat(task["time"]).strftime('%Y-%m-%d %H:%M')
     await update.message.reply_text(f"✅ Запомнил! Напомню: ‘{task['text']}’ в {time_str}", reply_markup=get_main_menu())
 
 
 
+@tracked()
 async def show_tasks_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("📋 Все задачи", callback_data="tasks_all")],
@@ -347,159 +609,53 @@ async def show_tasks_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Выбери, что показать:", reply_markup=reply_markup)
 
-    print("📥 Вызван /tasks")
-    tasks = load_tasks()
-    chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id]
-
-    if not user_tasks:
-        await update.message.reply_text("🔕 У тебя нет запланированных задач.")
-        return
-
-    tz = pytz.timezone("Europe/Tallinn")
-    now = datetime.now(tz)
-
-    def format_timedelta(delta):
-        days = delta.days
-        seconds = delta.seconds
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-
-        parts = []
-        if days > 0:
-            parts.append(f"{days} дн")
-        if hours > 0:
-            parts.append(f"{hours} ч")
-        if minutes > 0:
-            parts.append(f"{minutes} мин")
-
-        return "через " + " ".join(parts) if parts else "скоро"
-
-    text = "🗓 Твои задачи:\n"
-    for i, task in enumerate(user_tasks):
-        if "repeat" in task:
-            text += f"{i + 1}. 🔁 {task['text']} — в {task['time']} по {', '.join(task['repeat'])}\n"
-        else:
-            t = datetime.fromisoformat(task["time"]).astimezone(tz)
-            delta = t - now
-            left = format_timedelta(delta) if delta.total_seconds() > 0 else "⏱ Уже прошло"
-            t_str = t.strftime('%Y-%m-%d %H:%M')
-            text += f"{i + 1}. ⏰ {task['text']} — {t_str} ({left})\n"
-
-    await update.message.reply_text(text)
+    await show_tasks(update, context)
 
+@tracked()
 async def show_tasks_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("📥 Вызван /tasks_today")
-    tasks = load_tasks()
+    log("📥 Вызван /tasks_today", event="command", command="tasks_today", chat_id=update.effective_chat.id)
     chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id]
-
-    tz = pytz.timezone("Europe/Tallinn")
-    now = datetime.now(tz)
-    today_date = now.date()
-
-    today_tasks = []
-
-    for task in user_tasks:
-        if "repeat" in task:
-            continue  # повторяющиеся не показываем
-
-        try:
-            # Приводим ко времени Европы/Таллин
-            task_time = datetime.fromisoformat(task["time"])
-            if task_time.tzinfo is None:
-                task_time = tz.localize(task_time)
-            else:
-                task_time = task_time.astimezone(tz)
-
-            if task_time.date() == today_date:
-                today_tasks.append((task["text"], task_time))
-
-        except Exception as e:
-            print(f"⚠️ Ошибка при обработке задачи: {e}")
-            continue
+    now = datetime.now(agenda.tz_for(chat_id))
+    today_tasks = agenda.day(chat_id, now.date())
 
     if not today_tasks:
         await update.message.reply_text("Сегодня у тебя нет задач 💤")
         return
 
-    def format_timedelta(delta):
-        days = delta.days
-        seconds = delta.seconds
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-
-        parts = []
-        if days > 0:
-            parts.append(f"{days} дн")
-        if hours > 0:
-            parts.append(f"{hours} ч")
-        if minutes > 0:
-            parts.append(f"{minutes} мин")
-
-        return "через " + " ".join(parts) if parts else "скоро"
-
     text = "📅 Задачи на сегодня:\n"
-    for i, (task_text, task_time) in enumerate(sorted(today_tasks, key=lambda x: x[1])):
+    for i, (task_time, task) in enumerate(today_tasks):
         delta = task_time - now
         left = format_timedelta(delta) if delta.total_seconds() > 0 else "⏱ Уже прошло"
         t_str = task_time.strftime('%H:%M')
-        text += f"{i + 1}. ⏰ {task_text} — {t_str} ({left})\n"
+        icon = "🔁" if task.repeating else "⏰"
+        text += f"{i + 1}. {icon} {task.text} — {t_str} ({left})\n"
 
     await update.message.reply_text(text)
 
+@tracked()
 async def show_tasks_tomorrow(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("📥 Вызван /tasks_tomorrow")
-    tasks = load_tasks()
+    log("📥 Вызван /tasks_tomorrow", event="command", command="tasks_tomorrow", chat_id=update.effective_chat.id)
     chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id]
-
-    tz = pytz.timezone("Europe/Tallinn")
-    now = datetime.now(tz)
-    tomorrow_date = now.date() + timedelta(days=1)
-
-    tomorrow_tasks = []
-
-    for task in user_tasks:
-        if "repeat" in task:
-            continue  # повторяющиеся пока не выводим
-
-        try:
-            task_time = datetime.fromisoformat(task["time"])
-            if task_time.tzinfo is None:
-                task_time = tz.localize(task_time)
-            else:
-                task_time = task_time.astimezone(tz)
-
-            if task_time.date() == tomorrow_date:
-                tomorrow_tasks.append((task["text"], task_time))
-
-        except Exception as e:
-            print(f"⚠️ Ошибка при обработке задачи: {e}")
-            continue
+    now = datetime.now(agenda.tz_for(chat_id))
+    tomorrow_tasks = agenda.day(chat_id, now.date() + timedelta(days=1))
 
     if not tomorrow_tasks:
         await update.message.reply_text("Завтра у тебя нет задач 🌙")
         return
 
-    def format_timedelta(delta):
-        hours = delta.seconds // 3600
-        minutes = (delta.seconds % 3600) // 60
-        return f"{hours} ч {minutes} мин"
-
     text = "📆 Задачи на завтра:\n"
-    for i, (task_text, task_time) in enumerate(sorted(tomorrow_tasks, key=lambda x: x[1])):
-        delta = task_time - now
+    for i, (task_time, task) in enumerate(tomorrow_tasks):
         t_str = task_time.strftime('%H:%M')
-        text += f"{i + 1}. ⏰ {task_text} — {t_str}\n"
+        icon = "🔁" if task.repeating else "⏰"
+        text += f"{i + 1}. {icon} {task.text} — {t_str}\n"
 
     await update.message.reply_text(text)
 
 
+@tracked()
 async def show_repeating_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tasks = load_tasks()
     chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id and "repeat" in task]
+    user_tasks = agenda.repeating(chat_id)
 
     if not user_tasks:
         await update.message.reply_text("🔁 У тебя нет повторяющихся задач.")
@@ -507,15 +663,15 @@ async def show_repeating_tasks(update: Update, context: ContextTypes.DEFAULT_TYP
 
     text = "🔁 Повторяющиеся задачи:\n"
     for i, task in enumerate(user_tasks):
-        text += f"{i + 1}. {task['text']} — в {task['time']} по {', '.join(task['repeat'])}\n"
+        text += f"{i + 1}. {task.text} — в {task.clock} по {', '.join(task.days)}\n"
 
     await update.message.reply_text(text)
 
 
+@tracked()
 async def delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tasks = load_tasks()
     chat_id = update.effective_chat.id
-    user_tasks = [task for task in tasks if task["chat_id"] == chat_id]
+    items = agenda.items(chat_id)
 
     if not context.args:
         await update.message.reply_text("❗ Используй: /delete [номер задачи]")
@@ -523,27 +679,25 @@ async def delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         index = int(context.args[0]) - 1
-        if index < 0 or index >= len(user_tasks):
+        if index < 0 or index >= len(items):
             raise ValueError()
 
-        task_to_delete = user_tasks[index]
-        tasks.remove(task_to_delete)
-        save_tasks(tasks)
+        task_to_delete = items[index]
+        remove_task(task_to_delete)
 
-        await update.message.reply_text(f"🗑 Задача удалена: {task_to_delete['text']}")
+        await update.message.reply_text(f"🗑 Задача удалена: {task_to_delete.text}")
 
     except ValueError:
         await update.message.reply_text("❗ Неверный номер. Посмотри /tasks")
 
+@tracked()
 async def clear_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tasks = load_tasks()
     chat_id = update.effective_chat.id
-
-    tasks = [task for task in tasks if task["chat_id"] != chat_id]
-    save_tasks(tasks)
+    clear_chat_tasks(chat_id)
 
     await update.message.reply_text("🧹 Все твои задачи удалены.")
 
+@tracked()
 async def clear_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [
@@ -554,15 +708,14 @@ async def clear_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("❗ Ты уверен, что хочешь удалить все задачи?", reply_markup=reply_markup)
 
+@tracked()
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     chat_id = query.message.chat_id
 
     if query.data == "confirm_clear":
-        tasks = load_tasks()
-        tasks = [task for task in tasks if task["chat_id"] != chat_id]
-        save_tasks(tasks)
+        clear_chat_tasks(chat_id)
 
         await query.message.delete()
         await query.message.reply_text("🧹 Все задачи удалены.")
@@ -576,49 +729,297 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         fake_update = Update(update.update_id, message=query.message)
         await show_tasks(fake_update, context)
 
+    elif query.data.startswith(("tasks_next:", "tasks_prev:")):
+        # листаем список в том же сообщении
+        direction, _, key = query.data.partition(":")
+        key = decode_page_key(key)
+        if direction == "tasks_next":
+            text, markup = render_tasks_page(chat_id, after=key)
+        else:
+            text, markup = render_tasks_page(chat_id, before=key)
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            if "not modified" not in str(e):  # повторное нажатие на ту же страницу
+                raise
+
     elif query.data == "tasks_today":
         await query.message.delete()
         fake_update = Update(update.update_id, message=query.message)
         await show_tasks_today(fake_update, context)
 
 
+@tracked()
 async def show_tasks_from_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.callback_query.message.chat_id
     fake_update = Update(update.update_id, message=update.callback_query.message)
     await show_tasks(fake_update, context)
 
+@tracked()
 async def show_tasks_today_from_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.callback_query.message.chat_id
     fake_update = Update(update.update_id, message=update.callback_query.message)
     await show_tasks_today(fake_update, context)
 
+@tracked()
+async def import_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # пользователь прислал CSV (текст, время[, дни]) или ICS из календаря
+    document = update.message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(f"❗ Файл слишком большой, максимум {IMPORT_MAX_BYTES // 1024} КБ")
+        return
+
+    chat_id = update.effective_chat.id
+    tz = agenda.tz_for(chat_id)
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+    try:
+        entries = parse_import(document.file_name, data, tz.zone)
+    except (ValueError, UnicodeDecodeError) as e:
+        await update.message.reply_text(f"❗ Не смог прочитать файл: {e}")
+        return
+
+    result = add_tasks_bulk(entries, chat_id, tz, skip_past=True)
+    log(f"📦 Импорт {document.file_name}: {len(result.added)} задач", event="import", chat_id=chat_id,
+        file=document.file_name, added=len(result.added), duplicates=result.duplicates, invalid=result.invalid)
+    await update.message.reply_text(describe_ingest(result), reply_markup=get_main_menu())
+
+@tracked()
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text(
+            f"🌍 Твой часовой пояс: {agenda.tz_for(chat_id).zone}\nПоменять: /tz Europe/Moscow"
+        )
+        return
+
+    tz_name = context.args[0]
+    if not is_valid_zone(tz_name):
+        await update.message.reply_text("❗ Не знаю такой пояс. Пример: /tz Europe/Berlin")
+        return
+
+    # повторяющиеся задачи переезжают в новый пояс, одноразовые остаются в своём моменте
+    store.set_chat_timezone(chat_id, zone(tz_name).zone)
+    agenda.drop_chat(chat_id)
+    for task in agenda.repeating(chat_id):
+        reminders.cancel(task.id)
+        schedule_repeating_task(task, context.application)
+
+    await update.message.reply_text(f"🌍 Часовой пояс: {zone(tz_name).zone}")
+
+@tracked()
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /history [N] — последние отработавшие задачи из архива
+    chat_id = update.effective_chat.id
+    if not archive:
+        await update.message.reply_text("🗄 Архив выключен (ARCHIVE_PATH).")
+        return
+    try:
+        limit = min(max(int(context.args[0]), 1), 100) if context.args else 20
+    except ValueError:
+        await update.message.reply_text("❗ Используй: /history [сколько показать]")
+        return
+
+    rows = archive.history(chat_id, limit)
+    if not rows:
+        await update.message.reply_text("🗄 В архиве пока пусто.")
+        return
+
+    tz = agenda.tz_for(chat_id)
+    lines = ["🗄 Отработавшие задачи:"]
+    for due_at, text in rows:
+        lines.append(f"✅ {short_text(text)} — {datetime.fromtimestamp(due_at, tz).strftime('%Y-%m-%d %H:%M')}")
+    await update.message.reply_text("\n".join(lines))
+
+@tracked()
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    s = llm.stats()
+    text = (
+        "📊 GPT:\n"
+        f"в очереди: {s['queue_depth']}, выполняется: {s['in_flight']}\n"
+        f"запросов: {s['requests']}, ошибок: {s['failures']}, повторов: {s['retried']}, отклонено: {s['rejected']}\n"
+        f"задержка p50/p95: {s['latency_p50']:.2f} / {s['latency_p95']:.2f} с\n"
+        f"ожидание в очереди p95: {s['queue_wait_p95']:.2f} с"
+    )
+    b = gpt_batcher.stats()
+    text += (
+        f"\nпачек: {b['batches']}, фраз в пачке в среднем/p95: {b['batch_avg']:.1f} / {b['batch_p95']}\n"
+        f"склеено одинаковых: {b['coalesced']}, дозапрошено по одной: {b['fallbacks']}"
+    )
+    for model, m in s["models"].items():
+        text += (
+            f"\n{model}: запросов {m['calls']}, токенов промпт/ответ {m['prompt_tokens']} / {m['completion_tokens']} "
+            f"({m['prompt_per_call']:.0f} на запрос), p50/p95 {m['latency_p50']:.2f} / {m['latency_p95']:.2f} с"
+        )
+    if structured:
+        g = structured.stats()
+        invalid = ", ".join(f"{k} {v}" for k, v in g["invalid"].items()) or "нет"
+        text += f"\nэскалаций на модель дороже: {g['escalations']}, не прошли проверку: {invalid}"
+    c = parse_cache.stats()
+    text += (
+        "\n\n💾 Кэш разбора:\n"
+        f"записей: {c['size']}, попаданий: {c['hits']}, промахов: {c['misses']} ({c['hit_rate']:.0%})\n"
+        f"вытеснено: {c['evictions']}, истекло: {c['expired']}"
+    )
+    text += f"\n\n⏰ Напоминаний в очереди: {len(reminders)}"
+    if outbox:
+        j = outbox.stats()
+        text += (
+            f"\n📮 Журнал: записано {j['queued']}, дублей {j['duplicates']}, в сводках {j['collapsed']}, "
+            f"выброшено {j['dropped']}\n"
+            f"доставлено {j['delivered']}, ждут подтверждения {j['unacked']}, "
+            f"повторено после перезапуска {j['replayed']}\n"
+            f"записей на диск {j['commits']}, в среднем {j['batch_avg']:.1f} на запись, "
+            f"p95 {j['commit_p95'] * 1000:.1f} мс"
+        )
+    if archive:
+        h = archive.stats()
+        text += (f"\n🗄 Архив: перенесено {h['archived']} за {h['passes']} проходов, "
+                 f"пачка p95 {h['step_p95'] * 1000:.1f} мс")
+    a = agenda.stats()
+    text += f"\n🗓 Расписаний в памяти: {a['chats']}, попаданий: {a['hits']}, загрузок: {a['loads']}"
+    o = outbound.stats()
+    text += (
+        "\n\n📤 Отправка:\n"
+        f"в очереди: {o['queued']}, доставлено: {o['delivered']}, склеено: {o['coalesced']}\n"
+        f"RetryAfter: {o['retry_after']}, потеряно: {o['dropped']}, "
+        f"служебных ответов: {o['notices']} (не отправлено {o['notices_dropped']})\n"
+        f"задержка p50/p95/p99: {o['latency_p50']:.2f} / {o['latency_p95']:.2f} / {o['latency_p99']:.2f} с"
+    )
+    if update_pool:
+        u = update_pool.stats()
+        text += (
+            "\n\n📨 Обновления:\n"
+            f"в ящиках: {u['pending']} в {u['chats']} чатах, самый длинный: {u['deepest']} (макс. {u['max_depth']})\n"
+            f"обработано: {u['processed']}, ошибок: {u['failed']}, ждали места: {u['blocked']}\n"
+            f"ожидание очереди чата p50/p95/макс: {u['wait_p50']:.2f} / {u['wait_p95']:.2f} / {u['wait_max']:.2f} с"
+        )
+    if admission:
+        d = admission.stats()
+        shed = ", ".join(f"{k} {v}" for k, v in d["shed"].items()) or "нет"
+        text += (
+            "\n🚦 Допуск: "
+            f"кнопок и команд {d['admitted_priority']}, фраз {d['admitted_parse']} "
+            f"(ждали воркера {d['queued']}, ждут разбора {d['pending']}), отброшено: {shed}"
+        )
+    if STARTUP.phases:
+        text += "\n🚀 Запуск: " + ", ".join(f"{k} {v:.0f} мс" for k, v in STARTUP.timings().items())
+    await update.message.reply_text(text)
+
+@tracked()
+async def show_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # отладка: сколько напоминаний ждёт в планировщике
+    chat_id = update.effective_chat.id
+    by_chat = reminders.pending_by_chat()
+    top = sorted(by_chat.items(), key=lambda x: x[1], reverse=True)[:5]
+    text = (
+        f"⏰ Напоминаний в этом чате: {by_chat.get(chat_id, 0)}\n"
+        f"Всего: {len(reminders)} в {len(by_chat)} чатах"
+    )
+    if top:
+        text += "\nБольше всего: " + ", ".join(f"{c} — {n}" for c, n in top)
+    await update.message.reply_text(text)
+
+@tracked()
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Привет! Напиши что-то вроде: «напомни завтра в 10:00 купить хлеб» — и я запомню 😉")
 
-if __name__ == "__main__":
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-    job_queue = app.job_queue
-
+def add_handlers(app):
+    # отдельно от запуска — чтобы бенчмарки могли собрать то же приложение
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("tasks", show_tasks_menu))
     app.add_handler(CommandHandler("tasks_today", show_tasks_today))
     app.add_handler(CommandHandler("tasks_tomorrow", show_tasks_tomorrow))
     app.add_handler(CommandHandler("delete", delete_task))
     app.add_handler(CommandHandler("clear", clear_tasks))
+    app.add_handler(CommandHandler("stats", show_stats))
+    app.add_handler(CommandHandler("jobs", show_jobs))
+    app.add_handler(CommandHandler("tz", set_timezone))
+    app.add_handler(CommandHandler("history", show_history))
     app.add_handler(CallbackQueryHandler(button_handler))  # обработка кнопок
+    app.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("ics")
+        | filters.Document.FileExtension("txt"), import_tasks
+    ))
 
     # этот обработчик должен быть последним!
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
 
-    # загрузка задач из файла при запуске
-    tasks = load_tasks()
-    for task in tasks:
-        if "repeat" in task:
-            schedule_repeating_task(task, app)
-        elif datetime.fromisoformat(task["time"]) > datetime.now(pytz.timezone("Europe/Tallinn")):
-            schedule_task(task, app)
 
-    print("Бот запущен.")
-    app.run_polling()
+def profile_startup(as_json=False):
+    # --profile-startup: фазы запуска и сколько стоит отложенное до первого использования
+    deferred = [name for name in ("openai", "aiohttp", "sharding") if name not in sys.modules]
+    started = time.perf_counter()
+    load_openai()  # то, что заплатит первая фраза, ушедшая в GPT
+    first_gpt_ms = (time.perf_counter() - started) * 1000
+    if as_json:
+        print(json.dumps({
+            "phases": {phase: {"ms": round(ms, 1), "modules": n} for phase, (ms, n) in STARTUP.phases.items()},
+            "total_ms": round(STARTUP.total_ms(), 1),
+            "modules": len(sys.modules),
+            "not_loaded": deferred,
+            "first_gpt_import_ms": round(first_gpt_ms, 1),
+        }, ensure_ascii=False, indent=2))
+        return
+    print(STARTUP.report())
+    print(f"не загружено при запуске: {', '.join(deferred) or 'всё загружено'}")
+    print(f"первая фраза в GPT догрузит openai: {first_gpt_ms:.0f} мс")
+
+
+STARTUP.mark("init")
+
+
+if __name__ == "__main__":
+    builder = (
+        ApplicationBuilder().token(BOT_TOKEN).application_class(OrderedApplication)
+        .post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL.rstrip("/") + "/bot")
+    if BOT_MODE in ("webhook", "shard"):
+        builder = builder.updater(None)  # обновления принимает свой сервер
+    app = builder.build()
+    if os.getenv("PROFILER") == "1":
+        PROFILER.start()
+    if BOT_MODE == "polling":
+        update_pool = app.use_update_pool(
+            workers=int(os.getenv("UPDATE_WORKERS", "16")),
+            queue_size=int(os.getenv("UPDATE_QUEUE_SIZE", "100")),
+            admission=admission
+        )
+    job_queue = app.job_queue
+    if parse_cache.path:
+        job_queue.run_repeating(save_parse_cache, interval=300, first=300)
+
+    add_handlers(app)
+    STARTUP.mark("handlers")
+
+    # загрузка задач при запуске (только ближайшее окно, если режим ленивый)
+    if shard and not PROFILE_STARTUP:
+        shard.join()
+    loaded = reminder_window.load_initial(since=outbox.checkpoint() if outbox else None)
+    STARTUP.mark("rehydrate")
+    if PROFILE_STARTUP:
+        profile_startup(as_json="--json" in sys.argv)
+        sys.exit(0)
+
+    log(f"📥 Загружено задач: {loaded}, напоминаний в очереди: {len(reminders)}", event="startup.loaded",
+        loaded=loaded, reminders=len(reminders))
+    timings = STARTUP.timings()
+    log("🚀 Запуск: " + ", ".join(f"{k} {v:.0f} мс" for k, v in timings.items()), event="startup.timings",
+        **{f"{k.replace(' ', '_')}_ms": round(v) for k, v in timings.items()})
+    log("Бот запущен.", event="startup.ready", mode=BOT_MODE)
+    if BOT_MODE == "webhook":
+        server = WebhookServer.from_env(app, admission)
+        update_pool = server.pool
+        asyncio.run(run_webhook(app, server))
+    elif BOT_MODE == "shard":
+        server = WebhookServer.from_env(app, admission)
+        update_pool = server.pool
+        server.secret = os.getenv("SHARD_SECRET") or None
+        server.public_url = None  # webhook в Telegram регистрирует роутер
+        asyncio.run(run_webhook(app, server))
+    else:
+        app.run_polling()
 
 
@@ -0,0 +1,194 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI
+from fake_openai import FakeOpenAI
+from llm_client import percentile
+
+# Кнопки под перегрузкой GPT. Настоящие обработчики assistant_bot.py за
+# UpdateWorkerPool, обновления подаются по одному, как в polling. Один чат
+# заваливает бота фразами (--flood-rate), остальные пишут фразы чаще, чем GPT
+# успевает разбирать (--text-rate), и жмут кнопки меню (--button-rate).
+# Сравниваем пул без допуска и с AdmissionControl: задержка кнопок, сколько
+# фраз разобрано и отброшено.
+#
+#   python bench/bench_admission.py --seconds 10 --flood-rate 20 --text-rate 12
+
+
+ITEM_RE = re.compile(r"^(\d+)\. .*? Фраза: (.*)$", re.M)
+SINGLE_RE = re.compile(r"Фраза: (.*)$", re.M)
+
+
+def responder(body):
+    # разовая задача на каждую фразу; в пачке — с id фразы
+    prompt = body["messages"][-1]["content"]
+    items = ITEM_RE.findall(prompt)
+    if items:
+        return json.dumps([{"id": int(i), "text": text, "time": "2030-01-01T10:00:00"} for i, text in items],
+                          ensure_ascii=False)
+    return json.dumps({"text": SINGLE_RE.search(prompt).group(1), "time": "2030-01-01T10:00:00"},
+                      ensure_ascii=False)
+
+
+def ms(values, q):
+    return round(percentile(values, q) * 1000, 1) if values else 0.0
+
+
+async def run(bot, app, args, admission):
+    from telegram import Update
+    from webhook import UpdateWorkerPool
+
+    rnd = random.Random(args.seed)
+    arrived, latencies = {}, {"button": [], "text": [], "flood": []}
+    update_id = [0]
+
+    async def process(update):
+        try:
+            await app.process_update(update)
+        finally:
+            kind, arrived_at = arrived.pop(update.update_id)
+            latencies[kind].append(time.perf_counter() - arrived_at)
+
+    pool = UpdateWorkerPool(process, args.workers, args.queue_size, admission=admission)
+    pool.start()
+    feed = asyncio.Queue()
+    sent = {"button": 0, "text": 0, "flood": 0}
+
+    async def feeder():
+        # polling: следующее обновление — только когда предыдущее разложено по ящикам
+        while True:
+            update = await feed.get()
+            if update is None:
+                return
+            await pool.submit(update)
+
+    def arrive(kind, chat_id, text):
+        update_id[0] += 1
+        update = Update.de_json(FakeBotAPI.make_message_update(update_id[0], chat_id, text), app.bot)
+        arrived[update.update_id] = (kind, time.perf_counter())
+        sent[kind] += 1
+        feed.put_nowait(update)
+
+    async def source(kind, rate, make):
+        deadline = time.perf_counter() + args.seconds
+        i = 0
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(rnd.expovariate(rate))
+            arrive(kind, *make(i))
+            i += 1
+
+    feeding = asyncio.create_task(feeder())
+    started = time.perf_counter()
+    await asyncio.gather(
+        source("flood", args.flood_rate, lambda i: (1, f"напомни про дело #{i} когда-нибудь")),
+        source("text", args.text_rate, lambda i: (rnd.randint(2, args.chats + 1), f"запиши дело #{i} когда удобно")),
+        source("button", args.button_rate, lambda i: (
+            rnd.randint(args.chats + 2, 2 * args.chats + 1), rnd.choice(("📅 Сегодня", "🗓 Мои задачи", "/tasks_today"))
+        )),
+    )
+    feed.put_nowait(None)
+    await feeding
+    await pool.drain(timeout=args.drain_timeout)
+    elapsed = time.perf_counter() - started
+    await pool.stop()
+
+    report = {"seconds": round(elapsed, 1)}
+    for kind in ("button", "text", "flood"):
+        report[kind] = {
+            "sent": sent[kind],
+            "answered": len(latencies[kind]),
+            "latency_p50_ms": ms(latencies[kind], 50),
+            "latency_p95_ms": ms(latencies[kind], 95),
+            "latency_max_ms": round(max(latencies[kind], default=0) * 1000, 1),
+        }
+    if admission:
+        report["admission"] = admission.stats()
+    return report
+
+
+async def main(args):
+    api = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=0)
+    api_url = await api.start(port=args.port)
+    gpt = FakeOpenAI(delay=args.gpt_delay, jitter=args.gpt_delay / 4, responder=responder)
+    gpt_url = await gpt.start(port=args.port + 1)
+    workdir = tempfile.mkdtemp(prefix="admission-")
+    os.environ.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": gpt_url,
+        "TASK_STORE": f"sqlite:{os.path.join(workdir, 'tasks.db')}",
+        "PARSE_CACHE_PATH": "",
+        "OUTBOX_PATH": "",
+        "ARCHIVE_PATH": "",
+        "METRICS_PORT": "",
+        "ADMISSION": "0",  # допуск собираем сами, ниже
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_MAX_QUEUE": "100000",
+        "LLM_BATCH_MAX": str(args.batch_max),
+    })
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import assistant_bot as bot
+        from telegram.ext import ApplicationBuilder
+        from webhook import OrderedApplication
+        from admission import AdmissionControl
+
+        # без своего пула OrderedApplication обрабатывает обновление сразу — пул соберём в run()
+        app = ApplicationBuilder().token("123:FAKE").base_url(api_url).application_class(OrderedApplication).build()
+        bot.add_handlers(app)
+        await app.initialize()
+        await bot.on_startup(app)
+
+        report = {}
+        for name in ("no_admission", "admission"):
+            admission = None
+            if name == "admission":
+                admission = AdmissionControl(
+                    bot.update_kind, chat_rate=args.chat_rate, chat_burst=args.chat_burst,
+                    global_rate=args.global_rate, global_burst=args.global_burst,
+                    max_pending=args.max_pending, reserved_workers=args.reserved_workers,
+                )
+                admission.on_shed = lambda chat_id, reason: bot.outbound.notify(chat_id, bot.BUSY_TEXT[reason])
+            calls = gpt.calls
+            report[name] = await run(bot, app, args, admission)
+            report[name]["gpt_calls"] = gpt.calls - calls
+
+        await bot.on_shutdown(app)
+        await app.shutdown()
+    await api.stop()
+    await gpt.stop()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--flood-rate", type=float, default=20, help="фраз в секунду от одного чата")
+    parser.add_argument("--text-rate", type=float, default=12, help="фраз в секунду от остальных чатов")
+    parser.add_argument("--button-rate", type=float, default=5, help="нажатий кнопок в секунду")
+    parser.add_argument("--workers", type=int, default=16, help="UPDATE_WORKERS")
+    parser.add_argument("--queue-size", type=int, default=100, help="UPDATE_QUEUE_SIZE")
+    parser.add_argument("--gpt-delay", type=float, default=1.5)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--batch-max", type=int, default=4)
+    parser.add_argument("--chat-rate", type=float, default=0.2)
+    parser.add_argument("--chat-burst", type=int, default=5)
+    parser.add_argument("--global-rate", type=float, default=20)
+    parser.add_argument("--global-burst", type=int, default=40)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--reserved-workers", type=int, default=2)
+    parser.add_argument("--drain-timeout", type=float, default=180)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18701)
+    asyncio.run(main(parser.parse_args()))
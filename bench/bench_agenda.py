@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import SqliteTaskStore
+from agenda import AgendaIndex
+
+# «Сегодня» для чата с k задачами: прежний путь (перечитать задачи чата,
+# разобрать и локализовать каждую) против среза из AgendaIndex.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def fill(store, chats, per_chat, now):
+    rnd = random.Random(11)
+    batch = []
+    for chat_id in range(1, chats + 1):
+        for i in range(per_chat):
+            if rnd.random() < 0.1:
+                batch.append({"chat_id": chat_id, "text": f"повтор {i}",
+                              "time": f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}",
+                              "repeat": rnd.sample(DAYS, rnd.randint(1, 7))})
+            else:
+                due = now + rnd.randint(-30 * 86400, 60 * 86400)
+                batch.append({"chat_id": chat_id, "text": f"задача {i}",
+                              "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(due))})
+    store.add_many(batch)
+
+
+def today_old(store, chat_id):
+    # как show_tasks_today работал раньше
+    tz = pytz.timezone("Europe/Tallinn")
+    today = datetime.now(tz).date()
+    result = []
+    for task in store.chat_tasks(chat_id):
+        if "repeat" in task:
+            continue
+        task_time = datetime.fromisoformat(task["time"])
+        task_time = tz.localize(task_time) if task_time.tzinfo is None else task_time.astimezone(tz)
+        if task_time.date() == today:
+            result.append((task_time, task))
+    return sorted(result, key=lambda x: x[0])
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "tasks.db")
+    store = SqliteTaskStore(path)
+    fill(store, args.chats, args.per_chat, time.time())
+    index = AgendaIndex(store)
+    tz = pytz.timezone("Europe/Tallinn")
+    rnd = random.Random(5)
+    views = [rnd.randint(1, args.chats) for _ in range(args.views)]
+
+    started = time.perf_counter()
+    for chat_id in views:
+        today_old(store, chat_id)
+    old = (time.perf_counter() - started) / len(views)
+
+    started = time.perf_counter()
+    for chat_id in views:
+        index.day(chat_id, datetime.now(tz).date())
+    new = (time.perf_counter() - started) / len(views)
+
+    # повторный просмотр уже загруженного чата — типичный случай
+    started = time.perf_counter()
+    for chat_id in views:
+        index.day(chat_id, datetime.now(tz).date() + timedelta(days=1))
+    warm = (time.perf_counter() - started) / len(views)
+
+    print(json.dumps({
+        "chats": args.chats, "tasks_per_chat": args.per_chat, "views": args.views,
+        "old_today_us": old * 1e6,
+        "index_first_view_us": new * 1e6,
+        "index_warm_view_us": warm * 1e6,
+        "index": index.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--per-chat", type=int, default=300)
+    parser.add_argument("--views", type=int, default=2000)
+    main(parser.parse_args())
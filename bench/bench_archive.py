@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import SqliteTaskStore, JsonTaskStore
+from archive import TaskArchive
+from agenda import AgendaIndex
+from reminders import ReminderEngine, ReminderWindow
+from llm_client import percentile
+
+# Хранилище, в котором годами копятся отработавшие задачи, до и после переноса
+# в архив: размер, загрузка расписаний чатов и всех задач при запуске. Перенос
+# идёт пачками в фоне — заодно меряем, насколько он задерживает цикл событий.
+#
+#   python bench/bench_archive.py --tasks 200000 --expired 0.8
+
+
+def make_tasks(n, chats, expired, now, rnd):
+    tasks = []
+    for i in range(n):
+        if rnd.random() < expired:
+            due = now - rnd.randint(2 * 86400, 3 * 365 * 86400)
+        else:
+            due = now + rnd.randint(60, 90 * 86400)
+        tasks.append({"chat_id": rnd.randint(1, chats), "text": f"задача {i}",
+                      "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(due))})
+    return tasks
+
+
+def sqlite_size(store):
+    # файл после удаления не сжимается, но свободные страницы идут под новые задачи
+    page_size, pages, free = (store._conn.execute(f"PRAGMA {p}").fetchone()[0]
+                              for p in ("page_size", "page_count", "freelist_count"))
+    return {"file_bytes": os.path.getsize(store.path), "live_bytes": (pages - free) * page_size}
+
+
+def measure(store, chats, rnd):
+    result = {"tasks": store.count()}
+    sample = [rnd.randint(1, chats) for _ in range(200)]
+    index = AgendaIndex(store)
+    started = time.perf_counter()
+    for chat_id in sample:
+        index.items(chat_id)
+        index.drop_chat(chat_id)
+    result["chat_load_ms"] = round((time.perf_counter() - started) / len(sample) * 1000, 3)
+    started = time.perf_counter()
+    ReminderWindow(store, ReminderEngine(), lazy=False).load_initial()
+    result["startup_eager_s"] = round(time.perf_counter() - started, 2)
+    started = time.perf_counter()
+    store.all_tasks()
+    result["all_tasks_s"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+async def compact(store, archive):
+    lags, running = [], True
+
+    async def ticker():
+        # как долго цикл событий не отвечал: обработчики ждали бы столько же
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    moved = await archive.compact(store)
+    elapsed = time.perf_counter() - started
+    running = False
+    await tick
+    return {
+        "archived": moved,
+        "archived_per_s": round(moved / elapsed),
+        "step_p95_ms": round(percentile(archive.step_seconds, 95) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0) * 1000, 2),
+    }
+
+
+def run(kind, args, workdir):
+    rnd = random.Random(args.seed)
+    n = args.tasks if kind == "sqlite" else args.json_tasks
+    if kind == "sqlite":
+        store = SqliteTaskStore(os.path.join(workdir, "tasks.db"))
+    else:
+        store = JsonTaskStore(os.path.join(workdir, "tasks.json"))
+    store.add_many(make_tasks(n, args.chats, args.expired, time.time(), rnd))
+    archive = TaskArchive(os.path.join(workdir, f"archive-{kind}.db"), grace=args.grace_hours * 3600,
+                          batch=args.batch, pause=0)
+    report = {"before": measure(store, args.chats, random.Random(1))}
+    if kind == "sqlite":
+        report["before"].update(sqlite_size(store))
+    else:
+        report["before"]["file_bytes"] = os.path.getsize(store.path)
+    report["compaction"] = asyncio.run(compact(store, archive))
+    report["after"] = measure(store, args.chats, random.Random(1))
+    if kind == "sqlite":
+        report["after"].update(sqlite_size(store))
+    else:
+        report["after"]["file_bytes"] = os.path.getsize(store.path)
+    report["after"]["archive_tasks"] = archive.count()
+    return report
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="archive-")
+    report = {"sqlite": run("sqlite", args, workdir)}
+    if args.json_tasks:
+        report["json"] = run("json", args, workdir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=200000)
+    parser.add_argument("--json-tasks", type=int, default=20000, help="0 — без JSON-хранилища")
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--expired", type=float, default=0.8, help="доля давно отработавших задач")
+    parser.add_argument("--grace-hours", type=float, default=24)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
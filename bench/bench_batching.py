@@ -0,0 +1,142 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_openai import FakeOpenAI
+from llm_client import percentile
+
+# Подбор окна пачек для разбора через GPT. Фразы приходят потоком (Пуассон,
+# --rate в секунду), часть одинаковых. Сравниваем запрос на каждую фразу
+# (как раньше) с пачками при разных LLM_BATCH_WINDOW_MS / LLM_BATCH_MAX:
+# пропускная способность, задержка, запросов и символов промпта на фразу,
+# примерная стоимость фразы.
+#
+#   python bench/bench_batching.py --rate 40 --seconds 10 --windows 0,10,25,50,100
+
+ITEM_RE = re.compile(r"^(\d+)\. Сегодня: .*? Фраза: (.*)$", re.M)
+SINGLE_RE = re.compile(r"Фраза: (.*)$", re.M)
+REPEATED = ["каждый день в 9 зарядка", "по будням в 8 утра планёрка", "напомни через час позвонить маме"]
+
+
+def answer(phrase):
+    k = sum(map(ord, phrase)) % 600
+    return {"text": phrase, "time": f"2030-01-01T{10 + k // 60:02d}:{k % 60:02d}:00"}
+
+
+def responder(body):
+    prompt = body["messages"][-1]["content"]
+    items = ITEM_RE.findall(prompt)
+    if items:
+        return json.dumps([dict(answer(phrase), id=int(i)) for i, phrase in items], ensure_ascii=False)
+    return json.dumps(answer(SINGLE_RE.search(prompt).group(1)), ensure_ascii=False)
+
+
+async def drive(parse, args, rnd):
+    latencies, wrong = [], 0
+    tz = datetime.now().astimezone().tzinfo
+
+    async def one(i):
+        nonlocal wrong
+        phrase = rnd.choice(REPEATED) if rnd.random() < args.duplicates else f"дело номер {i} когда-нибудь"
+        started = time.perf_counter()
+        result = await parse(phrase, datetime.now(tz))
+        latencies.append(time.perf_counter() - started)
+        wrong += not result or result.get("text") != phrase
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(int(args.rate * args.seconds)):
+        tasks.append(asyncio.create_task(one(i)))
+        await asyncio.sleep(rnd.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return len(tasks), elapsed, latencies, wrong
+
+
+async def main(args):
+    server = FakeOpenAI(delay=args.delay, jitter=args.jitter, responder=responder, char_delay=args.char_delay)
+    url = await server.start(port=args.port)
+    os.environ.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": url,
+        "TASK_STORE": f"sqlite:{os.path.join(tempfile.mkdtemp(prefix='batching-'), 'tasks.db')}",
+        "OUTBOX_PATH": "",
+        "ARCHIVE_PATH": "",
+        "METRICS_PORT": "",
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+        "LLM_MAX_QUEUE": "100000",
+    })
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import assistant_bot as bot
+    from parse_batcher import ParseBatcher
+
+    configs = [("per_message", None, None)]
+    configs += [(f"window_{w}ms_max_{m}", w, m) for w in args.windows for m in args.max_batch]
+    report = {}
+    for name, window_ms, max_batch in configs:
+        if window_ms is None:
+            parse = bot.parse_one_with_gpt  # как было: запрос на каждую фразу
+            batcher = None
+        else:
+            batcher = ParseBatcher(bot.parse_one_with_gpt, bot.parse_many_with_gpt, window_ms / 1000, max_batch,
+                                    max_in_flight=bot.llm.max_concurrency)
+            parse = batcher.parse
+        calls, prompt_chars, completion_chars = server.calls, server.prompt_chars, server.completion_chars
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            n, elapsed, latencies, wrong = await drive(parse, args, random.Random(args.seed))
+        calls = server.calls - calls
+        prompt_tokens = (server.prompt_chars - prompt_chars) / args.chars_per_token
+        completion_tokens = (server.completion_chars - completion_chars) / args.chars_per_token
+        cost = (prompt_tokens * args.price_prompt + completion_tokens * args.price_completion) / 1000
+        row = {
+            "messages": n,
+            "wrong": wrong,
+            "msgs_per_s": round(n / elapsed, 1),
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "llm_calls_per_msg": round(calls / n, 3),
+            "prompt_tokens_per_msg": round(prompt_tokens / n, 1),
+            "completion_tokens_per_msg": round(completion_tokens / n, 1),
+            "cost_per_1k_msgs_usd": round(cost / n * 1000, 3),
+        }
+        if batcher:
+            s = batcher.stats()
+            row.update(coalesced=s["coalesced"], batch_avg=round(s["batch_avg"], 1), fallbacks=s["fallbacks"])
+        report[name] = row
+    await server.stop()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def csv_numbers(value, cast=float):
+    return [cast(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=40, help="фраз в секунду")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="доля одинаковых фраз")
+    parser.add_argument("--windows", type=csv_numbers, default=[10, 25, 50, 100], help="окна, мс")
+    parser.add_argument("--max-batch", type=lambda v: csv_numbers(v, int), default=[8, 16])
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--delay", type=float, default=0.4, help="задержка модели до первого символа")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--char-delay", type=float, default=0.002, help="секунд на символ ответа")
+    parser.add_argument("--chars-per-token", type=float, default=3.0)
+    parser.add_argument("--price-prompt", type=float, default=0.03, help="$ за 1K токенов промпта")
+    parser.add_argument("--price-completion", type=float, default=0.06, help="$ за 1K токенов ответа")
+    parser.add_argument("--port", type=int, default=18481)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from fake_bot_api import FakeBotAPI
+from dispatcher import OutboundDispatcher
+
+# "08:00 в будни": тысячи напоминаний срабатывают одновременно.
+# Сравниваем прямую отправку и OutboundDispatcher на фейковом Bot API.
+
+
+def herd(args):
+    rnd = random.Random(3)
+    items = []
+    for chat_id in range(1, args.chats + 1):
+        # у части чатов несколько напоминаний на одну и ту же минуту
+        for k in range(rnd.choice([1, 1, 1, 2, 3])):
+            items.append((chat_id, f"🔔 Сейчас: задача {k}"))
+    return items
+
+
+async def run_direct(bot, items):
+    async def one(chat_id, text):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return True
+        except Exception:
+            return False
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(one(c, t) for c, t in items))
+    return {"delivered": sum(results), "lost": results.count(False), "elapsed_s": time.monotonic() - started}
+
+
+async def run_dispatcher(bot, items, args):
+    global_rate = args.global_limit * 0.8
+    dispatcher = OutboundDispatcher(global_rate=global_rate, global_burst=args.global_limit - global_rate,
+                                    chat_rate=1.0, chat_burst=args.chat_limit - 1, workers=args.workers)
+    dispatcher.start(lambda chat_id, text: bot.send_message(chat_id=chat_id, text=text))
+    started = time.monotonic()
+    for chat_id, text in items:
+        dispatcher.submit(chat_id, text)
+    await dispatcher.drain(timeout=args.timeout)
+    elapsed = time.monotonic() - started
+    await dispatcher.stop()
+    report = dispatcher.stats()
+    report["elapsed_s"] = elapsed
+    return report
+
+
+async def main(args):
+    items = herd(args)
+    report = {"reminders": len(items), "chats": args.chats}
+    for mode in ("direct", "dispatcher"):
+        server = FakeBotAPI(global_limit=args.global_limit, chat_limit=args.chat_limit)
+        url = await server.start(port=args.port)
+        request = HTTPXRequest(connection_pool_size=args.workers * 2 if mode == "dispatcher" else 256,
+                               pool_timeout=60)
+        bot = Bot("123:FAKE", base_url=url, request=request)
+        await bot.initialize()
+        if mode == "direct":
+            result = await run_direct(bot, items)
+        else:
+            result = await run_dispatcher(bot, items, args)
+        result["server_429"] = server.rejected
+        result["server_messages"] = len(server.messages)
+        report[mode] = result
+        await bot.shutdown()
+        await server.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--global-limit", type=int, default=30)
+    parser.add_argument("--chat-limit", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
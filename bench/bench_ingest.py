@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import JsonTaskStore, SqliteTaskStore
+from reminders import ReminderEngine
+from ingest import parse_csv, ingest, normalize_entry
+
+# Импорт большого CSV в чат: раньше каждая задача — отдельная запись в
+# хранилище и отдельная постановка в планировщик, теперь — одна транзакция
+# и одна пачка в кучу напоминаний.
+
+DAYS = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+
+
+def make_csv(n, rnd):
+    rows = ["Задача;Время;Дни"]
+    for i in range(n):
+        if rnd.random() < 0.3:
+            rows.append(f"повтор {i};{rnd.randint(6, 22):02d}:{rnd.choice(['00', '30'])};{', '.join(rnd.sample(DAYS, 2))}")
+        else:
+            rows.append(f"дело {i};2030-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(6, 22):02d}:00;")
+    return "\n".join(rows)
+
+
+def make_store(kind, root):
+    if kind == "json":
+        return JsonTaskStore(os.path.join(root, "tasks.json"))
+    return SqliteTaskStore(os.path.join(root, "tasks.db"))
+
+
+def per_item(store, entries, chat_id, now):
+    engine = ReminderEngine()
+    for entry in entries:
+        task = store.add(normalize_entry(entry, chat_id, "Europe/Tallinn"))
+        if "repeat" in task:
+            engine.schedule_repeating(task, now)
+        else:
+            engine.schedule_once(task, now)
+    return engine
+
+
+def bulk(store, entries, chat_id, now):
+    engine = ReminderEngine()
+    result = ingest(store, entries, chat_id, "Europe/Tallinn", now=now)
+    engine.schedule_many(result.added, now)
+    return engine
+
+
+def main(args):
+    entries = parse_csv(make_csv(args.tasks, random.Random(5)))
+    now = time.time()
+    report = {"tasks": len(entries)}
+    for kind in ("json", "sqlite"):
+        for name, fn in (("per_item", per_item), ("bulk", bulk)):
+            n = min(len(entries), args.per_item_limit) if name == "per_item" else len(entries)
+            with tempfile.TemporaryDirectory() as root:
+                store = make_store(kind, root)
+                started = time.perf_counter()
+                engine = fn(store, entries[:n], 1, now)
+                elapsed = time.perf_counter() - started
+                report[f"{kind}_{name}_tasks_per_s"] = round(n / elapsed)
+                report[f"{kind}_{name}_reminders"] = len(engine)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--per-item-limit", type=int, default=1000,
+                        help="по одной — медленно, меряем на части задач")
+    main(parser.parse_args())
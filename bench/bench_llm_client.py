@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import openai
+
+from fake_openai import FakeOpenAI
+from llm_client import LLMClient, LLMQueueFull
+
+# Нагрузочный прогон LLMClient против локального фейкового сервера:
+# показывает, что очередь ограничена, а event loop не блокируется.
+
+
+async def ticker(stop, lags):
+    # измеряем, насколько опаздывает event loop, пока идут запросы
+    while not stop.is_set():
+        t = time.monotonic()
+        await asyncio.sleep(0.01)
+        lags.append(time.monotonic() - t - 0.01)
+
+
+async def run(args):
+    server = FakeOpenAI(delay=args.delay, jitter=args.jitter, fail_rate=args.fail_rate)
+    url = await server.start(port=args.port)
+    openai.api_key = "sk-fake"
+
+    client = LLMClient(max_concurrency=args.concurrency, max_queue=args.queue,
+                       timeout=args.timeout, retries=args.retries, backoff_base=0.05, api_base=url)
+
+    stop = asyncio.Event()
+    lags = []
+    tick = asyncio.create_task(ticker(stop, lags))
+
+    async def one(i):
+        try:
+            await client.complete(model="gpt-4", messages=[{"role": "user", "content": f"задача {i}"}])
+            return "ok"
+        except LLMQueueFull:
+            return "rejected"
+        except Exception:
+            return "failed"
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.monotonic() - started
+    stop.set()
+    await tick
+    await server.stop()
+
+    report = dict(client.stats())
+    report.update({
+        "elapsed_s": elapsed,
+        "ok": results.count("ok"),
+        "rejected_results": results.count("rejected"),
+        "failed": results.count("failed"),
+        "server_calls": server.calls,
+        "loop_lag_max_ms": max(lags, default=0) * 1000,
+    })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--queue", type=int, default=150)
+    parser.add_argument("--delay", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
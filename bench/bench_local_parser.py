@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytz
+
+from llm_client import percentile
+from local_parser import parse_local
+
+# Прогон локального парсера по размеченному корпусу.
+# expected = null означает, что фраза должна уйти в GPT.
+
+CORPUS = os.path.join(os.path.dirname(__file__), "parser_corpus.jsonl")
+# Корпус размечен относительно этого момента (среда, полдень)
+CORPUS_NOW = "2025-05-14T12:00:00"
+
+
+def main(args):
+    tz = pytz.timezone("Europe/Tallinn")
+    now = tz.localize(datetime.fromisoformat(CORPUS_NOW))
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    hits = correct = wrong = false_fallback = 0
+    latencies = []
+    mistakes = []
+    for item in corpus:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result, confidence = parse_local(item["text"], now)
+            latencies.append(time.perf_counter() - started)
+        accepted = result if result is not None and confidence >= args.min_confidence else None
+        expected = item["expected"]
+        if accepted is not None:
+            hits += 1
+            if accepted == expected:
+                correct += 1
+            else:
+                wrong += 1
+                mistakes.append({"text": item["text"], "got": accepted, "expected": expected})
+        elif expected is not None:
+            false_fallback += 1
+            mistakes.append({"text": item["text"], "got": None, "confidence": confidence, "expected": expected})
+
+    report = {
+        "messages": len(corpus),
+        "hit_rate": hits / len(corpus),
+        "precision": correct / hits if hits else 0.0,
+        "wrong_accepted": wrong,
+        "missed_to_llm": false_fallback,
+        "latency_mean_us": sum(latencies) / len(latencies) * 1e6,
+        "latency_p95_us": percentile(latencies, 95) * 1e6,
+        "mistakes": mistakes,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    main(parser.parse_args())
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from outbox import Outbox, OutboxItem, reminder_key
+
+# Сколько напоминаний в секунду выдерживает журнал: fsync на каждое
+# напоминание против записи группами (OUTBOX_FLUSH_MS / OUTBOX_BATCH).
+
+
+def make_items(n):
+    now = time.time()
+    return [OutboxItem(reminder_key(i, 0, now), i, i % 500 + 1, f"🔔 Сейчас: задача {i}", now) for i in range(n)]
+
+
+async def per_item(path, items):
+    outbox = Outbox(path)
+    outbox.start(lambda chat_id, text, message_id: None)
+    started = time.perf_counter()
+    for item in items:
+        outbox.add([item], time.time())
+        await outbox.flush()
+    elapsed = time.perf_counter() - started
+    stats = outbox.stats()
+    await outbox.stop()
+    return elapsed, stats
+
+
+async def grouped(path, items, chunk, flush_ms, max_batch):
+    outbox = Outbox(path, flush_interval=flush_ms / 1000, max_batch=max_batch)
+    sent = []
+    outbox.start(lambda chat_id, text, message_id: sent.append(message_id))
+    started = time.perf_counter()
+    for i in range(0, len(items), chunk):
+        # планировщик отдаёт напоминания порциями и отпускает цикл
+        outbox.add(items[i:i + chunk], time.time())
+        await asyncio.sleep(0)
+    while len(sent) < len(items):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    stats = outbox.stats()
+    await outbox.stop()
+    return elapsed, stats
+
+
+def report(n, elapsed, stats):
+    return {
+        "reminders_per_s": round(n / elapsed),
+        "commits": stats["commits"],
+        "batch_avg": round(stats["batch_avg"], 1),
+        "commit_p95_ms": round(stats["commit_p95"] * 1000, 2),
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        slow = make_items(args.per_item)
+        fast = make_items(args.reminders)
+        elapsed, stats = await per_item(os.path.join(tmp, "a.db"), slow)
+        result = {"per_item": report(len(slow), elapsed, stats)}
+        elapsed, stats = await grouped(os.path.join(tmp, "b.db"), fast, args.chunk, args.flush_ms, args.batch)
+        result["grouped"] = report(len(fast), elapsed, stats)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reminders", type=int, default=50000)
+    parser.add_argument("--per-item", type=int, default=2000, help="сколько писать по одному (это медленно)")
+    parser.add_argument("--chunk", type=int, default=20, help="напоминаний за одно пробуждение планировщика")
+    parser.add_argument("--flush-ms", type=float, default=50)
+    parser.add_argument("--batch", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from recurrence import zone, recurrence, Recurrence
+from reminders import ReminderEngine
+
+# Пропускная способность разворачивания повторений: много пользователей
+# в разных поясах, у каждого своё "в HH:MM по дням". Считаем следующие
+# N срабатываний каждого правила.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+POPULAR = ["08:00", "09:00", "07:30", "10:00", "12:00", "18:00", "21:00"]
+
+
+def make_tasks(n, zones, rnd):
+    tasks = []
+    for i in range(n):
+        # у людей время сильно повторяется, но не у всех
+        when = rnd.choice(POPULAR) if rnd.random() < 0.6 else f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+        days = DAYS[:5] if rnd.random() < 0.4 else rnd.sample(DAYS, rnd.randint(1, 7))
+        tasks.append({"id": i + 1, "chat_id": i + 1, "text": f"повтор {i}", "time": when,
+                      "repeat": days, "tz": rnd.choice(zones)})
+    return tasks
+
+
+def mask_of(days):
+    mask = 0
+    for d in days:
+        mask |= 1 << DAYS.index(d)
+    return mask
+
+
+def expand_naive(task, after_ts, count):
+    # как раньше: pytz-пояс и localize на каждый день
+    tz = pytz.timezone(task["tz"])
+    hour, minute = map(int, task["time"].split(":"))
+    mask = mask_of(task["repeat"])
+    day = datetime.fromtimestamp(after_ts, tz).date()
+    result = []
+    while len(result) < count:
+        if mask & (1 << day.weekday()):
+            ts = tz.localize(datetime(day.year, day.month, day.day, hour, minute)).timestamp()
+            if ts > after_ts:
+                result.append(ts)
+        day += timedelta(days=1)
+    return result
+
+
+def expand_cached(task, after_ts, count, shared):
+    hour, minute = map(int, task["time"].split(":"))
+    tz = zone(task["tz"])
+    mask = mask_of(task["repeat"])
+    rule = recurrence(tz, hour, minute, mask) if shared else Recurrence(tz, hour, minute, mask, count)
+    return rule.upcoming(after_ts, count)
+
+
+def timed(fn, tasks):
+    started = time.perf_counter()
+    for task in tasks:
+        fn(task)
+    return time.perf_counter() - started
+
+
+def main(args):
+    rnd = random.Random(9)
+    zones = [z for z in pytz.common_timezones if "/" in z][:args.zones]
+    tasks = make_tasks(args.tasks, zones, rnd)
+    now = time.time()
+    report = {"tasks": args.tasks, "zones": len(zones), "occurrences_per_task": args.count}
+
+    elapsed = timed(lambda t: expand_naive(t, now, args.count), tasks[:args.naive_sample])
+    report["naive_tasks_per_s"] = args.naive_sample / elapsed
+
+    elapsed = timed(lambda t: expand_cached(t, now, args.count, shared=False), tasks)
+    report["per_task_rule_tasks_per_s"] = args.tasks / elapsed
+
+    recurrence.cache_clear()
+    elapsed = timed(lambda t: expand_cached(t, now, args.count, shared=True), tasks)
+    report["shared_rules_tasks_per_s"] = args.tasks / elapsed
+    report["shared_rules"] = recurrence.cache_info().currsize
+    report["occurrences_per_s"] = args.tasks * args.count / elapsed
+
+    engine = ReminderEngine(offsets=[30, 15, 0])
+    started = time.perf_counter()
+    for task in tasks:
+        engine.schedule_repeating(task, now)
+    report["engine_schedule_tasks_per_s"] = args.tasks / (time.perf_counter() - started)
+
+    # сутки работы: каждое срабатывание перепланирует следующее
+    started = time.perf_counter()
+    fired = len(engine.pop_due(now + 86400))
+    report["engine_day_fired"] = fired
+    report["engine_reschedule_per_s"] = fired / (time.perf_counter() - started)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--zones", type=int, default=400)
+    parser.add_argument("--count", type=int, default=8, help="сколько срабатываний вперёд")
+    parser.add_argument("--naive-sample", type=int, default=5000)
+    main(parser.parse_args())
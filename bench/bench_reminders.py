@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from reminders import ReminderEngine
+
+# Память и скорость планировщика на большом числе ожидающих напоминаний.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def make_tasks(n, now, repeating_share):
+    rnd = random.Random(42)
+    tasks = []
+    for i in range(n):
+        if rnd.random() < repeating_share:
+            tasks.append({
+                "id": i, "chat_id": rnd.randint(1, n // 10 + 1), "text": f"задача {i % 1000}",
+                "time": f"{rnd.randint(0, 23):02d}:{rnd.choice([0, 15, 30, 45]):02d}",
+                "repeat": rnd.sample(DAYS, rnd.randint(1, 7)),
+            })
+        else:
+            due = now + rnd.randint(3600, 30 * 24 * 3600)
+            tasks.append({
+                "id": i, "chat_id": rnd.randint(1, n // 10 + 1), "text": f"задача {i % 1000}",
+                "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(due)),
+            })
+    return tasks
+
+
+def main(args):
+    now = time.time()
+    tasks = make_tasks(args.tasks, now, args.repeating)
+    engine = ReminderEngine()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    for task in tasks:
+        if "repeat" in task:
+            engine.schedule_repeating(task, now)
+        else:
+            engine.schedule_once(task, now)
+    insert_s = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    mem = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    tracemalloc.stop()
+    pending = len(engine)
+
+    # отмена 10% задач
+    cancel_ids = random.Random(1).sample(range(args.tasks), args.tasks // 10)
+    started = time.perf_counter()
+    for task_id in cancel_ids:
+        engine.cancel(task_id)
+    cancel_s = time.perf_counter() - started
+
+    # "прокручиваем" сутки: разбираем всё, что сработало бы за 24 часа
+    started = time.perf_counter()
+    fired = len(engine.pop_due(now + 24 * 3600))
+    fire_s = time.perf_counter() - started
+
+    print(json.dumps({
+        "tasks": args.tasks,
+        "pending_reminders": pending,
+        "bytes_per_reminder": mem / pending if pending else 0,
+        "insert_per_s": pending / insert_s,
+        "cancel_tasks_per_s": len(cancel_ids) / cancel_s,
+        "fired_24h": fired,
+        "fire_per_s": fired / fire_s if fire_s else 0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--repeating", type=float, default=0.3)
+    main(parser.parse_args())
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import SqliteTaskStore
+from reminders import ReminderEngine, ReminderWindow
+
+# Время холодного старта: ленивое окно против полной загрузки.
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def fill_store(store, n, now, repeating_share):
+    rnd = random.Random(7)
+    batch = []
+    for i in range(n):
+        chat_id = rnd.randint(1, max(1, n // 20))
+        if rnd.random() < repeating_share:
+            batch.append({"chat_id": chat_id, "text": f"повтор {i}",
+                          "time": f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}",
+                          "repeat": rnd.sample(DAYS, rnd.randint(1, 7))})
+        else:
+            # год истории и полгода будущего
+            due = now + rnd.randint(-365 * 86400, 180 * 86400)
+            batch.append({"chat_id": chat_id, "text": f"задача {i}",
+                          "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(due))})
+        if len(batch) == 10000:
+            store.add_many(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+
+
+def measure(path, lazy, horizon):
+    started = time.perf_counter()
+    store = SqliteTaskStore(path)
+    engine = ReminderEngine()
+    window = ReminderWindow(store, engine, horizon=horizon, lazy=lazy)
+    loaded = window.load_initial()
+    elapsed = time.perf_counter() - started
+    result = {"startup_ms": elapsed * 1000, "tasks_loaded": loaded, "pending_reminders": len(engine)}
+    if lazy:
+        # одна фоновая подгрузка следующего куска окна
+        started = time.perf_counter()
+        result["refill_tasks"] = window.refill(time.time() + window.refill_every)
+        result["refill_ms"] = (time.perf_counter() - started) * 1000
+    store.close()
+    return result
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tasks.db")
+        store = SqliteTaskStore(path)
+        fill_store(store, args.tasks, time.time(), args.repeating)
+        store.close()
+        report = {
+            "tasks": args.tasks,
+            "eager": measure(path, False, args.horizon_hours * 3600),
+            "lazy": measure(path, True, args.horizon_hours * 3600),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=200000)
+    parser.add_argument("--repeating", type=float, default=0.02)
+    parser.add_argument("--horizon-hours", type=float, default=24)
+    main(parser.parse_args())
@@ -0,0 +1,136 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_openai import FakeOpenAI
+from llm_client import percentile
+
+# Разбор фразы через GPT: прежний промпт-инструкция (gpt-4, JSON в тексте
+# ответа) против вызова функции с коротким промптом — на одной модели и
+# лестницей «дешёвая -> gpt-4». Дешёвая модель у фейкового сервера быстрее,
+# но часть ответов портит (--cheap-invalid) — такие уходят на gpt-4.
+# Токены — из usage ответов (LLMClient.models), как в /stats.
+#
+#   python bench/bench_structured.py --messages 400 --cheap-invalid 0.05
+
+SINGLE_RE = re.compile(r"Фраза: (.*)$", re.M)
+CHEAP = "gpt-3.5-turbo"
+STRONG = "gpt-4"
+
+
+def answer(phrase):
+    k = sum(map(ord, phrase)) % 600
+    return {"text": phrase, "time": f"2030-01-01T{10 + k // 60:02d}:{k % 60:02d}:00"}
+
+
+def make_responder(args, rnd):
+    def responder(body):
+        phrase = SINGLE_RE.search(body["messages"][-1]["content"]).group(1)
+        result = answer(phrase)
+        if body.get("model") == CHEAP and rnd.random() < args.cheap_invalid:
+            result["time"] = "завтра утром"  # не дата — не пройдёт проверку
+        return json.dumps(result, ensure_ascii=False)
+    return responder
+
+
+async def drive(parse, args):
+    latencies, wrong = [], 0
+    tz = datetime.now().astimezone().tzinfo
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        nonlocal wrong
+        phrase = f"дело номер {i} когда-нибудь"
+        async with semaphore:
+            started = time.perf_counter()
+            result = await parse(phrase, datetime.now(tz))
+            latencies.append(time.perf_counter() - started)
+        wrong += not isinstance(result, dict) or result != answer(phrase)
+
+    await asyncio.gather(*(one(i) for i in range(args.messages)))
+    return latencies, wrong
+
+
+def usage_delta(llm, before):
+    # -> (запросов, токенов промпта, токенов ответа) с момента before
+    totals = [0, 0, 0]
+    for model, usage in llm.models.items():
+        was = before.get(model, (0, 0, 0))
+        now = (usage.calls, usage.prompt_tokens, usage.completion_tokens)
+        totals = [t + n - w for t, n, w in zip(totals, now, was)]
+    return totals
+
+
+async def main(args):
+    server = FakeOpenAI(delay=args.strong_delay, jitter=args.jitter,
+                        responder=make_responder(args, random.Random(args.seed)),
+                        model_delays={CHEAP: args.cheap_delay}, chars_per_token=args.chars_per_token)
+    url = await server.start(port=args.port)
+    os.environ.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": url,
+        "TASK_STORE": f"sqlite:{os.path.join(tempfile.mkdtemp(prefix='structured-'), 'tasks.db')}",
+        "OUTBOX_PATH": "",
+        "ARCHIVE_PATH": "",
+        "METRICS_PORT": "",
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+        "LLM_MAX_QUEUE": "100000",
+    })
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import assistant_bot as bot
+    from gpt_extract import StructuredParser
+
+    configs = [
+        ("legacy_prompt", lambda text, now: bot.ask_gpt(bot.gpt_prompt(text, now)), None),
+        ("structured_gpt4", None, StructuredParser(bot.llm, [STRONG])),
+        ("structured_ladder", None, StructuredParser(bot.llm, [CHEAP, STRONG])),
+    ]
+    report = {}
+    for name, parse, structured in configs:
+        parse = parse or structured.parse_one
+        before = {m: (u.calls, u.prompt_tokens, u.completion_tokens) for m, u in bot.llm.models.items()}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            latencies, wrong = await drive(parse, args)
+        calls, prompt_tokens, completion_tokens = usage_delta(bot.llm, before)
+        n = args.messages
+        row = {
+            "messages": n,
+            "wrong": wrong,
+            "llm_calls_per_msg": round(calls / n, 3),
+            "prompt_tokens_per_msg": round(prompt_tokens / n, 1),
+            "completion_tokens_per_msg": round(completion_tokens / n, 1),
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        }
+        if structured:
+            s = structured.stats()
+            row.update(escalation_rate=round(s["escalations"] / n, 3), invalid=s["invalid"])
+        report[name] = row
+    await server.stop()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cheap-delay", type=float, default=0.15, help="задержка дешёвой модели")
+    parser.add_argument("--strong-delay", type=float, default=0.6, help="задержка gpt-4")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--cheap-invalid", type=float, default=0.05, help="доля испорченных ответов дешёвой модели")
+    parser.add_argument("--chars-per-token", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18491)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import SqliteTaskStore
+from task_model import Task, DAY_NAMES
+from recurrence import DEFAULT_TZ, zone
+
+# Задачи в памяти: словари с ISO-временем (как раньше) против task_model.Task.
+# Считаем байты на задачу (tracemalloc) и время загрузки всех задач из базы:
+# раньше — словари и разбор ISO/дней на каждой задаче, теперь — готовые
+# столбцы due_at и mask. Для сравнения — загрузка того же из JSON (импорт).
+#
+#   python bench/bench_task_model.py --tasks 1000000
+
+
+def fill(store, n, chats, rnd):
+    # тексты часто повторяются («позвонить маме»), часть — уникальные
+    phrases = [f"типовое дело {i}" for i in range(5000)]
+    now = time.time()
+    batch = []
+    for i in range(n):
+        text = rnd.choice(phrases) if rnd.random() < 0.7 else f"задача {i}"
+        chat_id = rnd.randint(1, chats)
+        if rnd.random() < 0.1:
+            batch.append({"chat_id": chat_id, "text": text,
+                          "time": f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}",
+                          "repeat": rnd.sample(DAY_NAMES, rnd.randint(1, 7))})
+        else:
+            due = now + rnd.randint(60, 90 * 86400)
+            batch.append({"chat_id": chat_id, "text": text,
+                          "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(due))})
+        if len(batch) == 50000:
+            store.add_many(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+
+
+def load_dicts(store):
+    # прежний путь: словари из базы, время и дни разбираются при каждом обращении
+    tasks = store.all_tasks()
+    tz = zone(DEFAULT_TZ)
+    for task in tasks:
+        Task.from_dict(task, tz)
+    return tasks
+
+
+def load_records(store):
+    return store.repeating_records() + store.due_records(float("-inf"), float("inf"))
+
+
+def load_json(path):
+    tz = zone(DEFAULT_TZ)
+    with open(path) as f:
+        return [Task.from_dict(t, tz) for t in json.load(f)]
+
+
+def timed(load, *args):
+    started = time.perf_counter()
+    result = load(*args)
+    return time.perf_counter() - started, result
+
+
+def held_bytes(load, *args):
+    tracemalloc.start()
+    result = load(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, len(result)
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="task-model-")
+    store = SqliteTaskStore(os.path.join(workdir, "tasks.db"))
+    started = time.perf_counter()
+    fill(store, args.tasks, args.chats, random.Random(args.seed))
+    fill_s = time.perf_counter() - started
+    json_path = os.path.join(workdir, "tasks.json")
+    with open(json_path, "w") as f:
+        json.dump(store.all_tasks(), f)
+
+    report = {"tasks": args.tasks, "fill_s": round(fill_s, 1)}
+    # словари без разбора — только то, что раньше лежало в памяти
+    for name, load in (("dicts", store.all_tasks), ("records", lambda: load_records(store))):
+        size, count = held_bytes(load)
+        report[f"{name}_bytes_per_task"] = round(size / count)
+    for name, load, arg in (("dicts", load_dicts, store), ("records", load_records, store),
+                            ("json", load_json, json_path)):
+        best = min(timed(load, arg)[0] for _ in range(args.repeat))
+        report[f"{name}_load_s"] = round(best, 2)
+    report["db_bytes"] = os.path.getsize(store.path)
+    report["json_bytes"] = os.path.getsize(json_path)
+    store.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=2, help="прогонов загрузки, берём лучший")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
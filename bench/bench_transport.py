@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from fake_bot_api import FakeBotAPI
+from llm_client import percentile
+from webhook import WebhookServer
+
+# Сквозная задержка обновления: от появления сообщения у "Telegram" до
+# ответа бота. Сравниваем run_polling-подобный режим и webhook.
+
+
+def build_app(base_url, work_ms, webhook):
+    async def pong(update, context):
+        await asyncio.sleep(work_ms / 1000)  # имитация работы обработчика
+        await context.bot.send_message(update.effective_chat.id, update.message.text.replace("ping", "pong"))
+
+    builder = ApplicationBuilder().token("123:FAKE").base_url(base_url)
+    if webhook:
+        builder = builder.updater(None)
+    app = builder.build()
+    app.add_handler(MessageHandler(filters.TEXT, pong))
+    return app
+
+
+async def run_mode(mode, args):
+    server = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=0)
+    base_url = await server.start(port=args.port)
+    app = build_app(base_url, args.work_ms, mode == "webhook")
+    await app.initialize()
+
+    sent_at = {}
+    if mode == "polling":
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+        await app.start()
+
+        async def deliver(i, chat_id):
+            sent_at[i] = time.monotonic()
+            server.inject_message(chat_id, f"ping {i}")
+    else:
+        hook = WebhookServer(app, listen="127.0.0.1", port=args.port + 1, workers=args.workers)
+        await app.start()
+        await hook.start()
+        session = aiohttp.ClientSession()
+        url = f"http://127.0.0.1:{args.port + 1}/telegram"
+
+        async def deliver(i, chat_id):
+            sent_at[i] = time.monotonic()
+            await session.post(url, json=FakeBotAPI.make_message_update(i, chat_id, f"ping {i}"))
+
+    started = time.monotonic()
+    posts = []
+    for i in range(1, args.updates + 1):
+        posts.append(asyncio.create_task(deliver(i, i % args.chats + 1)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*posts)
+
+    deadline = time.monotonic() + args.timeout
+    while len(server.messages) < args.updates and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+
+    latencies = []
+    order_ok = True
+    last_by_chat = {}
+    for t, chat_id, text in server.messages:
+        i = int(text.split()[1])
+        latencies.append(t - sent_at[i])
+        if last_by_chat.get(chat_id, 0) > i:
+            order_ok = False
+        last_by_chat[chat_id] = i
+
+    if mode == "polling":
+        await app.updater.stop()
+    else:
+        await hook.stop()
+        await session.close()
+    await app.stop()
+    await app.shutdown()
+    await server.stop()
+    return {
+        "answered": len(latencies),
+        "elapsed_s": elapsed,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_max_ms": max(latencies, default=0) * 1000,
+        "per_chat_order_preserved": order_ok,
+    }
+
+
+async def main(args):
+    report = {"updates": args.updates, "rate_per_s": args.rate, "work_ms": args.work_ms}
+    for mode in ("polling", "webhook"):
+        report[mode] = await run_mode(mode, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=100, help="обновлений в секунду")
+    parser.add_argument("--work-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--port", type=int, default=8090)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from admission import AdmissionControl, PARSE
+from dispatcher import OutboundDispatcher
+from webhook import UpdateWorkerPool
+
+# Счётчик принятых фраз (AdmissionControl.pending) не должен утекать: после
+# отменённого submit и остановки пула с полными ящиками он возвращается к нулю,
+# иначе допуск со временем отбрасывает все фразы как «pending». И ответ «занят»
+# не должен стоять в очереди напоминаний.
+#
+#   python bench/check_admission.py
+
+
+def make_pool(process, queue_size=1):
+    admission = AdmissionControl(lambda update: PARSE, chat_rate=0, global_rate=0, max_pending=100,
+                                 reserved_workers=0)
+    pool = UpdateWorkerPool(process, workers=2, queue_size=queue_size, key=lambda update: update[0],
+                            admission=admission)
+    pool.start()
+    return pool, admission
+
+
+async def check_cancelled_submit():
+    failures = []
+    hold = asyncio.Event()
+    pool, admission = make_pool(lambda update: hold.wait())
+    await pool.submit((1, "a"))  # обрабатывается и висит
+    await asyncio.sleep(0)
+    await pool.submit((1, "b"))  # лежит в ящике
+    waiting = asyncio.create_task(pool.submit((1, "c")))  # ждёт места в ящике
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    if admission.pending != 2:
+        failures.append(f"после отменённого submit pending={admission.pending}, ждали 2")
+    hold.set()
+    await pool.drain(timeout=5)
+    if admission.pending != 0:
+        failures.append(f"после drain pending={admission.pending}, ждали 0")
+    await pool.stop()
+    return failures
+
+
+async def check_stop_with_items():
+    failures = []
+    pool, admission = make_pool(lambda update: asyncio.sleep(3600), queue_size=10)
+    for chat_id in (1, 2):
+        for i in range(3):
+            await pool.submit((chat_id, i))
+    await asyncio.sleep(0.01)
+    await pool.stop()
+    if admission.pending != 0 or pool.pending() != 0:
+        failures.append(f"после stop pending: допуск {admission.pending}, пул {pool.pending()}, ждали 0 и 0")
+    return failures
+
+
+async def check_notice_lane():
+    failures = []
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append(text)
+        await asyncio.sleep(0.05)
+
+    outbound = OutboundDispatcher(chat_rate=100, chat_burst=100, coalesce_window=0, workers=1)
+    outbound.start(send)
+    for i in range(20):
+        outbound.submit(i, f"напоминание {i}")
+    await asyncio.sleep(0)
+    if not outbound.notify(99, "занят"):
+        failures.append("notify не отправил ответ при свободных лимитах")
+    await asyncio.sleep(0.02)
+    if "занят" not in sent:
+        failures.append(f"«занят» ждёт очереди напоминаний: отправлено {sent}")
+    if outbound.queued() > 20:
+        failures.append("«занят» попал в очередь напоминаний")
+    await outbound.stop()
+    return failures
+
+
+CHECKS = {
+    "cancelled_submit": check_cancelled_submit,
+    "stop_with_items": check_stop_with_items,
+    "notice_lane": check_notice_lane,
+}
+
+
+async def main():
+    failures = {name: await check() for name, check in CHECKS.items()}
+    return {name: f for name, f in failures.items() if f}
+
+
+if __name__ == "__main__":
+    failures = asyncio.run(main())
+    print(json.dumps({"checked": list(CHECKS), "failures": failures}, indent=2, ensure_ascii=False))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from recurrence import zone, resolve_local, Recurrence, recurrence
+
+# Случайные проверки свойств часовых поясов и повторений. Эталон — stdlib
+# zoneinfo с fold=0: в "дыре" это сдвиг вперёд, в "нахлёсте" — первое из двух,
+# то есть те же правила, что у resolve_local. Время выбирается в основном
+# рядом с переводами часов, где ошибки и живут.
+
+YEARS = (2024, 2031)
+
+
+def oracle_ts(name, naive):
+    from zoneinfo import ZoneInfo
+    return naive.replace(tzinfo=ZoneInfo(name), fold=0).timestamp()
+
+
+def transitions(name):
+    tz = zone(name)
+    result = []
+    for t in getattr(tz, "_utc_transition_times", []):
+        if YEARS[0] <= t.year < YEARS[1]:
+            result.append(t.replace(tzinfo=timezone.utc).timestamp())
+    return result
+
+
+def same_data(name):
+    # у pytz и системной tzdata могут быть разные версии правил — такие пояса не сравниваем
+    from zoneinfo import ZoneInfo
+    tz, ref = zone(name), ZoneInfo(name)
+    points = transitions(name)
+    probes = [p + d for p in points for d in (-3600, 3600)]
+    probes += [datetime(y, m, 15, tzinfo=timezone.utc).timestamp() for y in range(*YEARS) for m in range(1, 13)]
+    for ts in probes:
+        utc = datetime.fromtimestamp(ts, timezone.utc)
+        if utc.astimezone(tz).utcoffset() != utc.astimezone(ref).utcoffset():
+            return False
+    return True
+
+
+def random_naive(rnd, name, cache):
+    points = cache.setdefault(name, transitions(name))
+    if points and rnd.random() < 0.7:
+        # рядом с переводом часов, с шагом в минуты
+        ts = rnd.choice(points) + rnd.randint(-3 * 3600, 3 * 3600)
+        local = datetime.fromtimestamp(ts, timezone.utc) + timedelta(hours=rnd.randint(-3, 14))
+    else:
+        local = datetime(rnd.randint(YEARS[0], YEARS[1] - 1), rnd.randint(1, 12), rnd.randint(1, 28))
+        local += timedelta(minutes=rnd.randint(0, 24 * 60 - 1))
+    return local.replace(tzinfo=None, second=0, microsecond=0)
+
+
+def expected_occurrences(name, hour, minute, mask, after_ts, until_ts):
+    # перебором по дням: все срабатывания в (after_ts, until_ts]
+    tz = zone(name)
+    day = datetime.fromtimestamp(after_ts, tz).date() - timedelta(days=1)
+    result = []
+    while True:
+        if mask & (1 << day.weekday()):
+            ts = oracle_ts(name, datetime(day.year, day.month, day.day, hour, minute))
+            if ts > until_ts:
+                break
+            if ts > after_ts:
+                result.append(ts)
+        elif datetime(day.year, day.month, day.day).timestamp() > until_ts + 3 * 86400:
+            break
+        day += timedelta(days=1)
+    return result
+
+
+def check(args):
+    from zoneinfo import available_timezones
+    rnd = random.Random(args.seed)
+    common = sorted(set(pytz.all_timezones) & available_timezones())
+    names = [n for n in common if same_data(n)]
+    # пояса с переводами часов проверяем чаще
+    dst_names = [n for n in names if transitions(n)]
+    cache = {}
+    failures = []
+    counts = {"zones": len(names), "zones_skipped_tzdata_mismatch": len(common) - len(names),
+              "localize": 0, "occurrences": 0, "sequences": 0, "shared_cache": 0}
+
+    def fail(kind, **details):
+        if len(failures) < 20:
+            failures.append(dict(kind=kind, **details))
+
+    for _ in range(args.iterations):
+        name = rnd.choice(dst_names if rnd.random() < 0.8 else names)
+        tz = zone(name)
+
+        # 1. локальное время -> UTC совпадает с эталоном (и в дыре, и в нахлёсте)
+        naive = random_naive(rnd, name, cache)
+        counts["localize"] += 1
+        got = resolve_local(tz, naive).timestamp()
+        want = oracle_ts(name, naive)
+        if got != want:
+            fail("localize", zone=name, local=naive.isoformat(), got=got, want=want)
+
+        # 2. следующее срабатывание: позже after, по нужным дням и без пропусков
+        hour, minute = naive.hour, naive.minute
+        mask = rnd.randint(1, 127)
+        after = oracle_ts(name, random_naive(rnd, name, cache)) + rnd.choice([-1, 0, 1, 59])
+        rule = Recurrence(tz, hour, minute, mask, count=rnd.randint(1, 16))
+        n = rnd.randint(1, 12)
+        got_list = rule.upcoming(after, n)
+        counts["occurrences"] += len(got_list)
+        counts["sequences"] += 1
+        want_list = expected_occurrences(name, hour, minute, mask, after, got_list[-1])[:n] if got_list else []
+        if got_list != want_list:
+            fail("upcoming", zone=name, hour=hour, minute=minute, mask=mask, after=after,
+                 got=got_list[:4], want=want_list[:4])
+        if any(b <= a for a, b in zip(got_list, got_list[1:])):
+            fail("not_increasing", zone=name, got=got_list)
+        for ts in got_list:
+            local = datetime.fromtimestamp(ts, tz)
+            if not mask & (1 << local.date().weekday()) and (local.hour, local.minute) == (hour, minute):
+                fail("weekday", zone=name, local=local.isoformat(), mask=mask)
+
+        # 3. общий кэш правила отвечает так же, как свежий расчёт, при запросах вразнобой
+        shared = recurrence(tz, hour, minute, mask)
+        for _ in range(3):
+            ts = after + rnd.randint(-10 * 86400, 30 * 86400)
+            counts["shared_cache"] += 1
+            if shared.after(ts) != Recurrence(tz, hour, minute, mask).after(ts):
+                fail("shared_cache", zone=name, hour=hour, minute=minute, mask=mask, ts=ts)
+
+    return counts, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    counts, failures = check(args)
+    print(json.dumps({"seed": args.seed, "checked": counts, "failures": failures}, indent=2, default=str))
+    sys.exit(1 if failures else 0)
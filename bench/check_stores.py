@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_store import JsonTaskStore, SqliteTaskStore
+
+# Проверки хранилищ, которые переживают перезапуск: то, что прочитано
+# одним экземпляром, должно так же читаться следующим.
+#
+#   python bench/check_stores.py
+
+
+def check_legacy_json_ids(workdir):
+    # старый tasks.json без id: id выдаются один раз и не меняются между чтениями
+    path = os.path.join(workdir, "legacy.json")
+    with open(path, "w") as f:
+        json.dump([{"chat_id": 1, "text": "a", "time": "2030-01-01T10:00:00"},
+                   {"chat_id": 1, "text": "b", "time": "2030-01-02T10:00:00"}], f)
+    failures = []
+    first = [t["id"] for t in JsonTaskStore(path).all_tasks()]
+    second = [t["id"] for t in JsonTaskStore(path).all_tasks()]
+    store = JsonTaskStore(path)
+    again = [t["id"] for t in store.all_tasks()]
+    if not first == second == again:
+        failures.append(f"id меняются между чтениями: {first} {second} {again}")
+    if not store.delete(first[0]):
+        failures.append(f"delete({first[0]}) не нашёл задачу")
+    left = [t["id"] for t in JsonTaskStore(path).all_tasks()]
+    if left != first[1:]:
+        failures.append(f"после delete осталось {left}, ждали {first[1:]}")
+    return failures
+
+
+def check_offsets_reload(workdir):
+    # свои минуты напоминаний задачи переживают перезапуск в обоих хранилищах
+    failures = []
+    tasks = [
+        {"chat_id": 1, "text": "разовая", "time": "2030-01-01T10:00:00", "offsets": [60, 5]},
+        {"chat_id": 1, "text": "повтор", "time": "09:30", "repeat": ["Monday", "Friday"], "offsets": [10]},
+        {"chat_id": 1, "text": "общие", "time": "2030-01-02T10:00:00"},
+    ]
+    want = [[60, 5], [10], None]
+    for name, make in (("json", lambda: JsonTaskStore(os.path.join(workdir, "offsets.json"))),
+                       ("sqlite", lambda: SqliteTaskStore(os.path.join(workdir, "offsets.db")))):
+        store = make()
+        store.add_many(tasks)
+        store.close()
+        store = make()
+        got = [t.get("offsets") for t in store.all_tasks()]
+        if got != want:
+            failures.append(f"{name}: all_tasks после перезапуска {got}, ждали {want}")
+        got = [t.offsets for t in store.chat_records(1)]
+        if got != want:
+            failures.append(f"{name}: chat_records после перезапуска {got}, ждали {want}")
+        store.close()
+    return failures
+
+
+CHECKS = {
+    "legacy_json_ids": check_legacy_json_ids,
+    "offsets_reload": check_offsets_reload,
+}
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp(prefix="check-stores-")
+    failures = {name: check(workdir) for name, check in CHECKS.items()}
+    failures = {name: f for name, f in failures.items() if f}
+    print(json.dumps({"checked": list(CHECKS), "failures": failures}, indent=2, ensure_ascii=False))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,143 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI
+from task_store import SqliteTaskStore
+
+# Проверка журнала напоминаний падениями. Настоящий бот (polling) против
+# фейкового Bot API: в базе задачи, срабатывающие в ближайшие --span секунд.
+# Бота раз за разом убиваем SIGKILL в случайный момент, держим выключенным
+# и запускаем снова. В конце сверяем: каждое напоминание должно дойти хотя
+# бы раз, повторы допустимы (at-least-once), но их должно быть мало.
+#
+#   python bench/crash_outbox.py --tasks 600 --span 30
+#
+# Для сравнения тот же сценарий прогоняется без журнала (OUTBOX_PATH=) —
+# там всё, что сработало во время простоя или не успело уйти, теряется.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TASK_RE = re.compile(r"задача (\d+)")
+
+
+def fill(path, tasks, chats, start, span, rnd):
+    store = SqliteTaskStore(path)
+    batch = []
+    for i in range(tasks):
+        due = start + span * rnd.random()
+        batch.append({"chat_id": rnd.randint(1, chats), "text": f"задача {i}",
+                      "time": datetime.fromtimestamp(due, timezone.utc).isoformat(timespec="seconds")})
+    store.add_many(batch)
+    store.close()
+
+
+def start_bot(args, workdir, outbox, log):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+        "TASK_STORE": f"sqlite:{os.path.join(workdir, 'tasks.db')}",
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.db") if outbox else "",
+        "REMINDER_OFFSETS": "0",
+        "REMINDER_CATCHUP_SEND": str(args.catchup_send),
+        "SEND_GLOBAL_RATE": "1000",
+        "SEND_CHAT_RATE": "100",
+        "PARSE_CACHE_PATH": "",
+        "METRICS_PORT": "",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "assistant_bot.py")],
+                            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def run(args, outbox):
+    rnd = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="crash-outbox-")
+    api = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=args.send_delay)
+    await api.start(port=args.port)
+    start = time.time() + args.warmup
+    fill(os.path.join(workdir, "tasks.db"), args.tasks, args.chats, start, args.span, rnd)
+
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    kills = 0
+    deadline = start + args.span
+    while time.time() < deadline:
+        bot = start_bot(args, workdir, outbox, log)
+        await asyncio.sleep(rnd.uniform(args.min_up, args.max_up))
+        if time.time() >= deadline:
+            break
+        bot.kill()  # SIGKILL: ни on_shutdown, ни последней записи журнала
+        bot.wait()
+        kills += 1
+        await asyncio.sleep(rnd.uniform(args.min_down, args.max_down))
+    else:
+        bot = start_bot(args, workdir, outbox, log)
+
+    # последний запуск дорабатывает до конца и останавливается штатно
+    until = max(time.time(), deadline) + args.settle
+    while time.time() < until and bot.poll() is None:
+        await asyncio.sleep(0.2)
+    bot.send_signal(signal.SIGTERM)
+    try:
+        bot.wait(30)
+    except subprocess.TimeoutExpired:
+        bot.kill()
+    await api.stop()
+
+    counts = {}
+    for _, _, text in api.messages:
+        for k in TASK_RE.findall(text):
+            counts[int(k)] = counts.get(int(k), 0) + 1
+    lost = sum(1 for i in range(args.tasks) if i not in counts)
+    return {
+        "outbox": outbox,
+        "tasks": args.tasks,
+        "kills": kills,
+        "delivered": len(counts),
+        "lost": lost,
+        "duplicates": sum(c - 1 for c in counts.values()),
+        "messages": len(api.messages),
+        "catchup_summaries": sum(1 for _, _, text in api.messages if text.startswith("📭")),
+        "workdir": workdir,
+    }
+
+
+async def main(args):
+    report = {"with_outbox": await run(args, outbox=True)}
+    if not args.skip_baseline:
+        report["without_outbox"] = await run(args, outbox=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(0 if report["with_outbox"]["lost"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=600)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--span", type=float, default=30, help="за сколько секунд срабатывают все задачи")
+    parser.add_argument("--warmup", type=float, default=3, help="через сколько секунд первая задача")
+    parser.add_argument("--min-up", type=float, default=2)
+    parser.add_argument("--max-up", type=float, default=5)
+    parser.add_argument("--min-down", type=float, default=0.5)
+    parser.add_argument("--max-down", type=float, default=3)
+    parser.add_argument("--settle", type=float, default=8, help="сколько ждать после последнего срока")
+    parser.add_argument("--send-delay", type=float, default=0.005, help="задержка фейкового sendMessage")
+    parser.add_argument("--catchup-send", type=float, default=600,
+                        help="REMINDER_CATCHUP_SEND: опоздавшие дольше уходят сводкой")
+    parser.add_argument("--port", type=int, default=18381)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-baseline", action="store_true")
+    asyncio.run(main(parser.parse_args()))
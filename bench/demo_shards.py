@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from datetime import datetime
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI
+from task_store import SqliteTaskStore
+
+# Несколько воркеров (BOT_MODE=shard) и роутер на одной машине против
+# фейкового Bot API. По ходу один воркер падает (SIGKILL), другой
+# останавливается штатно, третий добавляется — проверяем, что каждое
+# напоминание пришло ровно один раз, а на каждое сообщение ответил бот.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def spawn(args, env, workdir, name):
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    return subprocess.Popen([sys.executable] + args, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def base_env(args, workdir, api_url):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "TELEGRAM_API_URL": api_url,
+        "TASK_STORE": f"sqlite:{os.path.join(workdir, 'tasks.db')}",
+        "SHARD_TTL": str(args.ttl),
+        "SHARD_INTERVAL": str(args.interval),
+        "SHARD_SECRET": "demo-secret",
+        "REMINDER_OFFSETS": "0",
+        "PARSE_CACHE_PATH": "",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def start_worker(args, workdir, api_url, n):
+    env = base_env(args, workdir, api_url)
+    env.update({"BOT_MODE": "shard", "SHARD_ID": f"w{n}", "WEBHOOK_LISTEN": "127.0.0.1",
+                "WEBHOOK_PORT": str(args.port + n), "OUTBOX_PATH": os.path.join(workdir, f"outbox-w{n}.db"),
+                "ARCHIVE_PATH": os.path.join(workdir, "archive.db")})
+    return spawn([os.path.join(ROOT, "assistant_bot.py")], env, workdir, f"w{n}")
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="shards-")
+    server = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=0)
+    await server.start(port=args.port)
+    api_url = f"http://127.0.0.1:{args.port}"
+
+    # задачи кладём прямо в общее хранилище: сработают в ближайшие duration секунд
+    store = SqliteTaskStore(os.path.join(workdir, "tasks.db"))
+    tz = pytz.timezone("Europe/Tallinn")
+    started = time.time()
+    first = started + 10
+    step = (args.duration - 15) / args.tasks
+    store.add_many([{
+        "chat_id": i % args.chats + 1,
+        "text": f"задача {i}",
+        "time": datetime.fromtimestamp(first + i * step, tz).replace(tzinfo=None).isoformat(timespec="seconds"),
+    } for i in range(args.tasks)])
+
+    router = spawn([os.path.join(ROOT, "sharding.py"), "router"], base_env(args, workdir, api_url), workdir, "router")
+    workers = {n: start_worker(args, workdir, api_url, n) for n in range(1, args.workers + 1)}
+    events = []
+
+    async def at(offset, label, action):
+        await asyncio.sleep(max(0.0, started + offset - time.time()))
+        events.append((round(time.time() - started, 1), label))
+        action()
+
+    def kill(n):
+        workers[n].send_signal(signal.SIGKILL)
+
+    def term(n):
+        workers[n].send_signal(signal.SIGTERM)
+
+    def add(n):
+        workers[n] = start_worker(args, workdir, api_url, n)
+
+    def chat(k):
+        # входящие сообщения во время перебалансировок: их должен обработать владелец
+        # (фраза разбирается локально, без GPT)
+        for chat_id in range(1, args.chats + 1):
+            server.inject_message(chat_id, f"напомни завтра в 10:00 купить {k}")
+
+    new = args.workers + 1
+    await asyncio.gather(
+        at(8, "сообщения 1", lambda: chat("хлеб")),
+        at(args.duration * 0.3, "SIGKILL w1", lambda: kill(1)),
+        at(args.duration * 0.45, "сообщения 2", lambda: chat("молоко")),
+        at(args.duration * 0.55, f"новый воркер w{new}", lambda: add(new)),
+        at(args.duration * 0.7, "SIGTERM w2", lambda: term(2)),
+        at(args.duration * 0.75, "сообщения 3", lambda: chat("сыр")),
+        at(args.duration + 5, "конец", lambda: None),
+    )
+
+    for proc in list(workers.values()) + [router]:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+    for proc in list(workers.values()) + [router]:
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    await server.stop()
+
+    sent = Counter(text for _, _, text in server.messages if text.startswith("🔔"))
+    replies = sum(1 for _, _, text in server.messages if text.startswith("✅"))
+    print(json.dumps({
+        "workdir": workdir,
+        "events": events,
+        "reminders_expected": args.tasks,
+        "reminders_delivered": len(sent),
+        "reminders_duplicated": sum(1 for n in sent.values() if n > 1),
+        "reminders_missing": args.tasks - len(sent),
+        "messages_sent": args.chats * 3,
+        "messages_answered": replies,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--duration", type=float, default=60, help="секунд")
+    parser.add_argument("--ttl", type=float, default=4)
+    parser.add_argument("--interval", type=float, default=1)
+    parser.add_argument("--port", type=int, default=8300)
+    asyncio.run(main(parser.parse_args()))
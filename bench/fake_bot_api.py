@@ -0,0 +1,139 @@
+import sys
+import time
+import asyncio
+import argparse
+from collections import deque
+
+from aiohttp import web
+
+# Локальный сервер, изображающий Telegram Bot API с flood control.
+# Бот подключается через Bot(token, base_url="http://127.0.0.1:8081/bot").
+
+
+class FakeBotAPI:
+    def __init__(self, global_limit=30, chat_limit=3, delay=0.01):
+        # не больше global_limit сообщений в секунду на бота и chat_limit на чат
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.delay = delay
+        self.messages = []  # (time, chat_id, text)
+        self.rejected = 0
+        self._recent = deque()
+        self._recent_by_chat = {}
+        self._message_id = 0
+        self._update_id = 0
+        self._updates = None
+        self._runner = None
+
+    def inject_message(self, chat_id, text, user_id=None):
+        # входящее сообщение пользователя: уйдёт боту через getUpdates
+        self._update_id += 1
+        update = self.make_message_update(self._update_id, chat_id, text, user_id)
+        self._updates.put_nowait(update)
+        return update
+
+    @staticmethod
+    def make_message_update(update_id, chat_id, text, user_id=None):
+        message = {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id or chat_id, "is_bot": False, "first_name": "Тест"},
+        }
+        if text.startswith("/"):
+            # как у Telegram: без entity CommandHandler команду не узнает
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    async def _get_updates(self, data):
+        timeout = float(data.get("timeout") or 0)
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self._updates.get(), timeout))
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty() and len(batch) < 100:
+            batch.append(self._updates.get_nowait())
+        return batch
+
+    def _flooded(self, chat_id, now):
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        chat_recent = self._recent_by_chat.setdefault(chat_id, deque())
+        while chat_recent and now - chat_recent[0] > 1.0:
+            chat_recent.popleft()
+        if len(self._recent) >= self.global_limit or len(chat_recent) >= self.chat_limit:
+            return True
+        self._recent.append(now)
+        chat_recent.append(now)
+        return False
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(data)})
+        await asyncio.sleep(self.delay)
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Jarvis", "username": "jarvis_fake_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False,
+            }})
+        if method in ("deleteWebhook", "setWebhook", "setMyCommands", "answerCallbackQuery", "deleteMessage"):
+            return web.json_response({"ok": True, "result": True})
+        if method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            now = time.monotonic()
+            if self._flooded(chat_id, now):
+                self.rejected += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }, status=429)
+            self._message_id += 1
+            self.messages.append((now, chat_id, data.get("text", "")))
+            return web.json_response({"ok": True, "result": {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+            }})
+        return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+    async def start(self, host="127.0.0.1", port=8081):
+        self._updates = asyncio.Queue()
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Фейковый Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-limit", type=int, default=30)
+    parser.add_argument("--chat-limit", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    server = FakeBotAPI(args.global_limit, args.chat_limit)
+    url = await server.start(args.host, args.port)
+    print(f"Фейковый Bot API слушает {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
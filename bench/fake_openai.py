@@ -0,0 +1,131 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+# Локальный сервер, изображающий /v1/chat/completions.
+# Запуск:  python bench/fake_openai.py --port 8765 --delay 0.5
+# Бот:     OPENAI_API_BASE=http://127.0.0.1:8765/v1 python assistant_bot.py
+
+DEFAULT_REPLY = '{"text": "купить хлеб", "time": "2030-01-01T10:00:00"}'
+
+
+def default_responder(body):
+    return DEFAULT_REPLY
+
+
+def function_call_reply(body, reply):
+    # ответ в прежнем формате (JSON задачи или пачки с id) -> вызов функции из запроса
+    name = body["functions"][0]["name"]
+    items = json.loads(reply)
+    items = items if isinstance(items, list) else [items]
+    if name == "save_batch":
+        phrases = {}
+        for position, item in enumerate(items, 1):
+            item = dict(item)
+            phrases.setdefault(item.pop("id", position), []).append(item)
+        arguments = {"phrases": [{"id": i, "tasks": tasks} for i, tasks in phrases.items()]}
+    else:
+        arguments = {"tasks": items}
+    return {"function_call": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+
+class FakeOpenAI:
+    def __init__(self, delay=0.2, jitter=0.0, fail_rate=0.0, responder=default_responder, char_delay=0.0,
+                 model_delays=None, chars_per_token=3.0):
+        self.delay = delay
+        self.model_delays = model_delays or {}  # модель -> своя задержка вместо delay
+        self.chars_per_token = chars_per_token  # для usage: у кириллицы токен — 2-3 символа
+        self.char_delay = char_delay  # «генерация»: секунд на символ ответа
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.responder = responder
+        self.calls = 0
+        self.prompt_chars = 0
+        self.completion_chars = 0
+        self._runner = None
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls += 1
+        delay = self.model_delays.get(body.get("model"), self.delay)
+        prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        if body.get("functions"):
+            # схема функции тоже уходит в промпт
+            prompt_chars += len(json.dumps(body["functions"], ensure_ascii=False, separators=(",", ":")))
+        self.prompt_chars += prompt_chars
+        if self.fail_rate and random.random() < self.fail_rate:
+            await asyncio.sleep(delay + random.uniform(0, self.jitter))
+            return web.json_response({"error": {"message": "overloaded", "type": "server_error"}}, status=503)
+
+        reply = self.responder(body)
+        if body.get("functions") and isinstance(reply, str):
+            reply = function_call_reply(body, reply)
+        if isinstance(reply, str):
+            reply_chars = len(reply)
+        elif "function_call" in reply:
+            # модель генерирует только имя функции и аргументы
+            reply_chars = len(reply["function_call"]["name"]) + len(reply["function_call"]["arguments"])
+        else:
+            reply_chars = len(json.dumps(reply, ensure_ascii=False))
+        self.completion_chars += reply_chars
+        await asyncio.sleep(delay + random.uniform(0, self.jitter) + self.char_delay * reply_chars)
+        if isinstance(reply, dict):
+            # готовое сообщение (например, с function_call)
+            message = dict({"role": "assistant", "content": None}, **reply)
+        else:
+            message = {"role": "assistant", "content": reply}
+        prompt_tokens = round(prompt_chars / self.chars_per_token)
+        completion_tokens = round(reply_chars / self.chars_per_token)
+        return web.json_response({
+            "id": f"chatcmpl-fake-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    async def start(self, host="127.0.0.1", port=8765):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Фейковый сервер OpenAI chat completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--char-delay", type=float, default=0.0, help="секунд на символ ответа")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAI(args.delay, args.jitter, args.fail_rate, lambda body: args.reply, args.char_delay)
+    url = await server.start(args.host, args.port)
+    print(f"Фейковый OpenAI слушает {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,220 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI
+from fake_openai import FakeOpenAI
+from task_store import SqliteTaskStore
+from webhook import UpdateWorkerPool
+
+# Нагрузка из множества чатов сразу. Проверяем, что обработка обновлений
+# одного чата не перемешивается и ни одна запись не теряется.
+#
+# 1. В процессе: обработчик читает состояние чата, ждёт (как GPT) и пишет
+#    обратно. Без ящиков чатов записи теряются, с UpdateWorkerPool — нет.
+# 2. Настоящий бот (polling) против фейковых Bot API и OpenAI: в каждом чате
+#    вперемешку медленные задачи через GPT, быстрые локальные и /delete 1.
+#    Итоговый список задач каждого чата должен совпасть с последовательным
+#    выполнением, а ответы прийти в порядке сообщений.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class FakeUpdate:
+    __slots__ = ("chat_id", "update_id")
+
+    def __init__(self, chat_id, update_id):
+        self.chat_id = chat_id
+        self.update_id = update_id
+
+
+async def in_process(args, ordered):
+    # состояние: chat_id -> список номеров сообщений в порядке обработки
+    state = {}
+    rnd = random.Random(args.seed)
+
+    async def handle(update):
+        seen = list(state.get(update.chat_id, []))
+        await asyncio.sleep(rnd.random() * 0.002)  # «запрос к GPT» между чтением и записью
+        seen.append(update.update_id)
+        state[update.chat_id] = seen
+
+    sent = {}
+    started = time.perf_counter()
+    if ordered:
+        pool = UpdateWorkerPool(handle, args.workers, args.per_chat, key=lambda u: u.chat_id)
+        pool.start()
+    tasks = []
+    for i in range(args.updates):
+        chat_id = rnd.randint(1, args.chats)
+        sent.setdefault(chat_id, []).append(i)
+        update = FakeUpdate(chat_id, i)
+        if ordered:
+            await pool.submit(update)
+        else:
+            tasks.append(asyncio.create_task(handle(update)))
+    if ordered:
+        await pool.drain()
+        stats = pool.stats()
+        await pool.stop()
+    else:
+        await asyncio.gather(*tasks)
+        stats = {}
+    elapsed = time.perf_counter() - started
+
+    lost = sum(len(ids) - len(state.get(chat_id, [])) for chat_id, ids in sent.items())
+    reordered = sum(1 for chat_id, ids in sent.items() if state.get(chat_id) != ids and
+                    len(state.get(chat_id, [])) == len(ids))
+    report = {"updates": args.updates, "lost_writes": lost, "reordered_chats": reordered,
+              "updates_per_s": round(args.updates / elapsed)}
+    if stats:
+        report.update({k: stats[k] for k in ("max_depth", "blocked", "failed")})
+        report["wait_p95_ms"] = round(stats["wait_p95"] * 1000, 2)
+    return report
+
+
+def script_for(chat_id, steps, rnd):
+    # сообщения чата и ожидаемый итог при последовательной обработке
+    messages, expected = [], []
+    for k in range(steps):
+        minute = k % 60
+        when = f"2030-01-01T{10 + k // 60:02d}:{minute:02d}:00"
+        roll = rnd.random()
+        if roll < 0.2 and expected:
+            messages.append("/delete 1")
+            expected.remove(min(expected))
+        elif roll < 0.6:
+            messages.append(f"запиши дело #{k} когда удобно, чат {chat_id}")  # уйдёт в GPT
+            expected.append(when)
+        else:
+            messages.append(f"напомни 1 января 2030 в {10 + k // 60}:{minute:02d} купить хлеб")
+            expected.append(when)
+    return messages, sorted(expected)
+
+
+def gpt_answer(k):
+    return {"text": "купить хлеб", "time": f"2030-01-01T{10 + k // 60:02d}:{k % 60:02d}:00"}
+
+
+def gpt_reply(body):
+    text = body["messages"][-1]["content"]
+    items = re.findall(r"^(\d+)\. .*?#(\d+)", text, re.M)
+    if items:  # пачка фраз
+        return json.dumps([dict(gpt_answer(int(k)), id=int(i)) for i, k in items])
+    return json.dumps(gpt_answer(int(re.search(r"#(\d+)", text).group(1))))
+
+
+async def end_to_end(args, workers):
+    workdir = tempfile.mkdtemp(prefix="stress-")
+    api = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=0)
+    await api.start(port=args.port)
+    gpt = FakeOpenAI(delay=args.gpt_delay, jitter=args.gpt_delay, responder=gpt_reply)
+    gpt_url = await gpt.start(port=args.port + 1)
+
+    rnd = random.Random(args.seed)
+    scripts = {chat_id: script_for(chat_id, args.steps, rnd) for chat_id in range(1, args.chats + 1)}
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123:FAKE",
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": gpt_url,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+        "TASK_STORE": f"sqlite:{os.path.join(workdir, 'tasks.db')}",
+        "UPDATE_WORKERS": str(workers),
+        "LLM_MAX_CONCURRENCY": "64",
+        "LLM_MAX_QUEUE": "10000",
+        "PARSE_CACHE_PATH": "",
+        "ADMISSION": "0",  # проверяем порядок ответов, а не лимиты на фразы
+        "PYTHONUNBUFFERED": "1",
+    })
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, "assistant_bot.py")],
+                           cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    # сообщения чатов вперемешку, но в каждом чате — по порядку
+    queue = [(chat_id, i) for chat_id, (messages, _) in scripts.items() for i in range(len(messages))]
+    rnd.shuffle(queue)
+    next_step = {chat_id: 0 for chat_id in scripts}
+    started = time.time()
+    for chat_id, _ in queue:
+        api.inject_message(chat_id, scripts[chat_id][0][next_step[chat_id]])
+        next_step[chat_id] += 1
+
+    total = len(queue)
+    while sum(1 for _, chat_id, _ in api.messages if chat_id in scripts) < total:
+        if time.time() - started > args.timeout or bot.poll() is not None:
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.time() - started
+    bot.send_signal(signal.SIGTERM)
+    try:
+        bot.wait(30)
+    except subprocess.TimeoutExpired:
+        bot.kill()
+    await api.stop()
+    await gpt.stop()
+
+    store = SqliteTaskStore(os.path.join(workdir, "tasks.db"))
+    replies = {}
+    for _, chat_id, text in api.messages:
+        replies.setdefault(chat_id, []).append("delete" if text.startswith("🗑") or text.startswith("❗") else "add")
+    wrong_tasks = wrong_order = 0
+    for chat_id, (messages, expected) in scripts.items():
+        got = sorted(t["time"] for t in store.chat_tasks(chat_id))
+        wrong_tasks += got != expected
+        kinds = ["delete" if m.startswith("/delete") else "add" for m in messages]
+        wrong_order += replies.get(chat_id) != kinds
+    return {
+        "workers": workers,
+        "updates": total,
+        "answered": sum(len(r) for r in replies.values()),
+        "chats_with_wrong_tasks": wrong_tasks,
+        "chats_with_wrong_reply_order": wrong_order,
+        "gpt_calls": gpt.calls,
+        "seconds": round(elapsed, 2),
+        "updates_per_s": round(total / elapsed),
+        "workdir": workdir,
+    }
+
+
+async def main(args):
+    report = {
+        "in_process_unordered": await in_process(args, ordered=False),
+        "in_process_mailboxes": await in_process(args, ordered=True),
+    }
+    if not args.skip_bot:
+        report["bot_sequential"] = await end_to_end(args, workers=1)
+        report["bot_mailboxes"] = await end_to_end(args, workers=args.workers)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    ok = report["in_process_mailboxes"]["lost_writes"] == 0 and report["in_process_mailboxes"]["reordered_chats"] == 0
+    for key in ("bot_sequential", "bot_mailboxes"):
+        if key in report:
+            r = report[key]
+            ok = ok and r["answered"] == r["updates"] and not r["chats_with_wrong_tasks"] and not r["chats_with_wrong_reply_order"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000, help="обновлений в проверке в процессе")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=12, help="сообщений на чат у настоящего бота")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--per-chat", type=int, default=100, help="размер ящика чата")
+    parser.add_argument("--gpt-delay", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=18181)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-bot", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI
+from fake_openai import FakeOpenAI
+from bench_startup import fill_store, measure
+from llm_client import percentile
+from task_store import JsonTaskStore, SqliteTaskStore
+from reminders import ReminderEngine
+
+# Общий набор замеров с результатом в JSON, чтобы сравнивать прогоны между собой.
+#
+#   python bench/suite.py --out base.json                       # всё, 10k/100k/1M задач
+#   python bench/suite.py --scenarios parse,firing --compare base.json
+#
+# Сценарии:
+#   parse    — настоящие обработчики assistant_bot.py на синтетических Update
+#              против фейковых Bot API и OpenAI: локальный разбор, GPT, кэш, команды
+#   store    — хранилища на N задачах: заполнение, add, chat_tasks, окно due_between, delete
+#   startup  — холодный запуск процесса по фазам (--profile-startup) и восстановление
+#              напоминаний при старте (ленивое окно и полная загрузка)
+#   firing   — точность срабатывания напоминаний: цикл свободен и цикл занят обработчиками
+#   memory   — байт на ожидающее напоминание (разовое и повторяющееся)
+#
+# Ключи результатов: *_per_s — больше лучше; *_ms, *_us, *_bytes — меньше лучше.
+# --compare сравнивает с прошлым файлом и завершается с кодом 1 при регрессии.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCENARIOS = ("parse", "store", "startup", "firing", "memory")
+HIGHER_BETTER = ("_per_s",)
+LOWER_BETTER = ("_ms", "_us", "_bytes")
+
+
+def ms(values, q):
+    return round(percentile(values, q) * 1000, 3) if values else 0.0
+
+
+class Workdir:
+    # заполненные базы переиспользуются между сценариями store и startup
+    def __init__(self, path):
+        self.path = path
+        self._filled = {}
+
+    def filled(self, kind, n, repeating=0.02):
+        key = (kind, n)
+        if key not in self._filled:
+            path = os.path.join(self.path, f"tasks-{n}.{'db' if kind == 'sqlite' else 'json'}")
+            store = SqliteTaskStore(path) if kind == "sqlite" else JsonTaskStore(path)
+            started = time.perf_counter()
+            fill_store(store, n, time.time(), repeating)
+            self._filled[key] = (path, time.perf_counter() - started)
+            store.close()
+        return self._filled[key]
+
+
+# --- parse --------------------------------------------------------------------
+
+def gpt_reply(body):
+    text = body["messages"][-1]["content"]
+    k = sum(map(ord, text)) % 600
+    return json.dumps({"text": "купить хлеб", "time": f"2030-01-01T{10 + k // 60:02d}:{k % 60:02d}:00"})
+
+
+async def run_updates(app, updates):
+    from telegram import Update
+    latencies = []
+    started = time.perf_counter()
+    for data in updates:
+        update = Update.de_json(data, app.bot)
+        t0 = time.perf_counter()
+        await app.process_update(update)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": len(updates),
+        "msgs_per_s": round(len(updates) / elapsed, 1),
+        "latency_p50_ms": ms(latencies, 50),
+        "latency_p95_ms": ms(latencies, 95),
+    }
+
+
+async def scenario_parse(args, work):
+    api = FakeBotAPI(global_limit=10 ** 6, chat_limit=10 ** 6, delay=0)
+    api_url = await api.start(port=args.port)
+    gpt = FakeOpenAI(delay=args.gpt_delay, responder=gpt_reply)
+    gpt_url = await gpt.start(port=args.port + 1)
+
+    # бот читает настройки при импорте — поэтому окружение готовим заранее
+    os.environ.update({
+        "BOT_TOKEN": "123:FAKE",
+        "BOT_MODE": "polling",
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": gpt_url,
+        "TASK_STORE": f"sqlite:{os.path.join(work.path, 'bot.db')}",
+        "PARSE_CACHE_PATH": "",
+        "OUTBOX_PATH": os.path.join(work.path, "outbox.db"),
+        "ARCHIVE_PATH": os.path.join(work.path, "archive.db"),
+        "METRICS_PORT": "",
+        "LLM_MAX_CONCURRENCY": "64",
+    })
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import assistant_bot as bot
+        from telegram.ext import ApplicationBuilder
+        from webhook import OrderedApplication
+
+        app = ApplicationBuilder().token("123:FAKE").base_url(api_url).application_class(OrderedApplication).build()
+        bot.add_handlers(app)
+        await app.initialize()
+        await bot.on_startup(app)
+
+        with open(os.path.join(ROOT, "bench", "parser_corpus.jsonl")) as f:
+            corpus = [json.loads(line)["text"] for line in f if line.strip()]
+        rnd = random.Random(args.seed)
+        chats = list(range(1, args.chats + 1))
+        update_id = [0]
+
+        def make(text):
+            update_id[0] += 1
+            return FakeBotAPI.make_message_update(update_id[0], rnd.choice(chats), text)
+
+        n = args.messages
+        unique = [f"запиши дело #{i} когда удобно" for i in range(n)]
+        phases = {
+            "local": [make(corpus[i % len(corpus)]) for i in range(n)],
+            "gpt": [make(text) for text in unique],
+            "cached": [make(text) for text in unique],
+            "commands": [make(rnd.choice(("/tasks_today", "/tasks_tomorrow", "/tasks", "/delete 1")))
+                         for _ in range(n)],
+        }
+        result = {}
+        for name, updates in phases.items():
+            calls = gpt.calls
+            result[name] = await run_updates(app, updates)
+            result[name]["gpt_calls"] = gpt.calls - calls
+
+        await bot.on_shutdown(app)
+        await app.shutdown()
+    await api.stop()
+    await gpt.stop()
+    result["replies"] = len(api.messages)
+    return result
+
+
+# --- store --------------------------------------------------------------------
+
+def timed(fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / max(1, len(items))
+
+
+def store_ops(kind, path, n, ops, rnd):
+    store = SqliteTaskStore(path) if kind == "sqlite" else JsonTaskStore(path)
+    chats = max(1, n // 20)
+    now = time.time()
+    new_tasks = [{"chat_id": rnd.randint(1, chats), "text": f"новая {i}",
+                  "time": time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(now + rnd.randint(60, 86400)))}
+                 for i in range(ops)]
+    added = []
+    add_s = timed(lambda t: added.append(store.add(t)), new_tasks)
+    chat_s = timed(store.chat_tasks, [rnd.randint(1, chats) for _ in range(ops)])
+    windows = [now + rnd.randint(0, 30 * 86400) for _ in range(max(3, ops // 10))]
+    window_s = timed(lambda start: store.due_between(start, start + 3600), windows)
+    delete_s = timed(store.delete, [t["id"] for t in added])
+    store.close()
+    return {
+        "add_us": round(add_s * 1e6, 1),
+        "chat_tasks_us": round(chat_s * 1e6, 1),
+        "due_window_ms": round(window_s * 1000, 3),
+        "delete_us": round(delete_s * 1e6, 1),
+        "file_bytes": os.path.getsize(path),
+    }
+
+
+async def scenario_store(args, work):
+    result = {}
+    for kind in ("sqlite", "json"):
+        for n in args.sizes:
+            if kind == "json" and n > args.json_max:
+                continue  # JSON переписывается целиком — на больших объёмах замер теряет смысл
+            path, fill_s = work.filled(kind, n)
+            ops = args.ops if kind == "sqlite" else max(3, args.ops // 20)
+            report = {"tasks": n, "fill_per_s": round(n / fill_s)}
+            report.update(store_ops(kind, path, n, ops, random.Random(args.seed)))
+            result[f"{kind}.{n}"] = report
+    return result
+
+
+# --- startup ------------------------------------------------------------------
+
+def cold_start(work, runs=3):
+    # новый процесс бота с --profile-startup: от запуска интерпретатора до готовности, лучший из runs
+    env = dict(os.environ, BOT_TOKEN="123:FAKE", BOT_MODE="polling", METRICS_PORT="", PARSE_CACHE_PATH="",
+               TASK_STORE=f"sqlite:{os.path.join(work.path, 'boot.db')}",
+               OUTBOX_PATH=os.path.join(work.path, "boot-outbox.db"),
+               ARCHIVE_PATH=os.path.join(work.path, "boot-archive.db"))
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.join(ROOT, "assistant_bot.py"), "--profile-startup", "--json"],
+                             cwd=work.path, env=env, capture_output=True, text=True, check=True).stdout
+        wall_ms = (time.perf_counter() - started) * 1000
+        if best is None or wall_ms < best[0]:
+            best = (wall_ms, json.loads(out[out.index("{"):]))
+    wall_ms, profile = best
+    # без догрузки openai, которую --profile-startup делает уже после замера фаз
+    # мелкие фазы шумят — для --compare складываем их в импорт и инициализацию
+    phases = profile["phases"]
+    import_ms = sum(p["ms"] for phase, p in phases.items() if phase.startswith("import"))
+    return {
+        "process_ms": round(wall_ms - profile["first_gpt_import_ms"], 1),
+        "in_process_ms": profile["total_ms"],
+        "import_ms": round(import_ms, 1),
+        "init_ms": round(profile["total_ms"] - import_ms, 1),
+        "first_gpt_import_ms": profile["first_gpt_import_ms"],
+    }
+
+
+async def scenario_startup(args, work):
+    result = {"cold": cold_start(work)}
+    horizon = args.horizon_hours * 3600
+    for n in args.sizes:
+        path, _ = work.filled("sqlite", n)
+        lazy = measure(path, True, horizon)
+        eager = measure(path, False, horizon)
+        result[str(n)] = {
+            "lazy_ms": round(lazy["startup_ms"], 1),
+            "lazy_reminders": lazy["pending_reminders"],
+            "refill_ms": round(lazy["refill_ms"], 1),
+            "eager_ms": round(eager["startup_ms"], 1),
+            "eager_reminders": eager["pending_reminders"],
+        }
+    return result
+
+
+# --- firing -------------------------------------------------------------------
+
+async def busy_loop(stop, chunk):
+    # обработчики, надолго занимающие цикл (разбор, JSON, сериализация ответа)
+    while not stop.is_set():
+        until = time.perf_counter() + chunk
+        while time.perf_counter() < until:
+            pass
+        await asyncio.sleep(0)
+
+
+async def fire_once(args, load):
+    engine = ReminderEngine(offsets=[0])
+    start = time.time() + 0.5
+    due = {}
+    for i in range(args.reminders):
+        fire_at = start + args.fire_span * i / args.reminders
+        due[i] = fire_at
+        engine.schedule_once({"id": i + 1, "chat_id": i % 100 + 1, "text": str(i),
+                              "time": datetime.fromtimestamp(fire_at, timezone.utc).isoformat()})
+    lags = []
+    done = asyncio.Event()
+
+    async def send(chat_id, text):
+        lags.append(time.time() - due[int(text.rsplit(" ", 1)[1])])
+        if len(lags) == args.reminders:
+            done.set()
+
+    stop = asyncio.Event()
+    loaders = [asyncio.create_task(busy_loop(stop, args.busy_ms / 1000)) for _ in range(load)]
+    engine.start(send)
+    try:
+        await asyncio.wait_for(done.wait(), args.fire_span + 30)
+    except asyncio.TimeoutError:
+        pass
+    stop.set()
+    await asyncio.gather(*loaders)
+    await engine.stop()
+    return {
+        "reminders": args.reminders,
+        "fired": len(lags),
+        "lag_p50_ms": ms(lags, 50),
+        "lag_p95_ms": ms(lags, 95),
+        "lag_p99_ms": ms(lags, 99),
+        "lag_max_ms": round(max(lags, default=0) * 1000, 3),
+    }
+
+
+async def scenario_firing(args, work):
+    return {
+        "idle": await fire_once(args, 0),
+        "loaded": await fire_once(args, args.busy_tasks),
+    }
+
+
+# --- memory -------------------------------------------------------------------
+
+def reminder_bytes(n, repeating):
+    now = time.time()
+    tasks = []
+    for i in range(n):
+        task = {"id": i + 1, "chat_id": i % 1000 + 1, "text": f"задача {i}"}
+        if repeating:
+            task.update(time=f"{i % 24:02d}:{i % 60:02d}", repeat=["Monday", "Thursday"])
+        else:
+            task["time"] = time.strftime("%Y-%m-%dT%H:%M:00", time.localtime(now + 86400 + i))
+        tasks.append(task)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    engine = ReminderEngine()
+    engine.schedule_many(tasks, now)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"pending": len(engine), "per_reminder_bytes": round(used / max(1, len(engine)), 1)}
+
+
+async def scenario_memory(args, work):
+    return {
+        "once": reminder_bytes(args.memory_reminders, repeating=False),
+        "repeating": reminder_bytes(args.memory_reminders, repeating=True),
+    }
+
+
+# --- отчёт и сравнение ----------------------------------------------------------
+
+def flatten(tree, prefix=""):
+    flat = {}
+    for key, value in tree.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, threshold):
+    # список (метрика, было, стало, изменение) для ухудшившихся метрик
+    old, new = flatten(baseline["results"]), flatten(results)
+    regressions = []
+    for key, before in old.items():
+        after = new.get(key)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        if key.endswith(HIGHER_BETTER) and change < -threshold:
+            regressions.append((key, before, after, change))
+        elif key.endswith(LOWER_BETTER) and change > threshold:
+            regressions.append((key, before, after, change))
+    return regressions
+
+
+def meta(args):
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = None
+    return {
+        "git": rev or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "args": vars(args),
+    }
+
+
+async def main(args):
+    runners = {name: globals()[f"scenario_{name}"] for name in SCENARIOS}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="suite-") as tmp:
+        work = Workdir(tmp)
+        for name in args.scenarios:
+            started = time.perf_counter()
+            results[name] = await runners[name](args, work)
+            print(f"✅ {name}: {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    report = {"meta": meta(args), "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, before, after, change in regressions:
+            print(f"❌ {key}: {before} → {after} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Регрессий нет (порог {args.threshold:.0%})", file=sys.stderr)
+
+
+def csv_list(value, cast=str):
+    return [cast(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", type=csv_list, default=list(SCENARIOS), help=",".join(SCENARIOS))
+    parser.add_argument("--sizes", type=lambda v: csv_list(v, int), default=[10000, 100000, 1000000],
+                        help="размеры хранилища для store и startup")
+    parser.add_argument("--json-max", type=int, default=100000, help="наибольший размер для JSON-хранилища")
+    parser.add_argument("--ops", type=int, default=500, help="операций на замер хранилища")
+    parser.add_argument("--horizon-hours", type=float, default=24)
+    parser.add_argument("--messages", type=int, default=300, help="сообщений на фазу parse")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--gpt-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=18281)
+    parser.add_argument("--reminders", type=int, default=2000, help="напоминаний в firing")
+    parser.add_argument("--fire-span", type=float, default=3.0, help="за сколько секунд они срабатывают")
+    parser.add_argument("--busy-tasks", type=int, default=4, help="сколько «обработчиков» занимают цикл")
+    parser.add_argument("--busy-ms", type=float, default=5.0, help="сколько каждый держит цикл за раз")
+    parser.add_argument("--memory-reminders", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="записать результат в файл")
+    parser.add_argument("--compare", help="прошлый результат для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    asyncio.run(main(args))
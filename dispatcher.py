@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden
+
+from llm_client import percentile
+from metrics import log, counter, histogram
+
+# Очередь исходящих сообщений: общий лимит бота и лимит на чат (token bucket),
+# склейка напоминаний одному чату за одну секунду и повтор при RetryAfter.
+# Служебные ответы (notify: «занят» от допуска) идут мимо этой очереди: не
+# ждут напоминаний и не склеиваются с ними, но берут токены из тех же лимитов.
+
+SEND_LATENCY = histogram("jarvis_send_latency_seconds", "От постановки в очередь до доставки сообщения",
+                         buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SEND_RESULTS = counter("jarvis_send_total", "Исходящие сообщения по результату", ("result",))
+
+# Telegram не принимает сообщения длиннее 4096 символов: склейка растёт только
+# до этой длины, дальше — новое сообщение
+MESSAGE_MAX = 4000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        # забираем токен (можно в долг) и возвращаем, сколько ждать
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self, now):
+        # без долга: есть целый токен — забираем, нет — False
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _Batch:
+    __slots__ = ("texts", "size", "keys", "first_at", "attempts", "sealed")
+
+    def __init__(self, text, now):
+        self.texts = [text]
+        self.size = len(text)  # длина склеенного текста
+        self.keys = []  # что подтвердить после доставки (id в журнале напоминаний)
+        self.first_at = now
+        self.attempts = 0
+        self.sealed = False  # уже отправляется — дописывать нельзя
+
+
+def _permanent(error):
+    # чат заблокировал бота или его нет — повтор не поможет
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+
+def _retry_after_seconds(error):
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        return None
+    if hasattr(value, "total_seconds"):
+        return value.total_seconds()
+    return float(value)
+
+
+class OutboundDispatcher:
+    # за любую секунду уходит не больше burst + rate сообщений:
+    # по умолчанию 30 на бота и 3 на чат — в пределах лимитов Telegram
+    def __init__(self, global_rate=25.0, global_burst=5, chat_rate=1.0, chat_burst=2,
+                 coalesce_window=1.0, workers=8, max_attempts=5):
+        self._send = None
+        # on_delivered(keys) — вызывается после доставки сообщений, отправленных с key
+        self.on_delivered = None
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_window = coalesce_window
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._chat_buckets = {}
+        self._batches = {}  # chat_id -> deque[_Batch]
+        self._busy = set()  # чаты, которые сейчас в очереди или отправляются
+        self._ready = None
+        self._paused_until = 0.0
+        self._tasks = []
+        self._notices = set()  # отправляемые служебные ответы
+        self.submitted = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.retry_after = 0
+        self.dropped = 0
+        self.notices = 0
+        self.notices_dropped = 0
+        self.latencies = deque(maxlen=5000)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            global_rate=float(os.getenv("SEND_GLOBAL_RATE", "25")),
+            chat_rate=float(os.getenv("SEND_CHAT_RATE", "1")),
+            coalesce_window=float(os.getenv("SEND_COALESCE_WINDOW", "1")),
+            workers=int(os.getenv("SEND_WORKERS", "8")),
+        )
+
+    def _queue(self):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        return self._ready
+
+    def queued(self):
+        return sum(len(b) for b in self._batches.values())
+
+    def submit(self, chat_id, text, key=None):
+        if len(text) > MESSAGE_MAX:
+            text = text[:MESSAGE_MAX - 1] + "…"
+        now = time.monotonic()
+        self.submitted += 1
+        batches = self._batches.get(chat_id)
+        if batches is None:
+            batches = self._batches[chat_id] = deque()
+        # несколько напоминаний одному чату в пределах окна — одним сообщением, пока оно не слишком длинное
+        last = batches[-1] if batches else None
+        if last is not None and not last.sealed and now - last.first_at <= self.coalesce_window \
+                and last.size + 1 + len(text) <= MESSAGE_MAX:
+            last.texts.append(text)
+            last.size += 1 + len(text)
+            self.coalesced += 1
+        else:
+            batches.append(_Batch(text, now))
+        if key is not None:
+            batches[-1].keys.append(key)
+        if chat_id not in self._busy:
+            self._busy.add(chat_id)
+            self._queue().put_nowait(chat_id)
+
+    async def send(self, chat_id, text):
+        self.submit(chat_id, text)
+
+    def notify(self, chat_id, text):
+        # служебный ответ сразу, вне очереди напоминаний. Лимиты те же, но без
+        # долга: нет токена или бот на паузе после RetryAfter — ответ не шлём,
+        # он не важнее напоминаний. -> ушёл ли ответ на отправку
+        now = time.monotonic()
+        if self._send is None or now < self._paused_until or not self._take_tokens(chat_id, now):
+            self.notices_dropped += 1
+            SEND_RESULTS.labels("notice_dropped").inc()
+            return False
+        task = asyncio.create_task(self._send_notice(chat_id, text))
+        self._notices.add(task)
+        task.add_done_callback(self._notices.discard)
+        return True
+
+    def _take_tokens(self, chat_id, now):
+        bucket = self._chat_bucket(chat_id)
+        if not bucket.take(now):
+            return False
+        if not self.global_bucket.take(now):
+            bucket.tokens += 1  # не отправили — токен чата вернём
+            return False
+        return True
+
+    async def _send_notice(self, chat_id, text):
+        try:
+            await self._send(chat_id, text)
+        except Exception as e:
+            delay = _retry_after_seconds(e)
+            if delay is not None:
+                self.retry_after += 1
+                SEND_RESULTS.labels("retry_after").inc()
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.notices_dropped += 1
+            SEND_RESULTS.labels("notice_dropped").inc()
+            log(f"⚠️ Не удалось отправить служебный ответ в чат {chat_id}: {e}", event="send.notice_error",
+                level="warning", chat_id=chat_id, error=repr(e))
+            return
+        self.notices += 1
+        SEND_RESULTS.labels("notice").inc()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _deliver(self, chat_id):
+        # -> через сколько секунд пробовать чат снова (None — сразу)
+        batches = self._batches[chat_id]
+        batch = batches[0]
+
+        wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        now = time.monotonic()
+        wait = max(self._chat_bucket(chat_id).reserve(now), self.global_bucket.reserve(now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        # пока ждали лимитов, в пачку могли дописать ещё напоминания
+        batch.sealed = True
+        try:
+            await self._send(chat_id, "\n".join(batch.texts))
+        except Exception as e:
+            batch.attempts += 1
+            delay = _retry_after_seconds(e)
+            if delay is not None:
+                # flood control у Telegram общий на бота — притормаживаем всех
+                self.retry_after += 1
+                SEND_RESULTS.labels("retry_after").inc()
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            elif _permanent(e) or batch.attempts >= self.max_attempts:
+                batches.popleft()
+                self.dropped += 1
+                SEND_RESULTS.labels("dropped").inc()
+                log(f"❌ Не удалось доставить сообщение в чат {chat_id}: {e}", event="send.dropped", level="error",
+                    chat_id=chat_id, error=repr(e))
+            else:
+                # воркер не ждёт паузы сам: чат вернётся в очередь позже, а воркер займётся другими
+                return min(30.0, 0.5 * 2 ** batch.attempts)
+            return None
+
+        batches.popleft()
+        self.delivered += len(batch.texts)
+        self.latencies.append(time.monotonic() - batch.first_at)
+        SEND_LATENCY.observe(self.latencies[-1])
+        SEND_RESULTS.labels("delivered").inc()
+        if batch.keys and self.on_delivered is not None:
+            self.on_delivered(batch.keys)
+        return None
+
+    async def _worker(self):
+        queue = self._queue()
+        while True:
+            chat_id = await queue.get()
+            delay = None
+            try:
+                delay = await self._deliver(chat_id)
+            except Exception as e:
+                log(f"❌ Ошибка отправки: {e}", event="send.error", level="error", chat_id=chat_id, error=repr(e))
+            if self._batches.get(chat_id):
+                if delay:
+                    # чат остаётся в _busy: новые сообщения допишутся в его пачки, а не встанут в очередь второй раз
+                    asyncio.get_running_loop().call_later(delay, queue.put_nowait, chat_id)
+                else:
+                    queue.put_nowait(chat_id)
+            else:
+                self._batches.pop(chat_id, None)
+                self._busy.discard(chat_id)
+
+    def start(self, send):
+        # send(chat_id, text) — корутина, которая реально отправляет сообщение
+        self._send = send
+        self._queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def drain(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while (self._busy or self._notices) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        tasks = self._tasks + list(self._notices)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "queued": self.queued(),
+            "submitted": self.submitted,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "retry_after": self.retry_after,
+            "dropped": self.dropped,
+            "notices": self.notices,
+            "notices_dropped": self.notices_dropped,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+            "latency_p99": percentile(self.latencies, 99),
+        }
@@ -0,0 +1,205 @@
+import os
+import json
+from datetime import datetime
+
+from task_model import DAY_NAMES, parse_clock, repeat_mask_for, days_for_mask
+from llm_client import LLMQueueFull
+from metrics import log, counter
+
+# Разбор фраз через вызов функции (function calling) вместо длинной инструкции
+# и выковыривания JSON из текста ответа. Формат задаёт JSON-схема функции,
+# промпт — пара строк, ответ проходит строгую проверку. Модели — лестница
+# LLM_MODELS: сначала дешёвая и быстрая, если её ответ не прошёл проверку —
+# тот же запрос к следующей.
+
+STRUCTURED_RESULTS = counter("jarvis_gpt_structured_total", "Разбор через вызов функции по модели и результату",
+                             ("model", "result"))
+
+SYSTEM_PROMPT = (
+    "Извлеки напоминания. Разовое: time YYYY-MM-DDTHH:MM:SS. "
+    "Регулярное (каждый, по будням, ежедневно): time HH:MM, repeat — дни."
+)
+BATCH_PROMPT = SYSTEM_PROMPT + " У каждой фразы своя дата; верни задачи с id фразы."
+
+TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "time": {"type": "string"},
+        "repeat": {"type": "array", "items": {"type": "string", "enum": list(DAY_NAMES)}},
+    },
+    "required": ["text", "time"],
+}
+SAVE_TASKS = {
+    "name": "save_tasks",
+    "parameters": {
+        "type": "object",
+        "properties": {"tasks": {"type": "array", "items": TASK_SCHEMA}},
+        "required": ["tasks"],
+    },
+}
+SAVE_BATCH = {
+    "name": "save_batch",
+    "parameters": {
+        "type": "object",
+        "properties": {"phrases": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"id": {"type": "integer"}, "tasks": {"type": "array", "items": TASK_SCHEMA}},
+            "required": ["id", "tasks"],
+        }}},
+        "required": ["phrases"],
+    },
+}
+
+# потолок ответа: задача в JSON — около 40 токенов
+MAX_TOKENS = 300
+MAX_TOKENS_PER_PHRASE = 120
+
+
+class InvalidReply(ValueError):
+    pass
+
+
+def phrase_line(text, now):
+    # день недели — чтобы «в пятницу» не приходилось вычислять по дате
+    return (f"Сегодня: {now.strftime('%Y-%m-%d')} ({now.strftime('%A')}), "
+            f"время: {now.strftime('%H:%M')}. Фраза: {text}")
+
+
+def validate_task(item):
+    # -> задача в том виде, который ждёт handle_message, или InvalidReply
+    if not isinstance(item, dict):
+        raise InvalidReply(f"задача не объект: {item!r}")
+    text, when = item.get("text"), item.get("time")
+    if not isinstance(text, str) or not text.strip():
+        raise InvalidReply("пустой text")
+    if not isinstance(when, str):
+        raise InvalidReply(f"time не строка: {when!r}")
+    repeat = item.get("repeat")
+    if repeat:
+        if not isinstance(repeat, list) or not all(isinstance(d, str) for d in repeat):
+            raise InvalidReply(f"repeat не список дней: {repeat!r}")
+        try:
+            mask = repeat_mask_for(d.strip().capitalize() for d in repeat)
+            hour, minute = parse_clock(when)
+        except (KeyError, ValueError) as e:
+            raise InvalidReply(f"неверный повтор {when!r} {repeat!r}: {e}")
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise InvalidReply(f"неверное время {when!r}")
+        return {"text": text.strip(), "time": f"{hour:02d}:{minute:02d}", "repeat": days_for_mask(mask)}
+    try:
+        datetime.fromisoformat(when)
+    except ValueError:
+        raise InvalidReply(f"неверная дата {when!r}")
+    return {"text": text.strip(), "time": when}
+
+
+def validate_tasks(tasks):
+    # одна задача — словарь, несколько — список (так их разбирает handle_message).
+    # Пустой список — верный ответ «напоминаний во фразе нет»: отдаём как есть,
+    # к модели дороже за ним не идём
+    if not isinstance(tasks, list):
+        raise InvalidReply(f"нет списка задач: {tasks!r}")
+    if not tasks:
+        return []
+    checked = [validate_task(t) for t in tasks]
+    return checked[0] if len(checked) == 1 else checked
+
+
+def function_arguments(response):
+    message = response.choices[0].message
+    call = message.get("function_call")
+    raw = call.get("arguments") if call else message.get("content")
+    if not raw:
+        raise InvalidReply("ответ без вызова функции")
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise InvalidReply(f"аргументы не JSON: {e}")
+
+
+class StructuredParser:
+    def __init__(self, llm, models=("gpt-3.5-turbo", "gpt-4")):
+        self.llm = llm
+        self.models = tuple(models)
+        self.escalations = 0
+        self.invalid = {}  # модель -> ответов, не прошедших проверку
+
+    @classmethod
+    def from_env(cls, llm):
+        # LLM_STRUCTURED=0 — прежний промпт-инструкция (для серверов без function calling)
+        if os.getenv("LLM_STRUCTURED", "1") == "0":
+            return None
+        models = [m.strip() for m in os.getenv("LLM_MODELS", "gpt-3.5-turbo,gpt-4").split(",") if m.strip()]
+        return cls(llm, models)
+
+    async def _ask(self, model, system, user, function, max_tokens):
+        response = await self.llm.complete(
+            model=model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            functions=[function],
+            function_call={"name": function["name"]},
+            temperature=0,
+            max_tokens=max_tokens,
+        )
+        return function_arguments(response)
+
+    async def _escalate(self, name, ask, check):
+        # по лестнице моделей, пока ответ не пройдёт check; -> результат или None
+        for level, model in enumerate(self.models):
+            try:
+                result = check(await ask(model))
+                STRUCTURED_RESULTS.labels(model, "ok").inc()
+                return result
+            except InvalidReply as e:
+                STRUCTURED_RESULTS.labels(model, "invalid").inc()
+                self.invalid[model] = self.invalid.get(model, 0) + 1
+                log(f"⚠️ {model}: ответ не прошёл проверку: {e}", event="gpt.invalid", level="warning",
+                    model=model, call=name, error=str(e))
+            except LLMQueueFull as e:
+                # перегрузка: к модели дороже идти незачем
+                STRUCTURED_RESULTS.labels(model, "queue_full").inc()
+                log(f"🚦 Очередь GPT переполнена: {e}", event="gpt.queue_full", level="warning")
+                return None
+            except Exception as e:
+                STRUCTURED_RESULTS.labels(model, "error").inc()
+                log(f"❌ {model}: ошибка GPT: {e}", event="gpt.error", level="error", model=model, error=repr(e))
+            if level + 1 < len(self.models):
+                self.escalations += 1
+        return None
+
+    async def parse_one(self, text, now):
+        return await self._escalate(
+            "one",
+            lambda model: self._ask(model, SYSTEM_PROMPT, phrase_line(text, now), SAVE_TASKS, MAX_TOKENS),
+            lambda args: validate_tasks(args.get("tasks") if isinstance(args, dict) else None),
+        )
+
+    async def parse_many(self, items):
+        # -> список по порядку фраз (None — фразу разберёт parse_one) или None, если не ответила ни одна модель
+        user = "\n".join(f"{i}. {phrase_line(text, now)}" for i, (text, now) in enumerate(items, 1))
+
+        def check(args):
+            phrases = args.get("phrases") if isinstance(args, dict) else None
+            if not isinstance(phrases, list):
+                raise InvalidReply("нет списка phrases")
+            results = [None] * len(items)
+            for entry in phrases:
+                try:
+                    index = int(entry["id"])
+                    if 1 <= index <= len(items):
+                        results[index - 1] = validate_tasks(entry["tasks"])
+                except (InvalidReply, KeyError, TypeError, ValueError):
+                    continue  # эту фразу дозапросим отдельно
+            if all(r is None for r in results):
+                raise InvalidReply("ни одной разобранной фразы")
+            return results
+
+        return await self._escalate(
+            "batch",
+            lambda model: self._ask(model, BATCH_PROMPT, user, SAVE_BATCH, MAX_TOKENS_PER_PHRASE * len(items)),
+            check,
+        )
+
+    def stats(self):
+        return {"models": self.models, "escalations": self.escalations, "invalid": dict(self.invalid)}
@@ -0,0 +1,370 @@
+import os
+import io
+import re
+import csv
+import time
+from datetime import datetime, timedelta
+
+from recurrence import zone, local_timestamp
+from local_parser import WEEKDAY_NAMES, WEEKDAY_RES
+
+# Пакетная загрузка задач: разобранный GPT список, CSV или ICS-файл.
+# Проверяем, убираем повторы, пишем одной транзакцией и планируем одной
+# пачкой — вместо перезаписи хранилища на каждую задачу.
+
+IMPORT_MAX_TASKS = int(os.getenv("IMPORT_MAX_TASKS", "5000"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(1024 * 1024)))
+
+SHORT_DAYS = {"пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6,
+              "mo": 0, "tu": 1, "we": 2, "th": 3, "fr": 4, "sa": 5, "su": 6,
+              "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+DAY_GROUPS = {"ежедневно": range(7), "каждый день": range(7), "daily": range(7),
+              "будни": range(5), "weekdays": range(5), "выходные": range(5, 7), "weekends": range(5, 7)}
+
+HM_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+DATETIME_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M",
+                    "%d.%m.%Y %H:%M", "%d.%m.%y %H:%M")
+
+
+class IngestResult:
+    __slots__ = ("added", "duplicates", "invalid", "past", "errors")
+
+    def __init__(self):
+        self.added = []
+        self.duplicates = 0
+        self.invalid = 0
+        self.past = 0
+        self.errors = []  # первые несколько причин, чтобы показать пользователю
+
+    def reject(self, reason):
+        self.invalid += 1
+        if len(self.errors) < 5:
+            self.errors.append(reason)
+
+
+def parse_days(value):
+    # "Monday;Friday", "пн, ср", "будни", ["Monday", "Tuesday"] -> ["Monday", ...]
+    if isinstance(value, (list, tuple)):
+        words = [str(v) for v in value]
+    else:
+        value = value.strip().lower()
+        if value in DAY_GROUPS:
+            return [WEEKDAY_NAMES[i] for i in DAY_GROUPS[value]]
+        words = re.split(r"[\s,;/]+", value)
+    days = set()
+    for word in filter(None, words):
+        w = word.strip().lower()
+        if w in SHORT_DAYS:
+            days.add(SHORT_DAYS[w])
+        elif w.capitalize() in WEEKDAY_NAMES:
+            days.add(WEEKDAY_NAMES.index(w.capitalize()))
+        elif w in DAY_GROUPS:
+            days.update(DAY_GROUPS[w])
+        else:
+            for i, r in enumerate(WEEKDAY_RES):
+                if r.match(w):
+                    days.add(i)
+                    break
+            else:
+                raise ValueError(f"непонятный день «{word}»")
+    if not days:
+        raise ValueError("пустой список дней")
+    return [WEEKDAY_NAMES[i] for i in sorted(days)]
+
+
+def parse_datetime(value):
+    value = value.strip()
+    try:
+        t = datetime.fromisoformat(value)
+        return t.replace(tzinfo=None) if t.tzinfo is None else t
+    except ValueError:
+        pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"непонятное время «{value}»")
+
+
+def normalize_entry(entry, chat_id, tz_name):
+    # запись из GPT/CSV/ICS -> задача для хранилища или ValueError
+    if entry.get("error"):
+        raise ValueError(entry["error"])
+    text = str(entry.get("text") or "").strip()
+    if not text:
+        raise ValueError("нет текста задачи")
+    raw_time = entry.get("time")
+    if not raw_time:
+        raise ValueError(f"нет времени у «{text}»")
+    task = {"chat_id": chat_id, "text": text[:500], "tz": tz_name}
+    if entry.get("repeat"):
+        m = HM_RE.match(str(raw_time).strip())
+        if not m:
+            raise ValueError(f"у повторяющейся задачи «{text}» время должно быть ЧЧ:ММ")
+        task["time"] = f"{int(m.group(1)):02d}:{m.group(2)}"
+        task["repeat"] = parse_days(entry["repeat"])
+        return task
+    when = raw_time if isinstance(raw_time, datetime) else parse_datetime(str(raw_time))
+    if when.tzinfo is not None:
+        when = when.astimezone(zone(tz_name)).replace(tzinfo=None)
+    task["time"] = when.replace(microsecond=0).isoformat()
+    return task
+
+
+def task_key(task):
+    return (task["text"].casefold(), task["time"], tuple(task.get("repeat") or ()))
+
+
+def prepare(entries, chat_id, tz_name, existing=(), skip_past=False, now=None):
+    # проверка и дедупликация; возвращает (задачи для записи, IngestResult)
+    now = time.time() if now is None else now
+    result = IngestResult()
+    seen = {task_key(t) for t in existing}
+    tz = zone(tz_name)
+    tasks = []
+    for entry in entries:
+        try:
+            task = normalize_entry(entry, chat_id, tz_name)
+        except (ValueError, TypeError, AttributeError) as e:
+            result.reject(str(e))
+            continue
+        key = task_key(task)
+        if key in seen:
+            result.duplicates += 1
+            continue
+        if skip_past and "repeat" not in task and local_timestamp(tz, datetime.fromisoformat(task["time"])) <= now:
+            result.past += 1
+            continue
+        if len(tasks) >= IMPORT_MAX_TASKS:
+            result.reject(f"больше {IMPORT_MAX_TASKS} задач за раз")
+            break
+        seen.add(key)
+        tasks.append(task)
+    return tasks, result
+
+
+def ingest(store, entries, chat_id, tz_name, skip_past=False, now=None):
+    # одна выборка задач чата для дедупликации и одна транзакция на запись
+    tasks, result = prepare(entries, chat_id, tz_name, store.chat_tasks(chat_id), skip_past, now)
+    if tasks:
+        result.added = store.add_many(tasks)
+    return result
+
+
+def parse_csv(data):
+    # колонки: текст, время[, дни повтора]; заголовок и разделитель (, или ;) — любые
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [r for r in csv.reader(io.StringIO(text), dialect) if any(c.strip() for c in r)]
+    entries = []
+    for i, row in enumerate(rows):
+        if len(row) < 2:
+            entries.append({"text": row[0] if row else "", "time": None})
+            continue
+        if i == 0 and not _looks_like_time(row[1]):
+            continue  # заголовок
+        entry = {"text": row[0], "time": row[1].strip()}
+        if len(row) > 2 and row[2].strip():
+            entry["repeat"] = row[2]
+        entries.append(entry)
+    return entries
+
+
+def _looks_like_time(value):
+    value = value.strip()
+    if HM_RE.match(value):
+        return True
+    try:
+        parse_datetime(value)
+        return True
+    except ValueError:
+        return False
+
+
+ICS_DAYS = {"MO": "Monday", "TU": "Tuesday", "WE": "Wednesday", "TH": "Thursday",
+            "FR": "Friday", "SA": "Saturday", "SU": "Sunday"}
+
+
+def _ics_unescape(value):
+    return (value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_datetime(value, params, tz_name):
+    # DTSTART: 20261020T090000Z (UTC), ;TZID=Europe/Berlin:20261020T090000,
+    # плавающее 20261020T090000 (пояс чата) или дата на весь день (в 09:00)
+    if "T" not in value:
+        return datetime.strptime(value[:8], "%Y%m%d").replace(hour=9)
+    naive = datetime.strptime(value.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        ts = local_timestamp(zone("UTC"), naive)
+    elif "TZID" in params:
+        ts = local_timestamp(zone(params["TZID"].strip('"')), naive)
+    else:
+        return naive
+    return datetime.fromtimestamp(ts, zone(tz_name)).replace(tzinfo=None)
+
+
+def parse_ics(data, tz_name, now=None):
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    # развёрнутые строки: продолжение начинается с пробела или таба
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+
+    entries = []
+    event = None
+    depth = 0
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event, depth = {}, 0
+            continue
+        if event is None:
+            continue
+        if line.startswith("BEGIN:"):
+            depth += 1  # VALARM и прочие вложенные блоки пропускаем
+            continue
+        if line.startswith("END:") and depth:
+            depth -= 1
+            continue
+        if line == "END:VEVENT":
+            entries.append(_ics_entry(event, tz_name, now))
+            event = None
+            continue
+        if depth or ":" not in line:
+            continue
+        head, value = line.split(":", 1)
+        name, *params = head.split(";")
+        event[name.upper()] = (value, dict(p.split("=", 1) for p in params if "=" in p))
+    return entries
+
+
+ICS_RULE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "WKST"}
+ICS_MAX_PERIODS = 10000
+
+
+def _ics_periods(start, after, freq, interval):
+    # номер периода, с которого искать повторения после after: без COUNT
+    # прошлые периоды можно не перебирать
+    if after <= start:
+        return 0
+    if freq == "DAILY":
+        passed = (after - start).days
+    elif freq == "WEEKLY":
+        passed = (after - start).days // 7
+    elif freq == "MONTHLY":
+        passed = (after.year - start.year) * 12 + after.month - start.month
+    else:
+        passed = after.year - start.year
+    return max(0, passed // interval - 1)
+
+
+def _ics_occurrences(start, freq, interval, weekdays, first=0):
+    # повторения по порядку начиная со start; несуществующие даты (31 число
+    # в коротком месяце, 29 февраля) пропускаем, как велит RFC 5545
+    week = start - timedelta(days=start.weekday())
+    for period in range(first, first + ICS_MAX_PERIODS):
+        step = period * interval
+        if freq == "DAILY":
+            moments = [start + timedelta(days=step)]
+        elif freq == "WEEKLY":
+            moments = [week + timedelta(weeks=step, days=d) for d in weekdays]
+        elif freq == "MONTHLY":
+            year, month = divmod(start.month - 1 + step, 12)
+            moments = [(start.year + year, month + 1)]
+        else:
+            moments = [(start.year + step, start.month)]
+        for moment in moments:
+            if isinstance(moment, tuple):
+                try:
+                    moment = start.replace(year=moment[0], month=moment[1])
+                except ValueError:
+                    continue
+            if moment >= start and (freq != "DAILY" or moment.weekday() in weekdays):
+                yield moment
+
+
+def _ics_next(start, rule, params, tz_name, now=None):
+    # ближайшее повторение позже now (по часам пояса чата) с учётом
+    # INTERVAL, COUNT и UNTIL; None — повторения закончились
+    freq = rule.get("FREQ")
+    extra = set(rule) - ICS_RULE_PARTS
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY") or extra or (
+            "BYDAY" in rule and freq not in ("DAILY", "WEEKLY")):
+        raise ValueError("RRULE " + ";".join(f"{k}={v}" for k, v in rule.items()))
+    interval = int(rule.get("INTERVAL", "1"))
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError(f"INTERVAL={interval}, COUNT={count}")
+    if "BYDAY" in rule:
+        names = list(ICS_DAYS)
+        weekdays = sorted({names.index(d[-2:]) for d in rule["BYDAY"].split(",") if d[-2:] in ICS_DAYS})
+        if not weekdays:
+            raise ValueError(f"BYDAY={rule['BYDAY']}")
+    else:
+        weekdays = [start.weekday()] if freq == "WEEKLY" else list(range(7))
+    # UNTIL пишут в том же виде, что и DTSTART (UTC, с поясом события или плавающим)
+    # (дата без времени — весь последний день)
+    until = None
+    if "UNTIL" in rule:
+        until = _ics_datetime(rule["UNTIL"], params, tz_name)
+        if "T" not in rule["UNTIL"]:
+            until = until.replace(hour=23, minute=59, second=59)
+    after = datetime.fromtimestamp(time.time() if now is None else now, zone(tz_name)).replace(tzinfo=None)
+    first = 0 if count is not None else _ics_periods(start, after, freq, interval)
+    for index, moment in enumerate(_ics_occurrences(start, freq, interval, weekdays, first)):
+        if (count is not None and index >= count) or (until is not None and moment > until):
+            return None
+        if moment > after:
+            return moment
+    return None
+
+
+def _ics_entry(event, tz_name, now=None):
+    summary = _ics_unescape(event.get("SUMMARY", ("", {}))[0])
+    if "DTSTART" not in event:
+        return {"text": summary, "time": None}
+    try:
+        start = _ics_datetime(*event["DTSTART"], tz_name)
+    except (ValueError, KeyError) as e:
+        return {"text": summary, "error": f"непонятный DTSTART у «{summary}»: {e}"}
+    rrule = event.get("RRULE")
+    if not rrule:
+        return {"text": summary, "time": start}
+    rule = dict(p.split("=", 1) for p in rrule[0].split(";") if "=" in p)
+    freq = rule.get("FREQ")
+    if int(rule.get("INTERVAL", "1")) != 1 or "COUNT" in rule or "UNTIL" in rule or freq not in ("DAILY", "WEEKLY"):
+        # повторяющейся задачей такое правило не выразить — ставим ближайшее
+        # будущее повторение как одноразовое
+        try:
+            nearest = _ics_next(start, rule, event["DTSTART"][1], tz_name, now)
+        except ValueError as e:
+            return {"text": summary, "error": f"повторение «{summary}» не поддерживается: {e}"}
+        if nearest is None:
+            return {"text": summary, "error": f"повторения «{summary}» уже закончились"}
+        return {"text": summary, "time": nearest}
+    if freq == "DAILY" and "BYDAY" not in rule:
+        days = WEEKDAY_NAMES
+    elif "BYDAY" in rule:
+        days = [ICS_DAYS[d[-2:]] for d in rule["BYDAY"].split(",") if d[-2:] in ICS_DAYS]
+    else:
+        days = [WEEKDAY_NAMES[start.weekday()]]
+    return {"text": summary, "time": start.strftime("%H:%M"), "repeat": days}
+
+
+def parse_import(filename, data, tz_name, now=None):
+    if len(data) > IMPORT_MAX_BYTES:
+        raise ValueError(f"файл больше {IMPORT_MAX_BYTES // 1024} КБ")
+    name = (filename or "").lower()
+    if name.endswith(".ics"):
+        return parse_ics(data, tz_name, now)
+    if name.endswith(".csv") or name.endswith(".txt"):
+        return parse_csv(data)
+    raise ValueError("поддерживаются только .csv и .ics")
@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+
+from metrics import log, counter, histogram
+
+# Ошибки, после которых имеет смысл повторить запрос; ошибки openai
+# добавляются вместе с самим openai (см. load_openai)
+RETRYABLE_ERRORS = (asyncio.TimeoutError,)
+_openai = None
+
+LLM_SECONDS = histogram("jarvis_llm_seconds", "Запрос к LLM вместе с повторами")
+LLM_QUEUE_WAIT = histogram("jarvis_llm_queue_wait_seconds", "Ожидание свободного слота для запроса к LLM")
+LLM_REQUESTS = counter("jarvis_llm_requests_total", "Запросы к LLM по результату", ("result",))
+LLM_TOKENS = counter("jarvis_llm_tokens_total", "Токены LLM по модели", ("model", "kind"))
+LLM_CALL_SECONDS = histogram("jarvis_llm_call_seconds", "Успешный запрос к LLM по модели", ("model",))
+
+
+class LLMQueueFull(Exception):
+    pass
+
+
+def load_openai():
+    # openai вместе с aiohttp импортируется ~0.25 с: при запуске бот в GPT не
+    # ходит, поэтому грузим его при первом запросе, а не при импорте модуля
+    global _openai, RETRYABLE_ERRORS
+    if _openai is None:
+        import openai
+        from openai import error as openai_error
+        openai.api_key = openai.api_key or os.getenv("OPENAI_API_KEY")
+        RETRYABLE_ERRORS = (
+            asyncio.TimeoutError,
+            openai_error.APIConnectionError,
+            openai_error.APIError,
+            openai_error.RateLimitError,
+            openai_error.ServiceUnavailableError,
+        )
+        _openai = openai
+    return _openai
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+class ModelUsage:
+    # токены и задержки успешных запросов к одной модели
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "latencies")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=1000)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_per_call": self.prompt_tokens / self.calls if self.calls else 0.0,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+        }
+
+
+class LLMClient:
+    # Асинхронный клиент: не больше max_concurrency запросов одновременно,
+    # остальные ждут в очереди (не длиннее max_queue)
+    def __init__(self, max_concurrency=4, max_queue=100, timeout=30.0, retries=3,
+                 backoff_base=0.5, backoff_max=8.0, api_base=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.api_base = api_base
+        self._sem = None
+        self.queued = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=1000)
+        self.queue_waits = deque(maxlen=1000)
+        self.models = {}  # модель -> ModelUsage
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+            timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+            retries=int(os.getenv("LLM_RETRIES", "3")),
+            api_base=os.getenv("OPENAI_API_BASE") or None,
+        )
+
+    def _semaphore(self):
+        # создаём лениво, чтобы семафор принадлежал работающему event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    def _backoff(self, attempt):
+        # "full jitter": случайная пауза от 0 до base * 2^attempt
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _call(self, **kwargs):
+        if self.api_base:
+            kwargs.setdefault("api_base", self.api_base)
+        return await asyncio.wait_for(load_openai().ChatCompletion.acreate(**kwargs), timeout=self.timeout)
+
+    async def complete(self, **kwargs):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            LLM_REQUESTS.labels("rejected").inc()
+            raise LLMQueueFull(f"В очереди уже {self.queued} запросов")
+
+        self.requests += 1
+        self.queued += 1
+        enqueued_at = time.monotonic()
+        try:
+            await self._semaphore().acquire()
+        finally:
+            self.queued -= 1
+        self.queue_waits.append(time.monotonic() - enqueued_at)
+        LLM_QUEUE_WAIT.observe(self.queue_waits[-1])
+
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    call_started = time.monotonic()
+                    response = await self._call(**kwargs)
+                    LLM_REQUESTS.labels("ok").inc()
+                    self._account(kwargs.get("model", "?"), response, time.monotonic() - call_started)
+                    return response
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.retries:
+                        self.failures += 1
+                        LLM_REQUESTS.labels("failed").inc()
+                        raise
+                    delay = self._backoff(attempt)
+                    attempt += 1
+                    self.retried += 1
+                    LLM_REQUESTS.labels("retried").inc()
+                    log(f"🔁 Повтор запроса к LLM ({attempt}/{self.retries}) через {delay:.2f} с: {e!r}",
+                        event="llm.retry", level="warning", attempt=attempt, delay=delay, error=repr(e))
+                    await asyncio.sleep(delay)
+                except Exception:
+                    self.failures += 1
+                    LLM_REQUESTS.labels("failed").inc()
+                    raise
+        finally:
+            self.latencies.append(time.monotonic() - started)
+            LLM_SECONDS.observe(self.latencies[-1])
+            self.in_flight -= 1
+            self._semaphore().release()
+
+    def _account(self, model, response, elapsed):
+        # usage из ответа: сколько токенов стоил промпт и ответ
+        usage = self.models.get(model)
+        if usage is None:
+            usage = self.models[model] = ModelUsage()
+        tokens = response.get("usage") or {}
+        prompt, completion = tokens.get("prompt_tokens", 0), tokens.get("completion_tokens", 0)
+        usage.calls += 1
+        usage.prompt_tokens += prompt
+        usage.completion_tokens += completion
+        usage.latencies.append(elapsed)
+        LLM_TOKENS.labels(model, "prompt").inc(prompt)
+        LLM_TOKENS.labels(model, "completion").inc(completion)
+        LLM_CALL_SECONDS.labels(model).observe(elapsed)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+            "queue_wait_p95": percentile(self.queue_waits, 95),
+            "models": {model: usage.stats() for model, usage in self.models.items()},
+        }
@@ -0,0 +1,245 @@
+import re
+from datetime import datetime, timedelta
+
+# Быстрый разбор типовых фраз без GPT. Возвращает те же структуры,
+# что и parse_with_gpt, плюс уверенность от 0 до 1.
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+WEEKDAY_PATTERNS = [
+    r"понедельник(?:а|у|ом|и|ам|ами)?",
+    r"вторник(?:а|у|ом|и|ам|ами)?",
+    r"сред(?:а|у|ы|е|ам|ами)",
+    r"четверг(?:а|у|ом|и|ам|ами)?",
+    r"пятниц(?:а|у|ы|е|ам|ами)",
+    r"суббот(?:а|у|ы|е|ам|ами)",
+    r"воскресень(?:е|я|ю|ям|ями)",
+]
+WEEKDAY_ANY = "(?:" + "|".join(WEEKDAY_PATTERNS) + ")"
+WEEKDAY_RES = [re.compile(r"^" + p + r"$", re.IGNORECASE) for p in WEEKDAY_PATTERNS]
+
+MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+
+NUMBER_WORDS = {
+    "одну": 1, "один": 1, "одна": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10, "пятнадцать": 15,
+    "двадцать": 20, "тридцать": 30, "сорок": 40,
+}
+
+F = re.IGNORECASE
+
+PREFIX_RE = re.compile(r"^\s*(?:пожалуйста\s*,?\s*)?(?:напомни(?:те)?|напоминай(?:те)?)(?:\s+мне)?(?:\s*,?\s*пожалуйста)?\s*,?", F)
+
+EVERY_DAY_RE = re.compile(
+    r"\b(?:ежедневно|каждый\s+день|каждое\s+(?P<part>утро|вечер)|каждый\s+(?P<part2>вечер)|каждую\s+ночь)\b", F)
+WEEKDAYS_RE = re.compile(r"\b(?:по\s+будн(?:ям|им\s+дням)|в\s+будни|по\s+рабочим\s+дням)\b", F)
+WEEKENDS_RE = re.compile(r"\b(?:по\s+выходным|в\s+выходные)\b", F)
+DAY_LIST_RE = re.compile(
+    r"\b(?:каждый|каждую|каждое|по)\s+(" + WEEKDAY_ANY + r"(?:\s*(?:,|и)\s*(?:по\s+|в\s+|во\s+)?" + WEEKDAY_ANY + r")*)\b", F)
+ON_WEEKDAY_RE = re.compile(r"\b(?:в|во)\s+(" + WEEKDAY_ANY + r")\b", F)
+
+RELATIVE_DAY_RE = re.compile(r"\b(сегодня|завтра|послезавтра)\b", F)
+IN_RE = re.compile(
+    r"\bчерез\s+(?:(\d+|" + "|".join(NUMBER_WORDS) + r")\s+)?"
+    r"(полчаса|минут[уы]?|мин|час(?:а|ов)?|дн(?:я|ей)|день|недел[юи]|неделя)\b", F)
+NUM_DATE_RE = re.compile(r"\b(\d{1,2})\.(\d{1,2})(?:\.(\d{2}|\d{4}))?\b")
+WORD_DATE_RE = re.compile(r"\b(\d{1,2})(?:-?го)?\s+(" + "|".join(MONTHS) + r")(?:\s+(\d{4})(?:\s*г(?:ода|\.)?)?)?\b", F)
+
+# "10:00" — время всегда, "10.30" — только после "в", иначе это дата
+TIME_HM_RE = re.compile(
+    r"(?:\b(?:в|к|на)\s+\b([01]?\d|2[0-3])[:.]|\b([01]?\d|2[0-3]):)([0-5]\d)\b(?:\s+(утра|дня|вечера|ночи))?", F)
+TIME_H_RE = re.compile(
+    r"\b(?:в|к)\s+(\d{1,2})(?:\s*час(?:а|ов)?)?(?:\s+(утра|дня|вечера|ночи))?\b(?![:.]\d)", F)
+NOON_RE = re.compile(r"\b(?:в\s+)?(полдень|полночь)\b", F)
+PART_OF_DAY_RE = re.compile(r"\b(утром|днём|днем|вечером|ночью)\b", F)
+
+# Слова, которые остались после разбора и намекают, что мы что-то не поняли
+SUSPICIOUS_RE = re.compile(
+    r"\b(через|после|до|каждые|каждый|каждую|каждое|раз|неделе|месяц\w*|числа|утром|вечером|днём|днем|ночью|"
+    r"понедельник\w*|вторник\w*|сред[аеуы]|четверг\w*|пятниц\w*|суббот\w*|воскресень\w*)\b|\d", F)
+FILLER_RE = re.compile(
+    r"^(?:\s|,|\.|—|-|:|\b(?:и|в|во|на|что|чтобы|нужно|надо)\b)+|(?:\s|,|\.|—|-|:|\b(?:и|в|во|на)\b)+$", F)
+
+
+def _weekday_index(word):
+    for i, r in enumerate(WEEKDAY_RES):
+        if r.match(word):
+            return i
+    return None
+
+
+def _apply_part(hour, part):
+    part = (part or "").lower()
+    if part in ("дня", "вечера", "днём", "днем", "вечером") and hour < 12:
+        return hour + 12
+    if part in ("ночи", "ночью") and hour == 12:
+        return 0
+    return hour
+
+
+class _Text:
+    # Строка, из которой по мере разбора вырезаются распознанные куски
+    def __init__(self, text):
+        self.value = text
+
+    def take(self, regex, limit=0):
+        found = []
+
+        def repl(m):
+            found.append(m)
+            return " "
+        self.value = regex.sub(repl, self.value, count=limit)
+        return found
+
+
+def parse_local(text, now):
+    # now — текущее время (aware) в часовом поясе пользователя
+    if not text or len(text) > 300:
+        return None, 0.0
+    t = _Text(PREFIX_RE.sub(" ", text, count=1))
+    confidence = 1.0
+
+    # 🔁 повторяемость
+    repeat = None
+    part_hint = None
+    for m in t.take(EVERY_DAY_RE, 1):
+        repeat = list(range(7))
+        part_hint = m.group("part") or m.group("part2")
+    if repeat is None and t.take(WEEKDAYS_RE, 1):
+        repeat = [0, 1, 2, 3, 4]
+    if repeat is None and t.take(WEEKENDS_RE, 1):
+        repeat = [5, 6]
+    if repeat is None:
+        for m in t.take(DAY_LIST_RE, 1):
+            words = re.findall(WEEKDAY_ANY, m.group(1), F)
+            repeat = sorted({_weekday_index(w) for w in words})
+    if part_hint:
+        part_hint = {"утро": "утра", "вечер": "вечера"}.get(part_hint.lower(), part_hint)
+
+    # ⏰ время (может быть несколько: "в 10:00 и в 18:00")
+    times = []
+    for m in t.take(NOON_RE):
+        times.append((12, 0) if m.group(1).lower() == "полдень" else (0, 0))
+    for m in t.take(TIME_HM_RE):
+        hour = int(m.group(1) or m.group(2))
+        times.append((_apply_part(hour, m.group(4) or part_hint), int(m.group(3))))
+    for m in t.take(TIME_H_RE):
+        hour = int(m.group(1))
+        if hour > 23:
+            return None, 0.0
+        times.append((_apply_part(hour, m.group(2) or part_hint), 0))
+    parts = t.take(PART_OF_DAY_RE)
+    if parts and times:
+        times = [(_apply_part(h, parts[0].group(1)), mi) for h, mi in times]
+    elif parts:
+        confidence = min(confidence, 0.3)  # "завтра утром" — без точного времени
+    times = sorted(set(times))
+
+    # 📅 дата
+    date = None
+    relative = None
+    if repeat is None:
+        for m in t.take(IN_RE, 1):
+            relative = _relative_delta(m.group(1), m.group(2))
+        for m in t.take(RELATIVE_DAY_RE, 1):
+            word = m.group(1).lower()
+            date = now.date() + timedelta(days={"сегодня": 0, "завтра": 1, "послезавтра": 2}[word])
+        for m in t.take(WORD_DATE_RE, 1):
+            date = _make_date(now, int(m.group(1)), MONTHS[m.group(2).lower()], m.group(3))
+            if date is None:
+                return None, 0.0
+        for m in t.take(NUM_DATE_RE, 1):
+            date = _make_date(now, int(m.group(1)), int(m.group(2)), m.group(3))
+            if date is None:
+                return None, 0.0
+        for m in t.take(ON_WEEKDAY_RE, 1):
+            wd = _weekday_index(m.group(1))
+            days_ahead = (wd - now.weekday()) % 7
+            if days_ahead == 0:
+                days_ahead = 7
+                confidence = min(confidence, 0.6)  # "в понедельник", сказанное в понедельник
+            date = now.date() + timedelta(days=days_ahead)
+
+    task_text = FILLER_RE.sub("", re.sub(r"\s+", " ", t.value)).strip()
+    if not task_text:
+        return None, 0.0
+    if SUSPICIOUS_RE.search(task_text):
+        confidence = min(confidence, 0.5)
+
+    # 🔁 Повторяющаяся задача
+    if repeat is not None:
+        if len(times) != 1:
+            return None, 0.0
+        h, mi = times[0]
+        return {
+            "text": task_text,
+            "time": f"{h:02d}:{mi:02d}",
+            "repeat": [WEEKDAY_NAMES[d] for d in repeat],
+        }, confidence
+
+    # ⏳ "через 20 минут"
+    if relative is not None:
+        if times or date:
+            return None, 0.0
+        # normalize поправит смещение, если между сейчас и результатом перевели часы
+        when = now.tzinfo.normalize(now + relative) if hasattr(now.tzinfo, "normalize") else now + relative
+        when = when.replace(second=0, microsecond=0, tzinfo=None)
+        return {"text": task_text, "time": when.isoformat()}, confidence
+
+    if not times:
+        return None, 0.0
+
+    if date is None:
+        # только время: каждое — сегодня, а если уже прошло — завтра
+        # ("в 10:00 и в 18:00" в полдень: сегодня в 18:00 и завтра в 10:00)
+        confidence = min(confidence, 0.9)
+        naive_now = now.replace(tzinfo=None)
+        today = datetime.combine(now.date(), datetime.min.time())
+        moments = [today.replace(hour=h, minute=mi) for h, mi in times]
+        moments = sorted(m if m > naive_now else m + timedelta(days=1) for m in moments)
+        moments = [m.isoformat() for m in moments]
+    else:
+        moments = [datetime.combine(date, datetime.min.time()).replace(hour=h, minute=mi).isoformat()
+                   for h, mi in times]
+    if len(moments) == 1:
+        return {"text": task_text, "time": moments[0]}, confidence
+    return {"text": task_text, "time": moments}, confidence
+
+
+def _relative_delta(amount, unit):
+    unit = unit.lower()
+    if unit == "полчаса":
+        return timedelta(minutes=30)
+    if amount is None:
+        n = 1
+    elif amount.isdigit():
+        n = int(amount)
+    else:
+        n = NUMBER_WORDS[amount.lower()]
+    if unit.startswith("мин"):
+        return timedelta(minutes=n)
+    if unit.startswith("час"):
+        return timedelta(hours=n)
+    if unit.startswith("нед"):
+        return timedelta(weeks=n)
+    return timedelta(days=n)
+
+
+def _make_date(now, day, month, year):
+    if year is not None:
+        year = int(year)
+        if year < 100:
+            year += 2000
+    try:
+        date = now.date().replace(year=year or now.year, month=month, day=day)
+    except ValueError:
+        return None
+    if year is None and date < now.date():
+        try:
+            date = date.replace(year=date.year + 1)
+        except ValueError:
+            return None
+    return date
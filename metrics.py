@@ -0,0 +1,505 @@
+import os
+import sys
+import json
+import time
+import bisect
+import signal
+import functools
+import threading
+from collections import Counter as _Tally
+
+# Метрики в формате Prometheus, структурные логи и семплирующий профайлер.
+# Всё в одном процессе и без зависимостей: счётчики и гистограммы — это
+# словари в памяти, /metrics отдаёт их текстом. Обновляются не только из event
+# loop: instrument_store оборачивает и вызовы хранилища в потоках executor
+# (архив, коммит outbox), поэтому каждое значение меняется под своей
+# блокировкой. aiohttp нужен только серверу /metrics — импортируем его при
+# запуске сервера, а не при импорте модуля.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text — как раньше, json — одна JSON-строка на событие
+
+
+def log(message, event=None, level="info", **fields):
+    # message — привычная строка с эмодзи, event и fields — для машинного разбора
+    if LOG_FORMAT != "json":
+        print(message)
+        return
+    record = {"ts": round(time.time(), 3), "level": level, "event": event, "msg": message}
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._fn = None
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def set_function(self, fn):
+        # значение считается при каждом запросе /metrics (размеры очередей и т.п.)
+        self._fn = fn
+        return self
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self._fn is not None:
+            lines.append(f"{self.name} {_format_value(self._fn())}")
+            return lines
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default().dec(amount)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        # снимок под блокировкой: _count и сумма бакетов должны совпадать
+        with self._lock:
+            counts, sum_, count = list(self.counts), self.sum, self.count
+        lines = []
+        total = 0
+        for bound, n in zip(self.bounds + (float("inf"),), counts):
+            total += n
+            le = (("le", _format_value(float(bound))),)
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {total}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(sum_)}")
+        lines.append(f"{name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_target", "_started")
+
+    def __init__(self, target):
+        self._target = target
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._target.observe(time.perf_counter() - self._started)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return _Timer(self._default())
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Метрика {name} уже объявлена с другим типом или метками")
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for name in sorted(self._metrics):
+            try:
+                lines.extend(self._metrics[name].render())
+            except Exception as e:
+                lines.append(f"# {name}: {e!r}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+HANDLER_SECONDS = histogram("jarvis_handler_seconds", "Время обработчика Telegram", ("handler",))
+HANDLER_ERRORS = counter("jarvis_handler_errors_total", "Исключения в обработчиках", ("handler",))
+STORE_SECONDS = histogram("jarvis_store_seconds", "Время операций хранилища задач", ("op",),
+                          buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0))
+STORE_ERRORS = counter("jarvis_store_errors_total", "Ошибки операций хранилища", ("op",))
+
+
+def tracked(name=None):
+    # декоратор обработчика: время и ошибки в jarvis_handler_*
+    def wrap(fn):
+        label = name or fn.__name__
+        seconds = HANDLER_SECONDS.labels(label)
+        errors = HANDLER_ERRORS.labels(label)
+
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+        return handler
+    return wrap
+
+
+STORE_METHODS = ("all_tasks", "chat_tasks", "get", "repeating_tasks", "tasks_since", "max_id", "chat_ids",
+                 "due_between", "chat_records", "repeating_records", "records_since", "due_records",
+                 "expired_records", "add", "add_many", "delete", "delete_many", "delete_chat", "replace_all",
+                 "count",
+                 "chat_timezone", "set_chat_timezone")
+
+
+def instrument_store(store):
+    # оборачиваем методы экземпляра: у всех, кто держит ссылку на store, появятся метрики
+    for op in STORE_METHODS:
+        method = getattr(store, op, None)
+        if method is None:
+            continue
+        setattr(store, op, _timed_method(method, STORE_SECONDS.labels(op), STORE_ERRORS.labels(op)))
+    return store
+
+
+def _timed_method(method, seconds, errors):
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+    return call
+
+
+class SamplingProfiler:
+    # Раз в interval секунд снимает стек главного потока и считает одинаковые
+    # стеки. Результат — «свёрнутые» стеки (flamegraph.pl, speedscope).
+    # Включается и выключается на ходу, накладные расходы — только пока включён.
+    # Снимки пишет фоновый поток, а читают обработчики /debug/profiler, поэтому
+    # samples и total меняются и читаются под _lock.
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.samples = _Tally()
+        self.total = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        if self.running:
+            return False
+        if interval:
+            self.interval = interval
+        with self._lock:
+            self.samples = _Tally()
+            self.total = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            with self._lock:
+                self.samples[key] += 1
+                self.total += 1
+
+    def snapshot(self):
+        # -> (копия samples, total): по копии можно ходить, пока поток пишет снимки
+        with self._lock:
+            return _Tally(self.samples), self.total
+
+    def folded(self):
+        samples, _ = self.snapshot()
+        return "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
+
+    def top(self, limit=20):
+        # функции, в которых чаще всего стоял поток (без вызванных из них)
+        samples, total = self.snapshot()
+        leaves = _Tally()
+        for stack, n in samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        return [(fn, n, n / total if total else 0.0) for fn, n in leaves.most_common(limit)]
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+    def install_signal(self, loop, sig=getattr(signal, "SIGUSR2", None), path=None):
+        # kill -USR2 <pid>: включить; ещё раз — выключить и записать стеки в файл.
+        # Обработчик — через event loop, а не signal.signal: тот прерывает главный
+        # поток где угодно, в том числе внутри snapshot() с захваченным _lock
+        if sig is None:
+            return
+        path = path or f"profile-{os.getpid()}.folded"
+
+        def handle():
+            if self.running:
+                self.stop()
+                log(f"🔬 Профайлер выключен: {self.total} снимков в {self.dump(path)}",
+                    event="profiler.stop", samples=self.total, path=path)
+            else:
+                self.start()
+                log(f"🔬 Профайлер включён, шаг {self.interval * 1000:.0f} мс",
+                    event="profiler.start", interval=self.interval)
+        try:
+            loop.add_signal_handler(sig, handle)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+
+PROFILER = SamplingProfiler(float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000)
+
+
+class StartupProfile:
+    # время запуска по фазам: mark(phase) закрывает фазу, начатую предыдущим mark
+    # (первая — с импорта metrics). Заодно считаем, сколько модулей подгрузила фаза.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self._modules = len(sys.modules)
+        self.phases = {}  # фаза -> (мс, новых модулей)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        modules = len(sys.modules)
+        self.phases[phase] = ((now - self._last) * 1000, modules - self._modules)
+        self._last, self._modules = now, modules
+
+    def timings(self):
+        return {phase: ms for phase, (ms, _) in self.phases.items()}
+
+    def total_ms(self):
+        return (self._last - self.started) * 1000
+
+    def report(self):
+        total = self.total_ms() or 1.0
+        lines = [f"{'фаза':<20} {'мс':>8} {'%':>5} {'модулей':>8}"]
+        for phase, (ms, modules) in self.phases.items():
+            lines.append(f"{phase:<20} {ms:>8.1f} {ms / total:>5.0%} {modules:>8}")
+        lines.append(f"{'всего':<20} {total:>8.1f} {'':>5} {len(sys.modules):>8}")
+        return "\n".join(lines)
+
+
+STARTUP = StartupProfile()
+
+
+class MetricsServer:
+    # локальный HTTP: /metrics для Prometheus и /debug/profiler для профайлера
+    def __init__(self, registry=REGISTRY, profiler=PROFILER, listen="127.0.0.1", port=9464):
+        self.registry = registry
+        self.profiler = profiler
+        self.listen = listen
+        self.port = port
+        self._runner = None
+
+    @classmethod
+    def from_env(cls):
+        port = os.getenv("METRICS_PORT")
+        if not port:
+            return None
+        return cls(listen=os.getenv("METRICS_LISTEN", "127.0.0.1"), port=int(port))
+
+    async def metrics(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def profiler_state(self, request):
+        # GET /debug/profiler — свёрнутые стеки, ?format=top — самые горячие функции
+        from aiohttp import web
+        p = self.profiler
+        if request.query.get("format") == "top":
+            return web.json_response({
+                "running": p.running, "samples": p.total, "interval": p.interval,
+                "top": [{"function": fn, "samples": n, "share": round(share, 4)} for fn, n, share in p.top()],
+            })
+        return web.Response(text=p.folded(), content_type="text/plain")
+
+    async def profiler_control(self, request):
+        # POST /debug/profiler/start?interval_ms=5, POST /debug/profiler/stop
+        from aiohttp import web
+        action = request.match_info["action"]
+        if action == "start":
+            interval = request.query.get("interval_ms")
+            changed = self.profiler.start(float(interval) / 1000 if interval else None)
+        elif action == "stop":
+            changed = self.profiler.stop()
+        else:
+            return web.Response(status=404)
+        log(f"🔬 Профайлер: {action}", event=f"profiler.{action}", changed=changed)
+        return web.json_response({"running": self.profiler.running, "changed": changed,
+                                  "samples": self.profiler.total})
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_get("/debug/profiler", self.profiler_state)
+        app.router.add_post("/debug/profiler/{action}", self.profiler_control)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        log(f"📈 Метрики: http://{self.listen}:{self.port}/metrics", event="metrics.listen", port=self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        self.profiler.stop()
@@ -0,0 +1,342 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+
+from llm_client import percentile
+from dispatcher import MESSAGE_MAX
+from metrics import log, counter, histogram
+
+# Журнал сработавших напоминаний: доставка «хотя бы один раз».
+#
+# Сработавшее напоминание сначала записывается в outbox.db и только после
+# commit уходит в отправку; доставленное помечается отправленным. Что не успели
+# доставить до падения, после перезапуска уходит снова. Ключ (задача, смещение,
+# момент срабатывания) не даёт записать одно напоминание дважды, а checkpoint —
+# до какого момента куча уже разобрана — говорит, с какого времени догонять
+# пропущенное за время простоя.
+#
+# fsync на каждое напоминание дорог, поэтому пишем группами: всё, что
+# накопилось за flush_interval, — одна транзакция и один fsync.
+
+OUTBOX_COMMIT_SECONDS = histogram("jarvis_outbox_commit_seconds", "Запись пачки в журнал напоминаний (с fsync)",
+                                  buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+OUTBOX_BATCH_SIZE = histogram("jarvis_outbox_batch_size", "Напоминаний в одной записи журнала",
+                              buckets=(1, 5, 10, 50, 100, 500, 1000, 5000))
+OUTBOX_RESULTS = counter("jarvis_outbox_total", "Напоминания в журнале по результату", ("result",))
+
+CATCHUP_HEADER = "📭 Пока я был недоступен, прошло время для:"
+
+
+def reminder_key(task_id, offset, fire_at):
+    return f"{task_id}:{offset}:{int(fire_at)}"
+
+
+def split_reminder_key(key):
+    # "12:30:1700000000" -> (12, 30, 1700000000)
+    task_id, offset, fire_at = key.split(":")
+    return int(task_id), int(offset), int(fire_at)
+
+
+class OutboxItem:
+    # collapse: пропущенное напоминание — уйдёт строкой line в общей сводке чата
+    __slots__ = ("key", "task_id", "chat_id", "text", "line", "fire_at", "collapse")
+
+    def __init__(self, key, task_id, chat_id, text, fire_at, line=None, collapse=False):
+        self.key = key
+        self.task_id = task_id
+        self.chat_id = chat_id
+        self.text = text
+        self.line = line
+        self.fire_at = fire_at
+        self.collapse = collapse
+
+
+def compose(items):
+    # -> [(chat_id, text, fire_at, ключи)]: обычные — по одному, пропущенные —
+    # сводкой на чат, из нескольких смещений задачи остаётся самое позднее.
+    # Длинная сводка делится на несколько сообщений не длиннее MESSAGE_MAX
+    messages = []
+    missed = {}  # chat_id -> {task_id: OutboxItem}
+    keys = {}    # task_id -> ключи всех его пропущенных, в том числе не попавших в сводку
+    for item in items:
+        if not item.collapse:
+            messages.append((item.chat_id, item.text, item.fire_at, [item.key]))
+            continue
+        keys.setdefault(item.task_id, []).append(item.key)
+        latest = missed.setdefault(item.chat_id, {})
+        current = latest.get(item.task_id)
+        if current is None or item.fire_at > current.fire_at:
+            latest[item.task_id] = item
+    for chat_id, tasks in missed.items():
+        lines, size, part_keys = [CATCHUP_HEADER], len(CATCHUP_HEADER), []
+        for item in sorted(tasks.values(), key=lambda i: i.fire_at):
+            if len(lines) > 1 and size + 1 + len(item.line) > MESSAGE_MAX:
+                messages.append((chat_id, "\n".join(lines), fire_at, part_keys))
+                lines, size, part_keys = [CATCHUP_HEADER], len(CATCHUP_HEADER), []
+            lines.append(item.line)
+            size += 1 + len(item.line)
+            part_keys.extend(keys[item.task_id])
+            fire_at = item.fire_at
+        messages.append((chat_id, "\n".join(lines), fire_at, part_keys))
+    return messages
+
+
+class Outbox:
+    def __init__(self, path="outbox.db", flush_interval=0.05, max_batch=1000, retention=7 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retention = retention  # сколько помнить ключи и доставленные сообщения
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # commit = fsync
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                fire_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                keys TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_unsent ON outbox (id) WHERE sent_at IS NULL;
+            CREATE TABLE IF NOT EXISTS outbox_keys (
+                key TEXT PRIMARY KEY,
+                fire_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS outbox_meta (
+                name TEXT PRIMARY KEY,
+                value REAL
+            );
+        """)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "keys" not in columns:
+            # журналы до шардирования с отметкой после доставки
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN keys TEXT")
+        # при шардировании: кто отправляет и что доставлено (sharding.ReminderClaims)
+        self.claims = None
+        self._items = []
+        self._acks = []
+        self._watermark = None
+        self._saved_watermark = None
+        self._send = None
+        self._wakeup = None
+        self._flush_lock = None
+        self._runner = None
+        self._last_prune = 0.0
+        self.queued = 0
+        self.duplicates = 0
+        self.collapsed = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.replayed = 0
+        self.unacked = 0
+        self.commits = 0
+        self.committed_items = 0
+        self.commit_seconds = deque(maxlen=5000)
+
+    @classmethod
+    def from_env(cls):
+        # OUTBOX_PATH= (пусто) — без журнала, как раньше
+        path = os.getenv("OUTBOX_PATH", "outbox.db")
+        if not path:
+            return None
+        return cls(
+            path,
+            flush_interval=float(os.getenv("OUTBOX_FLUSH_MS", "50")) / 1000,
+            max_batch=int(os.getenv("OUTBOX_BATCH", "1000")),
+            retention=float(os.getenv("OUTBOX_RETENTION_DAYS", "7")) * 86400,
+        )
+
+    def checkpoint(self):
+        # до какого момента все сработавшие напоминания уже в журнале
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM outbox_meta WHERE name = 'checkpoint'").fetchone()
+        return row[0] if row else None
+
+    def add(self, items, now):
+        # из цикла планировщика: сработавшие напоминания и момент, до которого куча разобрана
+        self._items.extend(items)
+        self._watermark = now
+        if self._wakeup is not None and len(self._items) >= self.max_batch:
+            self._wakeup.set()
+
+    def ack(self, message_ids):
+        # из диспетчера: сообщения доставлены
+        self._acks.extend(message_ids)
+        self.delivered += len(message_ids)
+        self.unacked -= len(message_ids)
+        OUTBOX_RESULTS.labels("delivered").inc(len(message_ids))
+
+    def _ack_keys(self, acks):
+        # ключи напоминаний в доставленных сообщениях
+        keys = []
+        with self._lock:
+            for message_id in acks:
+                row = self._conn.execute("SELECT keys FROM outbox WHERE id = ?", (message_id,)).fetchone()
+                if row and row[0]:
+                    keys.extend(split_reminder_key(k) for k in row[0].split(","))
+        return keys
+
+    def _commit(self, items, acks, watermark, now):
+        fresh, messages = [], []
+        if self.claims is not None:
+            # общая база шардов — до своей транзакции: если та не запишется,
+            # повтор flush пройдёт оба шага заново, а они идемпотентны
+            if items:
+                ours = self.claims.claim([split_reminder_key(i.key) for i in items])
+                items = [i for i in items if split_reminder_key(i.key) in ours]
+            if acks:
+                self.claims.mark_sent(self._ack_keys(acks))
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for item in items:
+                    cur.execute("INSERT OR IGNORE INTO outbox_keys (key, fire_at) VALUES (?, ?)",
+                                (item.key, item.fire_at))
+                    if cur.rowcount:
+                        fresh.append(item)
+                for chat_id, text, fire_at, keys in compose(fresh):
+                    cur.execute("INSERT INTO outbox (chat_id, text, fire_at, created_at, keys) VALUES (?, ?, ?, ?, ?)",
+                                (chat_id, text, fire_at, now, ",".join(keys)))
+                    messages.append((cur.lastrowid, chat_id, text))
+                if acks:
+                    cur.executemany("UPDATE outbox SET sent_at = ? WHERE id = ?", [(now, i) for i in acks])
+                if watermark is not None:
+                    cur.execute(
+                        "INSERT INTO outbox_meta (name, value) VALUES ('checkpoint', ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                        (watermark,)
+                    )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return fresh, messages
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            watermark = self._watermark
+            if not self._items and not self._acks and watermark == self._saved_watermark:
+                return 0
+            items, self._items = self._items, []
+            acks, self._acks = self._acks, []
+            started = time.perf_counter()
+            try:
+                # fsync — в отдельном потоке, чтобы не останавливать цикл событий
+                fresh, messages = await asyncio.get_running_loop().run_in_executor(
+                    None, self._commit, items, acks, watermark, time.time())
+            except Exception as e:
+                self._items[:0] = items
+                self._acks[:0] = acks
+                log(f"❌ Не удалось записать журнал напоминаний: {e}", event="outbox.error", level="error",
+                    error=repr(e))
+                return 0
+            elapsed = time.perf_counter() - started
+            self._saved_watermark = watermark
+            self.commits += 1
+            self.committed_items += len(items)
+            self.commit_seconds.append(elapsed)
+            OUTBOX_COMMIT_SECONDS.observe(elapsed)
+            OUTBOX_BATCH_SIZE.observe(len(items))
+
+            duplicates = len(items) - len(fresh)
+            collapsed = sum(1 for i in fresh if i.collapse)
+            self.queued += len(fresh)
+            self.duplicates += duplicates
+            self.collapsed += collapsed
+            OUTBOX_RESULTS.labels("queued").inc(len(fresh))
+            OUTBOX_RESULTS.labels("duplicate").inc(duplicates)
+            OUTBOX_RESULTS.labels("collapsed").inc(collapsed)
+            for message_id, chat_id, text in messages:
+                self.unacked += 1
+                self._send(chat_id, text, message_id)
+            return len(messages)
+
+    def replay(self, now, drop_after):
+        # недоставленное с прошлого запуска: отправляем снова, слишком старое выбрасываем
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, chat_id, text, fire_at FROM outbox WHERE sent_at IS NULL ORDER BY id"
+            ).fetchall()
+            stale = [r[0] for r in rows if now - r[3] > drop_after]
+            if stale:
+                self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in stale])
+        self.dropped += len(stale)
+        OUTBOX_RESULTS.labels("dropped").inc(len(stale))
+        stale = set(stale)
+        for message_id, chat_id, text, _ in rows:
+            if message_id not in stale:
+                self.replayed += 1
+                self.unacked += 1
+                self._send(chat_id, text, message_id)
+        OUTBOX_RESULTS.labels("replayed").inc(len(rows) - len(stale))
+        return len(rows) - len(stale)
+
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?",
+                                     (now - self.retention,))
+            self._conn.execute("DELETE FROM outbox_keys WHERE fire_at < ?", (now - self.retention,))
+        return cur.rowcount
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if time.time() - self._last_prune > 3600:
+                self._last_prune = time.time()
+                try:
+                    self.prune()
+                except Exception as e:
+                    log(f"❌ Ошибка очистки журнала напоминаний: {e}", event="outbox.error", level="error",
+                        error=repr(e))
+
+    def start(self, send, drop_after=float("inf")):
+        # send(chat_id, text, message_id) — поставить в отправку; доставку подтверждает ack
+        self._send = send
+        replayed = self.replay(time.time(), drop_after)
+        if replayed:
+            log(f"📮 Повторно отправляется недоставленных напоминаний: {replayed}", event="outbox.replay",
+                replayed=replayed)
+        self._runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        await self.flush()  # подтверждения доставки и последний checkpoint
+        with self._lock:
+            self._conn.close()
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "duplicates": self.duplicates,
+            "collapsed": self.collapsed,
+            "dropped": self.dropped,
+            "delivered": self.delivered,
+            "replayed": self.replayed,
+            "unacked": self.unacked,
+            "commits": self.commits,
+            "batch_avg": self.committed_items / self.commits if self.commits else 0.0,
+            "commit_p95": percentile(self.commit_seconds, 95),
+        }
@@ -0,0 +1,144 @@
+import os
+import asyncio
+from collections import deque
+
+from parse_cache import normalize_phrase
+from llm_client import percentile
+from metrics import log, counter, histogram
+
+# Разбор фраз через GPT пачками. В часы пик много пользователей пишут
+# одновременно, и каждая фраза была отдельным запросом. Теперь запросы,
+# пришедшие за window секунд (или max_batch штук), уходят одним запросом со
+# списком фраз, а ответы раздаются ждущим обработчикам. Пока заняты все
+# max_in_flight слотов GPT, пачка продолжает копиться — ждать в очереди
+# клиента ей всё равно. Одинаковые фразы, которые уже ждут ответа,
+# склеиваются в один элемент пачки.
+
+BATCH_SIZE = histogram("jarvis_gpt_batch_size", "Фраз в одном запросе к GPT", buckets=(1, 2, 4, 8, 16, 32))
+BATCH_RESULTS = counter("jarvis_gpt_batch_total", "Разбор пачками по результату", ("result",))
+
+
+def coalesce_key(text, now):
+    # как у кэша разбора: фраза + пояс + минута (от них зависит «завтра в 10»)
+    return f"{now.tzinfo}|{now.strftime('%Y-%m-%dT%H:%M')}|{normalize_phrase(text)}"
+
+
+class ParseBatcher:
+    # single(text, now) -> результат или None; many([(text, now), ...]) -> список
+    # результатов в том же порядке (None — фразу не разобрали, её разберёт single)
+    # или None, если запрос не удался целиком (тогда по одной не повторяем)
+    def __init__(self, single, many, window=0.05, max_batch=8, max_in_flight=None):
+        self.single = single
+        self.many = many
+        self.window = window
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self._pending = []  # [(key, text, now)]
+        self._waiting = {}  # key -> Future
+        self._timer = None
+        self._in_flight = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self.sizes = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls, single, many, max_in_flight=None):
+        # LLM_BATCH_WINDOW_MS=0 — без пачек, только склейка одинаковых фраз
+        return cls(
+            single, many,
+            window=float(os.getenv("LLM_BATCH_WINDOW_MS", "50")) / 1000,
+            max_batch=int(os.getenv("LLM_BATCH_MAX", "8")),
+            max_in_flight=max_in_flight,
+        )
+
+    async def parse(self, text, now):
+        self.requests += 1
+        key = coalesce_key(text, now)
+        future = self._waiting.get(key)
+        if future is not None:
+            self.coalesced += 1
+            BATCH_RESULTS.labels("coalesced").inc()
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[key] = future
+        self._pending.append((key, text, now))
+        if len(self._pending) >= self.max_batch or self.window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_window)
+        # shield: отмена одного обработчика не должна отменять ответ для остальных
+        return await asyncio.shield(future)
+
+    def _busy(self):
+        return self.max_in_flight is not None and self._in_flight >= self.max_in_flight
+
+    def _on_window(self):
+        self._timer = None
+        if not self._busy():
+            self._flush()
+        # иначе пачку отправит первый освободившийся запрос
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._in_flight += 1
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            await self._process(batch)
+        finally:
+            self._in_flight -= 1
+            if self._pending and self._timer is None and not self._busy():
+                self._flush()
+
+    async def _process(self, batch):
+        try:
+            if len(batch) == 1:
+                _, text, now = batch[0]
+                results = [await self.single(text, now)]
+            else:
+                self.batches += 1
+                self.batched_items += len(batch)
+                results = await self.many([(text, now) for _, text, now in batch])
+                if results is None:
+                    results = [None] * len(batch)
+                    missing = []
+                    BATCH_RESULTS.labels("failed").inc(len(batch))
+                else:
+                    missing = [i for i, r in enumerate(results) if r is None]
+                if missing:
+                    # пачку разобрали не целиком — недостающие по одной
+                    self.fallbacks += len(missing)
+                    BATCH_RESULTS.labels("fallback").inc(len(missing))
+                    retried = await asyncio.gather(*(self.single(batch[i][1], batch[i][2]) for i in missing))
+                    for i, result in zip(missing, retried):
+                        results[i] = result
+            self.sizes.append(len(batch))
+            BATCH_SIZE.observe(len(batch))
+            BATCH_RESULTS.labels("batched" if len(batch) > 1 else "single").inc(len(batch))
+        except Exception as e:
+            results = [None] * len(batch)
+            BATCH_RESULTS.labels("error").inc(len(batch))
+            log(f"❌ Ошибка разбора пачкой: {e}", event="gpt.batch_error", level="error", error=repr(e))
+        for (key, _, _), result in zip(batch, results):
+            future = self._waiting.pop(key)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "batch_avg": self.batched_items / self.batches if self.batches else 0.0,
+            "batch_p95": percentile(self.sizes, 95),
+            "fallbacks": self.fallbacks,
+        }
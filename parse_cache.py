@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import time
+from collections import OrderedDict
+
+# Кэш ответов GPT. Повторяющиеся задачи не зависят от текущей даты и
+# хранятся долго по ключу из одной фразы; одноразовые ("завтра в 10")
+# зависят от "сегодня/сейчас", поэтому ключ включает дату и минуту.
+
+_SPACES_RE = re.compile(r"\s+")
+_EDGE_PUNCT_RE = re.compile(r"^[\s.,!?;:—-]+|[\s.,!?;:—-]+$")
+
+
+def normalize_phrase(text):
+    text = text.lower().replace("ё", "е")
+    text = _SPACES_RE.sub(" ", text)
+    return _EDGE_PUNCT_RE.sub("", text)
+
+
+class ParseCache:
+    def __init__(self, max_entries=5000, ttl_oneoff=120.0, ttl_recurring=7 * 24 * 3600.0, path=None):
+        self.max_entries = max_entries
+        self.ttl_oneoff = ttl_oneoff
+        self.ttl_recurring = ttl_recurring
+        self.path = path
+        self._data = OrderedDict()  # ключ -> (expires_at, result)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        if path:
+            self.load()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("PARSE_CACHE_SIZE", "5000")),
+            ttl_oneoff=float(os.getenv("PARSE_CACHE_TTL_ONEOFF", "120")),
+            ttl_recurring=float(os.getenv("PARSE_CACHE_TTL_RECURRING", str(7 * 24 * 3600))),
+            path=os.getenv("PARSE_CACHE_PATH") or None,
+        )
+
+    @staticmethod
+    def _keys(text, now):
+        phrase = normalize_phrase(text)
+        tz_name = str(now.tzinfo)
+        recurring_key = f"r|{tz_name}|{phrase}"
+        context_key = f"o|{tz_name}|{now.strftime('%Y-%m-%dT%H:%M')}|{phrase}"
+        return recurring_key, context_key
+
+    def _lookup(self, key, now_ts):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= now_ts:
+            del self._data[key]
+            self.expired += 1
+            return None
+        self._data.move_to_end(key)
+        return result
+
+    def get(self, text, now):
+        now_ts = time.time()
+        for key in self._keys(text, now):
+            result = self._lookup(key, now_ts)
+            if result is not None:
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, text, now, result):
+        if not result:
+            return
+        recurring_key, context_key = self._keys(text, now)
+        if isinstance(result, dict) and "repeat" in result:
+            key, ttl = recurring_key, self.ttl_recurring
+        else:
+            key, ttl = context_key, self.ttl_oneoff
+        self._data[key] = (time.time() + ttl, result)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return
+        now_ts = time.time()
+        for key, expires_at, result in items:
+            if expires_at > now_ts:
+                self._data[key] = (expires_at, result)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        now_ts = time.time()
+        items = [[k, e, r] for k, (e, r) in self._data.items() if e > now_ts]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,113 @@
+import bisect
+from functools import lru_cache
+from datetime import datetime, timedelta
+
+import pytz
+
+# Часовые пояса и повторения. Объекты поясов создаются один раз, локальное
+# время переводится в UTC с явными правилами для перевода часов, а ближайшие
+# срабатывания повторяющихся задач считаются пачкой и переиспользуются.
+
+DEFAULT_TZ = "Europe/Tallinn"
+EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=None)
+def zone(name):
+    return pytz.timezone(name or DEFAULT_TZ)
+
+
+def is_valid_zone(name):
+    try:
+        zone(name)
+        return True
+    except pytz.UnknownTimeZoneError:
+        return False
+
+
+@lru_cache(maxsize=None)
+def _transitions(tz):
+    # таблица переводов часов пояса: начала периодов (epoch) и смещения в секундах
+    times = getattr(tz, "_utc_transition_times", None)
+    if not times:
+        return [float("-inf")], [tz.utcoffset(EPOCH).total_seconds()]
+    starts = [float("-inf")] + [(t - EPOCH).total_seconds() for t in times[1:]]
+    offsets = [info[0].total_seconds() for info in tz._transition_info]
+    return starts, offsets
+
+
+def _offset_at(table, ts):
+    starts, offsets = table
+    return offsets[bisect.bisect_right(starts, ts) - 1]
+
+
+def local_timestamp(tz, naive):
+    # Локальное время -> epoch с учётом перевода часов:
+    # "дыра" (03:30 при переводе вперёд) — сдвиг вперёд на величину перевода (04:30),
+    # "нахлёст" (03:30 при переводе назад бывает дважды) — первое из двух.
+    # Смещение берём из таблицы переводов: pytz.localize раз в десять медленнее
+    table = _transitions(tz)
+    wall = (naive - EPOCH).total_seconds()
+    before = _offset_at(table, wall - 86400)
+    first = wall - before
+    if _offset_at(table, first) == before:
+        return first
+    after = _offset_at(table, wall + 86400)
+    second = wall - after
+    if _offset_at(table, second) == after:
+        return second
+    return first  # дыра: считаем по смещению до перевода
+
+
+def resolve_local(tz, naive):
+    return datetime.fromtimestamp(local_timestamp(tz, naive), tz)
+
+
+class Recurrence:
+    # "в hour:minute по дням из mask" в поясе tz; хранит следующие count срабатываний (UTC epoch)
+    __slots__ = ("tz", "hour", "minute", "mask", "count", "_base", "_times")
+
+    def __init__(self, tz, hour, minute, mask, count=8):
+        self.tz = tz
+        self.hour = hour
+        self.minute = minute
+        self.mask = mask
+        self.count = count
+        self._base = None
+        self._times = []
+
+    def _expand(self, after_ts):
+        times = []
+        day = datetime.fromtimestamp(after_ts, self.tz).date()
+        while len(times) < self.count:
+            if self.mask & (1 << day.weekday()):
+                ts = local_timestamp(self.tz, datetime(day.year, day.month, day.day, self.hour, self.minute))
+                if ts > after_ts:
+                    times.append(ts)
+            day += timedelta(days=1)
+        self._base = after_ts
+        self._times = times
+
+    def after(self, ts):
+        # первое срабатывание строго позже ts
+        if not self.mask & 0x7F:
+            return None
+        if self._base is None or ts < self._base or ts >= self._times[-1]:
+            self._expand(ts)
+        return self._times[bisect.bisect_right(self._times, ts)]
+
+    def upcoming(self, after_ts, n):
+        result = []
+        ts = after_ts
+        while len(result) < n:
+            ts = self.after(ts)
+            if ts is None:
+                break
+            result.append(ts)
+        return result
+
+
+@lru_cache(maxsize=65536)
+def recurrence(tz, hour, minute, mask):
+    # одно правило на всех, у кого одинаковые пояс, время и дни
+    return Recurrence(tz, hour, minute, mask)
@@ -0,0 +1,449 @@
+import os
+import time
+import heapq
+import asyncio
+from datetime import datetime
+
+from recurrence import DEFAULT_TZ, zone, recurrence
+from metrics import log, counter, histogram
+from outbox import OutboxItem, reminder_key
+from task_model import as_task
+
+# Один планировщик напоминаний вместо трёх задач JobQueue на каждую задачу:
+# общая куча по времени срабатывания и одна asyncio-задача, которая её разбирает.
+
+REMINDER_LAG = histogram("jarvis_reminder_lag_seconds", "Насколько позже заданного времени напоминание ушло в отправку",
+                         buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0, 300.0))
+REMINDERS_FIRED = counter("jarvis_reminders_fired_total", "Сработавшие напоминания")
+REMINDER_ERRORS = counter("jarvis_reminder_send_errors_total", "Ошибки отправки напоминаний")
+REMINDERS_SCHEDULED = counter("jarvis_reminders_scheduled_total", "Поставленные в кучу напоминания", ("kind",))
+REMINDERS_MISSED = counter("jarvis_reminders_missed_total", "Напоминания, сработавшие с опозданием (простой бота)",
+                           ("action",))
+
+# за сколько минут до срабатывания и с каким префиксом напоминать
+OFFSET_PREFIXES = {30: "⚠️ Через 30 мин:", 15: "⏱ Почти время:", 0: "🔔 Сейчас:"}
+
+
+def parse_offsets(value):
+    # "30,15,0" -> [30, 15, 0]
+    return sorted({int(x) for x in value.split(",") if x.strip()}, reverse=True)
+
+
+DEFAULT_OFFSETS = parse_offsets(os.getenv("REMINDER_OFFSETS", "30,15,0"))
+
+# пропущенные за время простоя: опоздавшие не больше CATCHUP_SEND секунд уходят
+# как обычно, до CATCHUP_DROP — одной сводкой на чат, более старые выбрасываются
+CATCHUP_SEND = float(os.getenv("REMINDER_CATCHUP_SEND", "600"))
+CATCHUP_DROP = float(os.getenv("REMINDER_CATCHUP_DROP", "86400"))
+
+# как часто без outbox-работы всё равно сохранять checkpoint
+CHECKPOINT_EVERY = 30.0
+
+
+def offset_prefix(minutes):
+    return OFFSET_PREFIXES.get(minutes) or f"⏰ Через {minutes} мин:"
+
+
+class Reminder:
+    __slots__ = ("fire_at", "task_id", "chat_id", "text", "offset", "repeat_mask", "hour", "minute", "tz", "cancelled")
+
+    def __init__(self, fire_at, task_id, chat_id, text, offset, repeat_mask=0, hour=0, minute=0, tz=None):
+        self.fire_at = fire_at
+        self.task_id = task_id
+        self.chat_id = chat_id
+        self.text = text
+        self.offset = offset
+        self.repeat_mask = repeat_mask
+        self.hour = hour
+        self.minute = minute
+        self.tz = tz
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.fire_at < other.fire_at
+
+
+def next_occurrence(tz, hour, minute, mask, offset_minutes, after_ts):
+    # Ближайший момент (epoch), когда надо напомнить за offset_minutes до
+    # повторяющейся задачи в hour:minute по дням из mask, строго позже after_ts
+    occurrence = recurrence(tz, hour, minute, mask).after(after_ts + offset_minutes * 60)
+    return None if occurrence is None else occurrence - offset_minutes * 60
+
+
+class ReminderEngine:
+    def __init__(self, tz_name=DEFAULT_TZ, offsets=None, catchup_send=CATCHUP_SEND, catchup_drop=CATCHUP_DROP):
+        self.tz = zone(tz_name)
+        self.offsets = offsets or DEFAULT_OFFSETS
+        self.catchup_send = catchup_send
+        self.catchup_drop = catchup_drop
+        self._heap = []
+        self._by_task = {}  # task_id -> [Reminder, ...]
+        self._chat_tasks = {}  # chat_id -> {task_id, ...}
+        self._chat_pending = {}  # chat_id -> сколько напоминаний ждёт
+        self._cancelled = 0
+        self._wakeup = None
+        self._runner = None
+        self._send = None
+        # при шардировании без журнала — кто отправляет и что доставлено
+        # (sharding.ReminderClaims); с журналом их сверяет outbox.Outbox
+        self.claims = None
+        # журнал сработавших напоминаний (outbox.Outbox); без него — сразу в отправку
+        self.outbox = None
+        self.sent = 0
+        self.send_errors = 0
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def _register(self, entry):
+        self._by_task.setdefault(entry.task_id, []).append(entry)
+        self._chat_tasks.setdefault(entry.chat_id, set()).add(entry.task_id)
+        self._chat_pending[entry.chat_id] = self._chat_pending.get(entry.chat_id, 0) + 1
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, entry)
+        self._register(entry)
+        if self._wakeup is not None and self._heap[0] is entry:
+            self._wakeup.set()
+
+    def tz_for(self, task):
+        # пояс, в котором задачу создали (у старых задач его нет)
+        return as_task(task, self.tz).zone(self.tz)
+
+    def _once_entries(self, task, now):
+        tz = task.zone(self.tz)
+        entries = []
+        for offset in self.offsets if task.offsets is None else task.offsets:
+            fire_at = task.due_at - offset * 60
+            if fire_at > now:
+                entries.append(Reminder(fire_at, task.id, task.chat_id, task.text, offset, tz=tz))
+        return entries
+
+    def _repeating_entries(self, task, now):
+        tz = task.zone(self.tz)
+        entries = []
+        for offset in self.offsets if task.offsets is None else task.offsets:
+            fire_at = next_occurrence(tz, task.hour, task.minute, task.mask, offset, now)
+            if fire_at is not None:
+                entries.append(Reminder(fire_at, task.id, task.chat_id, task.text, offset,
+                                        task.mask, task.hour, task.minute, tz))
+        return entries
+
+    # задачи — task_model.Task; словари (импорт, бенчмарки) разбираются на входе
+    def schedule_once(self, task, now=None):
+        task = as_task(task, self.tz)
+        entries = self._once_entries(task, time.time() if now is None else now)
+        for entry in entries:
+            self._push(entry)
+        REMINDERS_SCHEDULED.labels("once").inc(len(entries))
+        return len(entries)
+
+    def schedule_repeating(self, task, now=None):
+        task = as_task(task, self.tz)
+        entries = self._repeating_entries(task, time.time() if now is None else now)
+        for entry in entries:
+            self._push(entry)
+        REMINDERS_SCHEDULED.labels("repeating").inc(len(entries))
+        return len(entries)
+
+    def schedule_many(self, tasks, now=None):
+        # пачка задач (импорт): один проход по куче и одно пробуждение вместо push на каждое
+        now = time.time() if now is None else now
+        entries = []
+        for task in tasks:
+            task = as_task(task, self.tz)
+            if task.repeating:
+                entries.extend(self._repeating_entries(task, now))
+            else:
+                entries.extend(self._once_entries(task, now))
+        if not entries:
+            return 0
+        head = self._heap[0] if self._heap else None
+        for entry in entries:
+            self._register(entry)
+        if len(entries) > len(self._heap) // 4:
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        if self._wakeup is not None and self._heap[0] is not head:
+            self._wakeup.set()
+        REMINDERS_SCHEDULED.labels("bulk").inc(len(entries))
+        return len(entries)
+
+    def _forget(self, entry):
+        # напоминание больше не ждёт: сработало или отменено
+        left = self._chat_pending[entry.chat_id] - 1
+        if left:
+            self._chat_pending[entry.chat_id] = left
+        else:
+            del self._chat_pending[entry.chat_id]
+
+    def _forget_task(self, chat_id, task_id):
+        tasks = self._chat_tasks.get(chat_id)
+        if tasks is not None:
+            tasks.discard(task_id)
+            if not tasks:
+                del self._chat_tasks[chat_id]
+
+    def cancel(self, task_id):
+        entries = self._by_task.pop(task_id, ())
+        for entry in entries:
+            if not entry.cancelled:
+                entry.cancelled = True
+                self._cancelled += 1
+                self._forget(entry)
+        if entries:
+            self._forget_task(entries[0].chat_id, task_id)
+        # если отменённых накопилось много — пересобираем кучу
+        if self._cancelled > 1024 and self._cancelled * 2 > len(self._heap):
+            self._heap = [e for e in self._heap if not e.cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return len(entries)
+
+    def cancel_chat(self, chat_id):
+        count = 0
+        for task_id in list(self._chat_tasks.get(chat_id, ())):
+            count += self.cancel(task_id)
+        return count
+
+    def has_task(self, task_id):
+        return task_id in self._by_task
+
+    def chats(self):
+        return list(self._chat_tasks)
+
+    def pending_by_chat(self):
+        return dict(self._chat_pending)
+
+    def pending_for_chat(self, chat_id):
+        return self._chat_pending.get(chat_id, 0)
+
+    def pop_due(self, now):
+        due = []
+        heap = self._heap
+        while heap and heap[0].fire_at <= now:
+            entry = heapq.heappop(heap)
+            if entry.cancelled:
+                self._cancelled -= 1
+                continue
+            self._forget(entry)
+            entries = self._by_task.get(entry.task_id)
+            if entries is not None:
+                entries.remove(entry)
+                if not entries:
+                    del self._by_task[entry.task_id]
+                    self._forget_task(entry.chat_id, entry.task_id)
+            due.append(entry)
+            if entry.repeat_mask:
+                # следующее срабатывание — после "сейчас", чтобы после простоя не слать пачку старых
+                fire_at = next_occurrence(entry.tz, entry.hour, entry.minute, entry.repeat_mask, entry.offset,
+                                          max(entry.fire_at, now))
+                if fire_at is not None:
+                    self._push(Reminder(fire_at, entry.task_id, entry.chat_id, entry.text, entry.offset,
+                                        entry.repeat_mask, entry.hour, entry.minute, entry.tz))
+        return due
+
+    def next_fire_at(self):
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0].fire_at if self._heap else None
+
+    async def _fire(self, entry):
+        try:
+            if self.claims is not None:
+                key = (entry.task_id, entry.offset, int(entry.fire_at))
+                loop = asyncio.get_running_loop()
+                if not await loop.run_in_executor(None, self.claims.claim, [key]):
+                    return  # уже отправил другой воркер или задачу удалили
+            await self._send(entry.chat_id, f"{offset_prefix(entry.offset)} {entry.text}")
+            if self.claims is not None:
+                await loop.run_in_executor(None, self.claims.mark_sent, [key])
+            self.sent += 1
+        except Exception as e:
+            self.send_errors += 1
+            REMINDER_ERRORS.inc()
+            log(f"❌ Не удалось отправить напоминание: {e}", event="reminder.send_error", level="error",
+                chat_id=entry.chat_id, task_id=entry.task_id, error=repr(e))
+
+    def outbox_items(self, entries, now):
+        # сработавшие напоминания -> записи журнала; опоздавшие — по правилам догонялки
+        items = []
+        for entry in entries:
+            lag = now - entry.fire_at
+            if lag > self.catchup_drop:
+                REMINDERS_MISSED.labels("dropped").inc()
+                continue
+            key = reminder_key(entry.task_id, entry.offset, entry.fire_at)
+            text = f"{offset_prefix(entry.offset)} {entry.text}"
+            if lag <= self.catchup_send:
+                if lag > 60:
+                    REMINDERS_MISSED.labels("sent").inc()
+                items.append(OutboxItem(key, entry.task_id, entry.chat_id, text, entry.fire_at))
+                continue
+            REMINDERS_MISSED.labels("collapsed").inc()
+            due = datetime.fromtimestamp(entry.fire_at + entry.offset * 60, entry.tz or self.tz)
+            line = f"• {entry.text} — {due:%d.%m %H:%M}"
+            items.append(OutboxItem(key, entry.task_id, entry.chat_id, text, entry.fire_at, line, collapse=True))
+        self.sent += len(items)
+        return items
+
+    def _fire_due(self, now):
+        due = self.pop_due(now)
+        for entry in due:
+            REMINDER_LAG.observe(max(0.0, now - entry.fire_at))
+            REMINDERS_FIRED.inc()
+        if self.outbox is not None:
+            # синхронно: checkpoint не должен обогнать ещё не записанные напоминания
+            self.outbox.add(self.outbox_items(due, now), now)
+            return
+        for entry in due:
+            asyncio.create_task(self._fire(entry))
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        if self.outbox is not None:
+            # первый checkpoint — сразу при запуске, а не с первым напоминанием
+            self._fire_due(time.time())
+        while True:
+            next_at = self.next_fire_at()
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            if self.outbox is not None:
+                # просыпаемся и без напоминаний, чтобы checkpoint не отставал
+                timeout = CHECKPOINT_EVERY if timeout is None else min(timeout, CHECKPOINT_EVERY)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                continue  # появилось более раннее напоминание
+            except asyncio.TimeoutError:
+                pass
+            self._fire_due(time.time())
+
+    def start(self, send):
+        # send(chat_id, text) — корутина отправки сообщения
+        self._send = send
+        self._runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+
+class ReminderWindow:
+    # Ленивая загрузка: в кучу попадают только задачи, срабатывающие в
+    # ближайшие horizon секунд; остальные подгружаются фоном по индексу due_at.
+    # Повторяющиеся задачи срабатывают постоянно, поэтому грузятся сразу все.
+    def __init__(self, store, engine, horizon=24 * 3600, refill_every=None, lazy=True, owns=None):
+        self.store = store
+        self.engine = engine
+        self.horizon = horizon
+        self.refill_every = refill_every or horizon / 4
+        self.lazy = lazy
+        # owns(chat_id) — за какие чаты отвечает этот процесс (по умолчанию за все)
+        self.owns = owns or (lambda chat_id: True)
+        self.loaded_until = None
+        self.last_id = 0
+        self._runner = None
+
+    def covers(self, task):
+        # попадает ли одноразовая задача в уже загруженное окно
+        if not self.lazy or self.loaded_until is None:
+            return True
+        return as_task(task, self.engine.tz).due_at < self.loaded_until
+
+    def _schedule(self, task, now):
+        if task.repeating:
+            self.engine.schedule_repeating(task, now)
+        else:
+            self.engine.schedule_once(task, now)
+
+    def load_initial(self, now=None, since=None):
+        # since — checkpoint журнала: напоминания, сработавшие после него, пока бот
+        # не работал, попадут в кучу уже просроченными и уйдут по правилам догонялки
+        now = time.time() if now is None else now
+        since = now if since is None else max(min(since, now), now - self.engine.catchup_drop)
+        self.last_id = self.store.max_id()
+        count = 0
+        for task in self.store.repeating_records():
+            if self.owns(task.chat_id):
+                self.engine.schedule_repeating(task, since)
+                count += 1
+        if self.lazy:
+            until = now + self.horizon
+            once = self.store.due_records(since, until)
+            self.loaded_until = until
+        else:
+            once = self.store.due_records(since, float("inf"))
+        for task in once:
+            if self.owns(task.chat_id):
+                self.engine.schedule_once(task, since)
+                count += 1
+        return count
+
+    def load_chats(self, chat_ids, since):
+        # чаты перешли к этому процессу: грузим их задачи, включая напоминания,
+        # которые должны были сработать после since (доставленное сверит ReminderClaims)
+        count = 0
+        for chat_id in chat_ids:
+            for task in self.store.chat_records(chat_id):
+                if self.engine.has_task(task.id) or not (task.repeating or self.covers(task)):
+                    continue
+                self._schedule(task, since)
+                count += 1
+        return count
+
+    def sync_new(self, now=None):
+        # задачи, которые добавили другие процессы, пока мы работали
+        now = time.time() if now is None else now
+        count = 0
+        top = self.store.max_id()  # битые строки records_since пропускает — не перечитываем их каждый раз
+        for task in self.store.records_since(self.last_id):
+            if not self.owns(task.chat_id) or self.engine.has_task(task.id):
+                continue
+            if task.repeating or self.covers(task):
+                self._schedule(task, now)
+                count += 1
+        self.last_id = max(self.last_id, top)
+        return count
+
+    def refill(self, now=None):
+        now = time.time() if now is None else now
+        until = now + self.horizon
+        if self.loaded_until is None or until <= self.loaded_until:
+            return 0
+        tasks = [t for t in self.store.due_records(self.loaded_until, until) if self.owns(t.chat_id)]
+        for task in tasks:
+            self.engine.schedule_once(task, now)
+        self.loaded_until = until
+        return len(tasks)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refill_every)
+            try:
+                loaded = self.refill()
+                if loaded:
+                    log(f"📥 Подгружено задач в окно: {loaded}", event="window.refill", loaded=loaded)
+            except Exception as e:
+                log(f"❌ Ошибка подгрузки задач: {e}", event="window.error", level="error", error=repr(e))
+
+    def start(self):
+        if self.lazy:
+            self._runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
@@ -0,0 +1,394 @@
+import os
+import sys
+import time
+import bisect
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+import aiohttp
+from aiohttp import web
+
+from webhook import UpdateWorkerPool
+from metrics import log
+
+# Шардирование по chat_id: несколько процессов-воркеров, каждый отвечает за
+# свой диапазон консистентного хэша. Роутер принимает обновления от Telegram
+# и пересылает их воркеру-владельцу чата. Состав воркеров — в общей SQLite
+# (тот же tasks.db), там же отмечается, кто отправляет напоминание и дошло ли
+# оно, чтобы при переезде чата ничего не ушло дважды и не потерялось.
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=64):
+        self.nodes = tuple(sorted(nodes))
+        self._points = []
+        self._owners = []
+        for node in self.nodes:
+            for i in range(vnodes):
+                self._points.append((_hash(f"{node}#{i}"), node))
+        self._points.sort()
+        self._owners = [node for _, node in self._points]
+        self._points = [p for p, _ in self._points]
+
+    def owner(self, chat_id):
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(str(chat_id))) % len(self._points)
+        return self._owners[i]
+
+
+class _SqliteShared:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+
+MEMBERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS shard_members (
+        worker_id TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        heartbeat_at REAL NOT NULL
+    )
+"""
+
+
+class ShardMembership(_SqliteShared):
+    # живые воркеры: каждый раз в interval секунд обновляет heartbeat
+    def __init__(self, path, ttl=15.0):
+        super().__init__(path)
+        self.ttl = ttl
+        self._conn.execute(MEMBERS_TABLE)
+
+    def heartbeat(self, worker_id, url):
+        self._execute(
+            "INSERT INTO shard_members (worker_id, url, heartbeat_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET url = excluded.url, heartbeat_at = excluded.heartbeat_at",
+            (worker_id, url, time.time())
+        )
+
+    def leave(self, worker_id):
+        self._execute("DELETE FROM shard_members WHERE worker_id = ?", (worker_id,))
+
+    def members(self):
+        rows = self._execute(
+            "SELECT worker_id, url FROM shard_members WHERE heartbeat_at >= ?",
+            (time.time() - self.ttl,)
+        ).fetchall()
+        return dict(rows)
+
+
+class ReminderClaims(_SqliteShared):
+    # Кто отправляет напоминание и доставлено ли оно. Ключ — (задача, смещение,
+    # момент). Перед отправкой воркер берёт напоминание на себя, после доставки
+    # отмечает доставленным. Взятое, но не доставленное упавшим воркером (нет
+    # heartbeat дольше ttl) забирает новый владелец чата и отправляет сам;
+    # взятое живым воркером никто не трогает — при переезде чата не уйдёт дважды.
+    def __init__(self, path, worker_id, ttl=15.0):
+        super().__init__(path)
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self._conn.execute(MEMBERS_TABLE)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sent_reminders (
+                task_id INTEGER NOT NULL,
+                offset_min INTEGER NOT NULL,
+                fire_at INTEGER NOT NULL,
+                PRIMARY KEY (task_id, offset_min, fire_at)
+            ) WITHOUT ROWID
+        """)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(sent_reminders)")}
+        if "worker_id" not in columns:
+            # старые строки (worker_id NULL) считаются доставленными
+            self._conn.execute("ALTER TABLE sent_reminders ADD COLUMN worker_id TEXT")
+            self._conn.execute("ALTER TABLE sent_reminders ADD COLUMN delivered_at REAL")
+
+    def claim(self, keys):
+        # -> те из keys, что отправляем мы: новые, уже наши или брошенные упавшим
+        # воркером; задачи, удалённые в другом процессе, отсеиваем. Одна
+        # транзакция на пачку, вызывается из потока executor
+        ours = set()
+        alive_since = time.time() - self.ttl
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id, offset, fire_at in keys:
+                    cur.execute(
+                        "INSERT OR IGNORE INTO sent_reminders (task_id, offset_min, fire_at, worker_id) "
+                        "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM tasks WHERE id = ?)",
+                        (task_id, offset, fire_at, self.worker_id, task_id)
+                    )
+                    if not cur.rowcount:
+                        cur.execute(
+                            "UPDATE sent_reminders SET worker_id = ? "
+                            "WHERE task_id = ? AND offset_min = ? AND fire_at = ? "
+                            "AND delivered_at IS NULL AND worker_id IS NOT NULL "
+                            "AND (worker_id = ? OR worker_id NOT IN "
+                            "     (SELECT worker_id FROM shard_members WHERE heartbeat_at >= ?)) "
+                            "AND EXISTS (SELECT 1 FROM tasks WHERE id = ?)",
+                            (self.worker_id, task_id, offset, fire_at, self.worker_id, alive_since, task_id)
+                        )
+                    if cur.rowcount:
+                        ours.add((task_id, offset, fire_at))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return ours
+
+    def mark_sent(self, keys):
+        # доставленные напоминания — одной транзакцией
+        if not keys:
+            return
+        now = time.time()
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany(
+                    "INSERT INTO sent_reminders (task_id, offset_min, fire_at, worker_id, delivered_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (task_id, offset_min, fire_at) "
+                    "DO UPDATE SET delivered_at = excluded.delivered_at",
+                    [key + (self.worker_id, now) for key in keys]
+                )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def prune(self, older_than):
+        self._execute("DELETE FROM sent_reminders WHERE fire_at < ?", (int(older_than),))
+
+
+class ShardWorker:
+    # сторона бота: какие чаты наши, и что делать, когда состав воркеров меняется
+    def __init__(self, worker_id, url, membership, claims, window, interval=5.0):
+        self.worker_id = worker_id
+        self.url = url
+        self.membership = membership
+        self.claims = claims
+        self.window = window
+        self.engine = window.engine
+        self.interval = interval
+        # напоминания, которые могли пропустить за время переезда чата
+        self.grace = membership.ttl + 2 * interval
+        self.ring = HashRing([worker_id])
+        self.rebalances = 0
+        self.on_rebalance = None  # вызывается после смены состава воркеров
+        self._runner = None
+
+    def owns(self, chat_id):
+        return self.ring.owner(chat_id) == self.worker_id
+
+    def join(self):
+        self.membership.heartbeat(self.worker_id, self.url)
+        self.ring = HashRing(self.membership.members())
+
+    def refresh(self):
+        self.membership.heartbeat(self.worker_id, self.url)
+        members = self.membership.members()
+        if tuple(sorted(members)) == self.ring.nodes:
+            return
+        old = self.ring
+        self.ring = HashRing(members)
+        self.rebalances += 1
+
+        lost = [c for c in self.engine.chats() if not self.owns(c)]
+        for chat_id in lost:
+            self.engine.cancel_chat(chat_id)
+        gained = [c for c in self.window.store.chat_ids() if self.owns(c) and old.owner(c) != self.worker_id]
+        loaded = self.window.load_chats(gained, time.time() - self.grace)
+        if self.on_rebalance:
+            self.on_rebalance()
+        log(f"🔀 Перебалансировка: воркеры {sorted(members)}, отдали чатов {len(lost)}, "
+            f"забрали {len(gained)} ({loaded} задач)",
+            event="shard.rebalance", members=sorted(members), lost=len(lost), gained=len(gained), loaded=loaded)
+
+    async def run(self):
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.refresh()
+                # задачи, добавленные за время нашего сна, тоже могли уже сработать
+                self.window.sync_new(time.time() - self.grace)
+                if time.time() - last_prune > 3600:
+                    self.claims.prune(time.time() - 2 * 86400)
+                    last_prune = time.time()
+            except Exception as e:
+                log(f"❌ Ошибка шардирования: {e}", event="shard.error", level="error", error=repr(e))
+
+    def start(self):
+        self._runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        # уходим явно, чтобы остальные забрали наши чаты, не дожидаясь ttl
+        self.membership.leave(self.worker_id)
+
+
+UPDATE_KINDS = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                "chat_member", "chat_join_request")
+
+
+def chat_id_from_update(data):
+    for kind in UPDATE_KINDS:
+        obj = data.get(kind)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+    query = data.get("callback_query")
+    if query:
+        message = query.get("message")
+        return message["chat"]["id"] if message else query["from"]["id"]
+    for value in data.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return 0
+
+
+class ShardRouter:
+    # принимает обновления (webhook или getUpdates) и пересылает владельцу чата
+    def __init__(self, membership, secret=None, inbound_secret=None, workers=16, refresh=2.0, retries=10):
+        # secret — для пересылки воркерам, inbound_secret — проверка запросов от Telegram
+        self.membership = membership
+        self.secret = secret
+        self.inbound_secret = inbound_secret
+        self.refresh_every = refresh
+        self.retries = retries
+        self.members = {}
+        self.ring = HashRing()
+        self.pool = UpdateWorkerPool(self.forward, workers, key=chat_id_from_update)
+        self.forwarded = 0
+        self._session = None
+        self._refreshed_at = 0.0
+
+    def _refresh(self, force=False):
+        if force or time.monotonic() - self._refreshed_at > self.refresh_every:
+            self.members = self.membership.members()
+            self.ring = HashRing(self.members)
+            self._refreshed_at = time.monotonic()
+
+    async def forward(self, data):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret} if self.secret else {}
+        chat_id = chat_id_from_update(data)
+        for attempt in range(self.retries):
+            self._refresh(force=attempt > 0)
+            owner = self.ring.owner(chat_id)
+            if owner is not None:
+                try:
+                    async with self._session.post(self.members[owner], json=data, headers=headers) as resp:
+                        if resp.status == 200:
+                            self.forwarded += 1
+                            return
+                except aiohttp.ClientError:
+                    pass
+            # воркер недоступен: ждём, пока его heartbeat протухнет и чат переедет
+            await asyncio.sleep(min(5.0, 0.2 * 2 ** attempt))
+        log(f"❌ Не удалось переслать обновление {data.get('update_id')} для чата {chat_id}",
+            event="router.forward_failed", level="error", update_id=data.get("update_id"), chat_id=chat_id)
+
+    async def handle(self, request):
+        if self.inbound_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.inbound_secret:
+            return web.Response(status=403)
+        await self.pool.submit(await request.json())
+        return web.Response(text="ok")
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        self.pool.start()
+
+    async def stop(self):
+        await self.pool.drain()
+        await self.pool.stop()
+        await self._session.close()
+
+    async def set_webhook(self, token, url, api_url="https://api.telegram.org"):
+        data = {"url": url}
+        if self.inbound_secret:
+            data["secret_token"] = self.inbound_secret
+        async with self._session.post(f"{api_url.rstrip('/')}/bot{token}/setWebhook", json=data) as resp:
+            if resp.status != 200:
+                log(f"⚠️ setWebhook: {await resp.text()}", event="router.set_webhook", level="warning")
+
+    async def poll(self, token, api_url="https://api.telegram.org"):
+        # без публичного адреса: сами забираем обновления через getUpdates
+        offset = 0
+        url = f"{api_url.rstrip('/')}/bot{token}/getUpdates"
+        while True:
+            try:
+                async with self._session.post(url, json={"offset": offset, "timeout": 25},
+                                              timeout=aiohttp.ClientTimeout(total=35)) as resp:
+                    updates = (await resp.json()).get("result", [])
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log(f"⚠️ getUpdates: {e}", event="router.get_updates", level="warning", error=repr(e))
+                await asyncio.sleep(1)
+                continue
+            for data in updates:
+                offset = data["update_id"] + 1
+                await self.pool.submit(data)
+
+
+async def run_router():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    store_url = os.getenv("TASK_STORE", "sqlite:tasks.db")
+    membership = ShardMembership(store_url.partition(":")[2] or "tasks.db",
+                                 ttl=float(os.getenv("SHARD_TTL", "15")))
+    router = ShardRouter(membership, secret=os.getenv("SHARD_SECRET") or None,
+                         inbound_secret=os.getenv("WEBHOOK_SECRET") or None,
+                         workers=int(os.getenv("ROUTER_WORKERS", "16")))
+    await router.start()
+    token = os.getenv("BOT_TOKEN")
+    api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+    runner = None
+    if os.getenv("ROUTER_MODE", "poll") == "webhook":
+        app = web.Application()
+        path = os.getenv("WEBHOOK_PATH", "/telegram")
+        app.router.add_post(path, router.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = int(os.getenv("WEBHOOK_PORT", "8443"))
+        await web.TCPSite(runner, os.getenv("WEBHOOK_LISTEN", "0.0.0.0"), port).start()
+        if os.getenv("WEBHOOK_URL"):
+            await router.set_webhook(token, os.getenv("WEBHOOK_URL").rstrip("/") + path, api_url)
+        log(f"🌐 Роутер принимает webhook на порту {port}", event="router.listen", port=port)
+        main = asyncio.Event().wait()
+    else:
+        log("🔁 Роутер забирает обновления через getUpdates", event="router.poll")
+        main = router.poll(token, api_url)
+    try:
+        await main
+    finally:
+        if runner:
+            await runner.cleanup()
+        await router.stop()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["router"]:
+        print("Использование: python sharding.py router")
+        sys.exit(1)
+    try:
+        asyncio.run(run_router())
+    except KeyboardInterrupt:
+        pass
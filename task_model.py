@@ -0,0 +1,101 @@
+import sys
+from datetime import datetime
+
+from recurrence import zone, local_timestamp
+
+# Задача в памяти. Словари с ISO-временем и списком названий дней остаются
+# форматом обмена (GPT, импорт, tasks.json), а планировщик и расписание чата
+# держат разобранную задачу: срок — epoch, дни повтора — битовая маска,
+# тексты и пояса интернированы (одинаковые строки не дублируются).
+
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+DAY_INDEXES = {name: i for i, name in enumerate(DAY_NAMES)}
+
+
+def repeat_mask_for(days):
+    mask = 0
+    for d in days:
+        mask |= 1 << DAY_INDEXES[d]
+    return mask
+
+
+def days_for_mask(mask):
+    return [name for i, name in enumerate(DAY_NAMES) if mask & (1 << i)]
+
+
+def parse_clock(value):
+    # "09:30" -> (9, 30)
+    hour, minute = map(int, value.split(":"))
+    return hour, minute
+
+
+def parse_due(value, tz):
+    # ISO-время задачи -> epoch; время без пояса — локальное в tz
+    run_time = datetime.fromisoformat(value)
+    if run_time.tzinfo is None:
+        return local_timestamp(tz, run_time)
+    return run_time.timestamp()
+
+
+class Task:
+    # одноразовая: due_at — epoch; повторяющаяся: due_at None, hour:minute по дням из mask
+    __slots__ = ("id", "chat_id", "text", "due_at", "hour", "minute", "mask", "tz", "offsets")
+
+    def __init__(self, id, chat_id, text, due_at=None, hour=0, minute=0, mask=0, tz=None, offsets=None):
+        self.id = id
+        self.chat_id = int(chat_id)
+        self.text = sys.intern(text)
+        self.due_at = due_at
+        self.hour = hour
+        self.minute = minute
+        self.mask = mask
+        self.tz = sys.intern(tz) if tz else None  # имя пояса задачи; None — пояс по умолчанию
+        self.offsets = offsets  # свои минуты напоминаний вместо общих
+
+    @classmethod
+    def from_dict(cls, task, default_tz):
+        # default_tz — пояс для задач без своего поля tz
+        if "repeat" in task:
+            hour, minute = parse_clock(task["time"])
+            return cls(task.get("id"), task["chat_id"], task["text"], None, hour, minute,
+                       repeat_mask_for(task["repeat"]), task.get("tz"), task.get("offsets"))
+        due = parse_due(task["time"], zone(task["tz"]) if task.get("tz") else default_tz)
+        return cls(task.get("id"), task["chat_id"], task["text"], due, tz=task.get("tz"),
+                   offsets=task.get("offsets"))
+
+    @property
+    def repeating(self):
+        return self.due_at is None
+
+    @property
+    def clock(self):
+        return f"{self.hour:02d}:{self.minute:02d}"
+
+    @property
+    def days(self):
+        return days_for_mask(self.mask)
+
+    def zone(self, default_tz):
+        return zone(self.tz) if self.tz else default_tz
+
+    def local_time(self, tz):
+        return datetime.fromtimestamp(self.due_at, tz)
+
+    def to_dict(self, default_tz):
+        # обратно в формат обмена: время одноразовой — локальное в поясе задачи
+        task = {"id": self.id, "chat_id": self.chat_id, "text": self.text}
+        if self.repeating:
+            task["time"] = self.clock
+            task["repeat"] = self.days
+        else:
+            task["time"] = self.local_time(self.zone(default_tz)).replace(tzinfo=None).isoformat()
+        if self.tz:
+            task["tz"] = self.tz
+        if self.offsets is not None:
+            task["offsets"] = self.offsets
+        return task
+
+
+def as_task(task, default_tz):
+    # планировщик принимает и разобранные задачи, и словари (импорт, бенчмарки)
+    return task if isinstance(task, Task) else Task.from_dict(task, default_tz)
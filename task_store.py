@@ -0,0 +1,477 @@
+import os
+import json
+import sqlite3
+import threading
+
+from recurrence import DEFAULT_TZ, zone
+from task_model import Task, parse_clock, parse_due, repeat_mask_for
+from metrics import log
+
+
+def due_at_for(task, tz_name=DEFAULT_TZ):
+    # Время срабатывания в секундах epoch (только для одноразовых задач)
+    if "repeat" in task:
+        return None
+    try:
+        return parse_due(task["time"], zone(task.get("tz") or tz_name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _records(rows, convert):
+    # *_records отдают разобранные задачи (task_model.Task); битые строки пропускаем
+    records = []
+    for row in rows:
+        try:
+            records.append(convert(row))
+        except (ValueError, KeyError, TypeError) as e:
+            log(f"⚠️ Пропущена задача с неверным временем: {e}", event="store.bad_task", level="warning",
+                error=repr(e))
+    return records
+
+
+class JsonTaskStore:
+    # Старое поведение: весь список в одном файле, переписываем целиком
+    def __init__(self, path="tasks.json"):
+        self.path = path
+        self.settings_path = os.path.splitext(path)[0] + ".settings.json"
+        self._lock = threading.Lock()
+        self._next_id = None
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write(self, tasks):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(tasks, f)
+        os.replace(tmp, self.path)
+
+    def _assign_ids(self, tasks):
+        # -> выдали ли кому-то новый id
+        if self._next_id is None:
+            self._next_id = max((t.get("id", 0) for t in tasks), default=0) + 1
+        assigned = False
+        for t in tasks:
+            if "id" not in t:
+                t["id"] = self._next_id
+                self._next_id += 1
+                assigned = True
+        return assigned
+
+    def _load(self):
+        # в старом tasks.json задачи без id: выданные id сразу сохраняем,
+        # иначе следующее чтение выдаст другие и /delete N не найдёт задачу
+        tasks = self._read()
+        if self._assign_ids(tasks):
+            self._write(tasks)
+        return tasks
+
+    def all_tasks(self):
+        with self._lock:
+            return self._load()
+
+    def chat_tasks(self, chat_id):
+        return [t for t in self.all_tasks() if t["chat_id"] == chat_id]
+
+    def _to_record(self, task):
+        return Task.from_dict(task, zone(DEFAULT_TZ))
+
+    def chat_records(self, chat_id):
+        return _records(self.chat_tasks(chat_id), self._to_record)
+
+    def repeating_records(self):
+        return _records(self.repeating_tasks(), self._to_record)
+
+    def records_since(self, last_id):
+        return _records(self.tasks_since(last_id), self._to_record)
+
+    def due_records(self, start_ts, end_ts):
+        return _records(self.due_between(start_ts, end_ts), self._to_record)
+
+    def expired_records(self, before_ts, limit):
+        return self.due_records(float("-inf"), before_ts)[:limit]
+
+    def get(self, task_id):
+        for t in self.all_tasks():
+            if t["id"] == task_id:
+                return t
+        return None
+
+    def repeating_tasks(self):
+        return [t for t in self.all_tasks() if "repeat" in t]
+
+    def tasks_since(self, last_id):
+        return [t for t in self.all_tasks() if t["id"] > last_id]
+
+    def max_id(self):
+        return max((t["id"] for t in self.all_tasks()), default=0)
+
+    def chat_ids(self):
+        return list({t["chat_id"] for t in self.all_tasks()})
+
+    def due_between(self, start_ts, end_ts):
+        result = []
+        for t in self.all_tasks():
+            due = due_at_for(t)
+            if due is not None and start_ts <= due < end_ts:
+                result.append(t)
+        return sorted(result, key=due_at_for)
+
+    def add(self, task):
+        return self.add_many([task])[0]
+
+    def add_many(self, tasks):
+        with self._lock:
+            current = self._load()
+            added = [dict(t) for t in tasks]
+            self._assign_ids(added)
+            self._write(current + added)
+            return added
+
+    def delete(self, task_id):
+        with self._lock:
+            current = self._load()
+            left = [t for t in current if t["id"] != task_id]
+            self._write(left)
+            return len(left) != len(current)
+
+    def delete_many(self, task_ids):
+        task_ids = set(task_ids)
+        with self._lock:
+            current = self._load()
+            left = [t for t in current if t["id"] not in task_ids]
+            self._write(left)
+            return len(current) - len(left)
+
+    def delete_chat(self, chat_id):
+        with self._lock:
+            current = self._load()
+            left = [t for t in current if t["chat_id"] != chat_id]
+            self._write(left)
+            return len(current) - len(left)
+
+    def replace_all(self, tasks):
+        with self._lock:
+            tasks = [dict(t) for t in tasks]
+            self._assign_ids(tasks)
+            self._write(tasks)
+
+    def count(self):
+        return len(self.all_tasks())
+
+    def _read_settings(self):
+        try:
+            with open(self.settings_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def chat_timezone(self, chat_id):
+        return self._read_settings().get(str(chat_id), {}).get("tz")
+
+    def set_chat_timezone(self, chat_id, tz_name):
+        # повторяющиеся задачи чата переезжают в новый пояс вместе с ним
+        with self._lock:
+            settings = self._read_settings()
+            settings.setdefault(str(chat_id), {})["tz"] = tz_name
+            tmp = self.settings_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(settings, f)
+            os.replace(tmp, self.settings_path)
+            current = self._load()
+            for t in current:
+                if t["chat_id"] == chat_id and "repeat" in t:
+                    t["tz"] = tz_name
+            self._write(current)
+
+    def close(self):
+        pass
+
+
+class SqliteTaskStore:
+    # Каждая задача — отдельная строка, индексы по chat_id и времени срабатывания
+    def __init__(self, path="tasks.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")  # базу могут делить несколько процессов
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                time TEXT NOT NULL,
+                repeat TEXT,
+                due_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS chat_settings (
+                chat_id INTEGER PRIMARY KEY,
+                tz TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_chat ON tasks (chat_id, due_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (due_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_repeat ON tasks (id) WHERE repeat IS NOT NULL;
+        """)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(tasks)")}
+        if "tz" not in columns:
+            # базы до часовых поясов: у старых задач пояс по умолчанию
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN tz TEXT")
+        if "mask" not in columns:
+            # дни повтора битовой маской, чтобы не разбирать JSON при каждой загрузке
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN mask INTEGER")
+            rows = self._conn.execute("SELECT id, repeat FROM tasks WHERE repeat IS NOT NULL").fetchall()
+            self._conn.executemany("UPDATE tasks SET mask = ? WHERE id = ?",
+                                   [(repeat_mask_for(json.loads(r)), i) for i, r in rows])
+        if "offsets" not in columns:
+            # свои минуты напоминаний задачи (JSON-список); NULL — общие REMINDER_OFFSETS
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN offsets TEXT")
+
+    @staticmethod
+    def _row_to_task(row):
+        task = {"id": row[0], "chat_id": row[1], "text": row[2], "time": row[3]}
+        if row[4] is not None:
+            task["repeat"] = json.loads(row[4])
+        if row[6] is not None:
+            task["tz"] = row[6]
+        if row[7] is not None:
+            task["offsets"] = json.loads(row[7])
+        return task
+
+    @staticmethod
+    def _row_to_record(row):
+        task_id, chat_id, text, time_text, mask, due_at, tz, offsets = row
+        offsets = json.loads(offsets) if offsets is not None else None
+        if mask is not None:
+            hour, minute = parse_clock(time_text)
+            return Task(task_id, chat_id, text, None, hour, minute, mask, tz, offsets)
+        if due_at is None:
+            raise ValueError(f"задача {task_id}: нет срока у времени {time_text!r}")
+        return Task(task_id, chat_id, text, due_at, tz=tz, offsets=offsets)
+
+    @staticmethod
+    def _task_to_row(task):
+        if "repeat" in task:
+            repeat, mask = json.dumps(task["repeat"]), repeat_mask_for(task["repeat"])
+        else:
+            repeat = mask = None
+        offsets = json.dumps(task["offsets"]) if task.get("offsets") is not None else None
+        return (task["chat_id"], task["text"], task["time"], repeat, due_at_for(task), task.get("tz"), mask, offsets)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_task(r) for r in rows]
+
+    def _query_records(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return _records(rows, self._row_to_record)
+
+    def all_tasks(self):
+        return self._query("SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks ORDER BY id")
+
+    def chat_tasks(self, chat_id):
+        return self._query(
+            "SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks WHERE chat_id = ? ORDER BY id",
+            (chat_id,)
+        )
+
+    def get(self, task_id):
+        found = self._query(
+            "SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks WHERE id = ?",
+            (task_id,)
+        )
+        return found[0] if found else None
+
+    def repeating_tasks(self):
+        return self._query(
+            "SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks WHERE repeat IS NOT NULL ORDER BY id"
+        )
+
+    def tasks_since(self, last_id):
+        # задачи, добавленные после last_id (в том числе другими процессами)
+        return self._query(
+            "SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks WHERE id > ? ORDER BY id",
+            (last_id,)
+        )
+
+    # то же, но разобранными задачами: срок и маска дней берутся из столбцов как есть
+    def chat_records(self, chat_id):
+        return self._query_records(
+            "SELECT id, chat_id, text, time, mask, due_at, tz, offsets FROM tasks WHERE chat_id = ? ORDER BY id",
+            (chat_id,)
+        )
+
+    def repeating_records(self):
+        return self._query_records(
+            "SELECT id, chat_id, text, time, mask, due_at, tz, offsets FROM tasks WHERE repeat IS NOT NULL ORDER BY id"
+        )
+
+    def records_since(self, last_id):
+        return self._query_records(
+            "SELECT id, chat_id, text, time, mask, due_at, tz, offsets FROM tasks WHERE id > ? ORDER BY id",
+            (last_id,)
+        )
+
+    def due_records(self, start_ts, end_ts):
+        return self._query_records(
+            "SELECT id, chat_id, text, time, mask, due_at, tz, offsets FROM tasks "
+            "WHERE due_at >= ? AND due_at < ? ORDER BY due_at",
+            (start_ts, end_ts)
+        )
+
+    def expired_records(self, before_ts, limit):
+        # одноразовые задачи со сроком раньше before_ts, самые старые первыми — кандидаты в архив
+        return self._query_records(
+            "SELECT id, chat_id, text, time, mask, due_at, tz, offsets FROM tasks WHERE due_at < ? ORDER BY due_at LIMIT ?",
+            (before_ts, limit)
+        )
+
+    def max_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+
+    def chat_ids(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT chat_id FROM tasks")]
+
+    def due_between(self, start_ts, end_ts):
+        return self._query(
+            "SELECT id, chat_id, text, time, repeat, due_at, tz, offsets FROM tasks "
+            "WHERE due_at >= ? AND due_at < ? ORDER BY due_at",
+            (start_ts, end_ts)
+        )
+
+    def add(self, task):
+        return self.add_many([task])[0]
+
+    def add_many(self, tasks):
+        added = []
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for task in tasks:
+                    cur.execute(
+                        "INSERT INTO tasks (chat_id, text, time, repeat, due_at, tz, mask, offsets) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        self._task_to_row(task)
+                    )
+                    added.append(dict(task, id=cur.lastrowid))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return added
+
+    def delete(self, task_id):
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        return cur.rowcount > 0
+
+    def delete_many(self, task_ids):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany("DELETE FROM tasks WHERE id = ?", [(i,) for i in task_ids])
+                deleted = cur.rowcount
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def delete_chat(self, chat_id):
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tasks WHERE chat_id = ?", (chat_id,))
+        return cur.rowcount
+
+    def replace_all(self, tasks):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("DELETE FROM tasks")
+                for task in tasks:
+                    if "id" in task:
+                        cur.execute(
+                            "INSERT INTO tasks (id, chat_id, text, time, repeat, due_at, tz, mask, offsets) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (task["id"],) + self._task_to_row(task)
+                        )
+                    else:
+                        cur.execute(
+                            "INSERT INTO tasks (chat_id, text, time, repeat, due_at, tz, mask, offsets) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            self._task_to_row(task)
+                        )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def chat_timezone(self, chat_id):
+        with self._lock:
+            row = self._conn.execute("SELECT tz FROM chat_settings WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_chat_timezone(self, chat_id, tz_name):
+        # повторяющиеся задачи чата переезжают в новый пояс вместе с ним
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "INSERT INTO chat_settings (chat_id, tz) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET tz = excluded.tz",
+                    (chat_id, tz_name)
+                )
+                cur.execute("UPDATE tasks SET tz = ? WHERE chat_id = ? AND repeat IS NOT NULL", (tz_name, chat_id))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_store(json_path, store):
+    # Одноразовый перенос tasks.json в новое хранилище; исходный файл переименовываем
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r") as f:
+            tasks = json.load(f)
+    except ValueError as e:
+        log(f"⚠️ Не удалось прочитать {json_path}: {e}", event="store.migrate_error", level="warning", error=repr(e))
+        return 0
+
+    valid = [t for t in tasks if "chat_id" in t and "text" in t and "time" in t]
+    store.add_many(valid)
+    os.replace(json_path, json_path + ".migrated")
+    log(f"📦 Перенесено задач из {json_path}: {len(valid)}", event="store.migrated", tasks=len(valid))
+    return len(valid)
+
+
+def open_store(url=None):
+    # TASK_STORE=sqlite:tasks.db (по умолчанию) или json:tasks.json
+    url = url or os.getenv("TASK_STORE", "sqlite:tasks.db")
+    kind, _, path = url.partition(":")
+    if kind == "json":
+        return JsonTaskStore(path or "tasks.json")
+    if kind == "sqlite":
+        store = SqliteTaskStore(path or "tasks.db")
+        migrate_json_to_store("tasks.json", store)
+        return store
+    raise ValueError(f"Неизвестный тип хранилища: {kind}")
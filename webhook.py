@@ -0,0 +1,289 @@
+import os
+import time
+import signal
+import asyncio
+from collections import deque
+
+from telegram import Update
+from telegram.ext import Application
+
+from llm_client import percentile
+from admission import PARSE
+from metrics import log, histogram
+
+# Режим webhook: свой aiohttp-сервер принимает обновления от Telegram и
+# раскладывает их по ящикам чатов. Обновления одного чата обрабатываются по
+# порядку, разные чаты — параллельно. aiohttp нужен только серверу webhook —
+# в polling его не импортируем.
+
+UPDATE_WAIT = histogram("jarvis_update_wait_seconds", "Ожидание своей очереди в ящике чата")
+UPDATE_SECONDS = histogram("jarvis_update_seconds", "От приёма обновления до конца обработки")
+
+
+def update_chat_id(update):
+    chat = update.effective_chat
+    return chat.id if chat else 0
+
+
+class ChatMailbox:
+    __slots__ = ("items", "runner", "space", "submit_lock")
+
+    def __init__(self):
+        self.items = deque()   # (время получения, update, разбор ли — см. admission.py)
+        self.runner = None     # задача, которая разбирает ящик
+        self.space = asyncio.Event()
+        self.submit_lock = asyncio.Lock()  # отправители в полный ящик ждут по очереди
+
+
+class UpdateWorkerPool:
+    # У каждого чата свой ящик: обновления чата обрабатываются строго по
+    # порядку и по одному, разные чаты — параллельно, не больше workers сразу.
+    # Медленный чат (GPT, недоступный воркер шарда) не задерживает чужие.
+    def __init__(self, process, workers=8, queue_size=100, key=update_chat_id, max_pending=None, admission=None):
+        # process(update) — корутина обработки одного обновления,
+        # key(update) — по чему раскладывать обновления по ящикам,
+        # queue_size — ящик одного чата, max_pending — всего обновлений в ящиках,
+        # admission — лимиты на свободный текст (admission.py), None — без них
+        self._process = process
+        self._key = key
+        self.admission = admission
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_pending = max_pending or workers * queue_size
+        self._boxes = {}
+        self._slots = None
+        self._capacity = None
+        self._pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0       # сколько раз отправителю пришлось ждать места
+        self.max_depth = 0     # самый длинный ящик за всё время
+        self.latencies = deque(maxlen=5000)
+        self.waits = deque(maxlen=5000)  # ожидание своей очереди в ящике чата
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._capacity = asyncio.Semaphore(self.max_pending)
+        if self.admission:
+            self.admission.start(self.workers)
+
+    async def submit(self, update):
+        # если ящик чата или весь пул полон — ждём (Telegram подождёт ответа и не потеряет update)
+        key = self._key(update)
+        heavy = False
+        if self.admission:
+            kind = self.admission.admit(update, key)
+            if kind is None:
+                return  # отброшено, чат получит «занят»
+            heavy = kind == PARSE
+        box = self._boxes.get(key)
+        if box is None:
+            box = self._boxes[key] = ChatMailbox()
+        queued = False
+        try:
+            async with box.submit_lock:
+                if len(box.items) >= self.queue_size or self._capacity.locked():
+                    self.blocked += 1
+                while len(box.items) >= self.queue_size:
+                    box.space.clear()
+                    await box.space.wait()
+                await self._capacity.acquire()
+                box.items.append((time.monotonic(), update, heavy))
+                queued = True
+                self._pending += 1
+                self.max_depth = max(self.max_depth, len(box.items))
+                if box.runner is None:
+                    box.runner = asyncio.create_task(self._run(key, box))
+        finally:
+            if heavy and not queued:
+                # submit отменили, пока ждали места: фраза в ящик не попала
+                self.admission.finish()
+
+    async def _run(self, key, box):
+        try:
+            while box.items:
+                heavy = box.items[0][2]
+                if heavy:
+                    await self.admission.acquire()  # разбор не занимает воркеров, отложенных для кнопок
+                try:
+                    async with self._slots:
+                        received_at, update, _ = box.items.popleft()
+                        box.space.set()
+                        self.waits.append(time.monotonic() - received_at)
+                        UPDATE_WAIT.observe(self.waits[-1])
+                        try:
+                            await self._process(update)
+                            self.processed += 1
+                        except Exception as e:
+                            self.failed += 1
+                            log(f"❌ Ошибка обработки обновления: {e}", event="update.error", level="error",
+                                chat=key, error=repr(e))
+                        finally:
+                            self.latencies.append(time.monotonic() - received_at)
+                            UPDATE_SECONDS.observe(self.latencies[-1])
+                            self._pending -= 1
+                            self._capacity.release()
+                            if heavy:
+                                self.admission.finish()
+                finally:
+                    if heavy:
+                        self.admission.release()
+        finally:
+            box.runner = None
+            if not box.items and not box.submit_lock.locked() and self._boxes.get(key) is box:
+                del self._boxes[key]
+
+    def pending(self):
+        return self._pending
+
+    async def drain(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while self._pending:
+            runners = [b.runner for b in self._boxes.values() if b.runner is not None]
+            left = deadline - time.monotonic()
+            if not runners or left <= 0:
+                break
+            await asyncio.wait(runners, timeout=left)
+        if self._pending:
+            log(f"⚠️ Не дождались обработки {self._pending} обновлений", event="update.drain_timeout",
+                level="warning", pending=self._pending)
+
+    async def stop(self):
+        runners = [b.runner for b in self._boxes.values() if b.runner is not None]
+        for task in runners:
+            task.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        # что осталось в ящиках, уже не обработается — возвращаем счётчики
+        for box in self._boxes.values():
+            for _, _, heavy in box.items:
+                self._pending -= 1
+                if heavy:
+                    self.admission.finish()
+        self._boxes = {}
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "chats": len(self._boxes),
+            "deepest": max((len(b.items) for b in self._boxes.values()), default=0),
+            "max_depth": self.max_depth,
+            "blocked": self.blocked,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_p50": percentile(self.waits, 50),
+            "wait_p95": percentile(self.waits, 95),
+            "wait_max": max(self.waits, default=0.0),
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+        }
+
+
+class OrderedApplication(Application):
+    # polling: Application сам разбирает getUpdates по одному обновлению;
+    # с пулом он только раскладывает их по ящикам чатов, а обработка идёт параллельно
+    update_pool = None
+
+    async def process_update(self, update):
+        if self.update_pool is None:
+            return await super().process_update(update)
+        await self.update_pool.submit(update)
+
+    def use_update_pool(self, workers=8, queue_size=100, admission=None):
+        self.update_pool = UpdateWorkerPool(super().process_update, workers, queue_size, admission=admission)
+        return self.update_pool
+
+
+class WebhookServer:
+    def __init__(self, application, listen="0.0.0.0", port=8443, path="/telegram", secret=None,
+                 public_url=None, workers=8, queue_size=100, admission=None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.public_url = public_url
+        self.pool = UpdateWorkerPool(application.process_update, workers, queue_size, admission=admission)
+        self._runner = None
+        self._accepting = False
+
+    @classmethod
+    def from_env(cls, application, admission=None):
+        return cls(
+            application,
+            listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+            port=int(os.getenv("WEBHOOK_PORT", "8443")),
+            path=os.getenv("WEBHOOK_PATH", "/telegram"),
+            secret=os.getenv("WEBHOOK_SECRET") or None,
+            public_url=os.getenv("WEBHOOK_URL") or None,
+            workers=int(os.getenv("WEBHOOK_WORKERS", "8")),
+            queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "100")),
+            admission=admission,
+        )
+
+    async def handle(self, request):
+        from aiohttp import web
+        if not self._accepting:
+            return web.Response(status=503)
+        if self.secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret:
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        update = Update.de_json(data, self.application.bot)
+        if update is not None:
+            await self.pool.submit(update)
+        return web.Response(text="ok")
+
+    async def start(self):
+        from aiohttp import web
+        self.pool.start()
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._accepting = True
+        if self.public_url:
+            await self.application.bot.set_webhook(
+                url=self.public_url.rstrip("/") + self.path, secret_token=self.secret
+            )
+        log(f"🌐 Webhook слушает {self.listen}:{self.port}{self.path}", event="webhook.listen", port=self.port)
+
+    async def stop(self):
+        # перестаём принимать новые обновления и дорабатываем принятые
+        self._accepting = False
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.pool.drain()
+        await self.pool.stop()
+
+
+async def run_webhook(application, server=None):
+    # повторяет жизненный цикл Application.run_polling, но без Updater
+    server = server or WebhookServer.from_env(application)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await server.start()
+    try:
+        await stop.wait()
+    finally:
+        log("🛑 Останавливаемся, дорабатываем принятые обновления...", event="shutdown")
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)